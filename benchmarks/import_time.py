@@ -0,0 +1,53 @@
+'''
+Guards the import cost of the core engine. Each measurement runs in a fresh interpreter:
+
+    python benchmarks/import_time.py [--module iam_bt.bt] [--budget-ms 150] [--repeat 5]
+
+Exits non-zero if a heavy optional dependency gets imported or the median import time exceeds the budget.
+'''
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+from statistics import median
+
+
+HEAVY_MODULES = ('numpy', 'pydot', 'pillar_state', 'autolab_core', 'frankapy')
+
+_MEASURE = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module, repo_root):
+    code = _MEASURE.format(module=module, heavy=HEAVY_MODULES)
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=repo_root)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='iam_bt.bt')
+    parser.add_argument('--budget-ms', type=float, default=150.)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parent.parent
+    results = [measure(args.module, repo_root) for _ in range(args.repeat)]
+    median_ms = median(r['elapsed'] for r in results) * 1000
+    heavy = sorted(set(m for r in results for m in r['heavy']))
+
+    print(f'import {args.module}: median {median_ms:.1f} ms over {args.repeat} runs (budget {args.budget_ms:.0f} ms)')
+    failed = False
+    if heavy:
+        print(f'FAIL: heavy modules imported eagerly: {", ".join(heavy)}')
+        failed = True
+    if median_ms > args.budget_ms:
+        print('FAIL: import time over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,50 @@
+'''
+Compares evaluating a predicate state by state with evaluating it over a batch of states:
+
+    python benchmarks/predicates.py [--n-states 10000] [--repeat 5]
+
+The states are random box_in_cabinet states; the predicate is the root condition of that example.
+'''
+import time
+import argparse
+
+import numpy as np
+
+from iam_bt.predicates import field, stack_states
+
+
+def random_states(n_states, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        'frame:box:pose/position': rng.uniform(0., 0.3, 3).tolist(),
+        'frame:cabinet:open': [bool(rng.random() < 0.5)],
+    } for _ in range(n_states)]
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-states', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    predicate = ~(field('frame:box:pose/position', 2) < 0.1) | (field('frame:cabinet:open', 0) == True)
+    states = random_states(args.n_states)
+    batch = stack_states(states, predicate.keys())
+
+    single_time, single = best_time(lambda: [predicate.evaluate(state) for state in states], args.repeat)
+    batch_time, batched = best_time(lambda: predicate.evaluate_batch(batch), args.repeat)
+    assert batched.tolist() == single
+
+    print(f'{predicate}')
+    print(f'per state: {single_time * 1000:8.2f} ms ({single_time / args.n_states * 1e6:.2f} us/state)')
+    print(f'batch:     {batch_time * 1000:8.2f} ms ({batch_time / args.n_states * 1e6:.2f} us/state), '
+          f'{single_time / batch_time:.0f}x faster')
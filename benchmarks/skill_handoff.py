@@ -0,0 +1,76 @@
+'''
+Measures how long the robot sits idle between consecutive skills of a Sequence, with and without prefetching:
+
+    python benchmarks/skill_handoff.py [--n-skills 8] [--skill-duration 0.05] [--tick-rate 20] [--repeat 3] [--no-same-tick]
+
+The domain completes each skill after a fixed wall-clock duration and records when the next skill arrives.
+'''
+import time
+import argparse
+from statistics import mean
+
+from iam_bt.bt import Sequence, SkillNode
+from iam_bt.context import RunContext
+from iam_bt.metrics import MetricsRegistry, enable_metrics, disable_metrics
+from iam_bt.utils import run_tree
+
+
+class TimedSkillDomain:
+
+    def __init__(self, skill_duration):
+        self._skill_duration = skill_duration
+        self._skills = []
+
+    def run_skill(self, skill_name, param):
+        self._skills.append(time.monotonic())
+        return len(self._skills) - 1
+
+    def get_skill_status(self, skill_id):
+        if time.monotonic() - self._skills[skill_id] >= self._skill_duration:
+            return 'success'
+        return 'running'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+    def idle_gaps(self):
+        # Time from each skill finishing on the robot until the next one was sent
+        return [next_start - (start + self._skill_duration) for start, next_start in zip(self._skills, self._skills[1:])]
+
+
+def measure(prefetch, n_skills, skill_duration, tick_rate, same_tick=True):
+    registry = MetricsRegistry()
+    metrics = enable_metrics(registry)
+    try:
+        tree = Sequence([SkillNode('grasp', {'duration': skill_duration, 'index': i}) for i in range(n_skills)], prefetch=prefetch)
+        domain = TimedSkillDomain(skill_duration)
+        start = time.monotonic()
+        run_tree(tree, domain, context=RunContext(), tick_rate=tick_rate, same_tick=same_tick)
+        elapsed = time.monotonic() - start
+    finally:
+        disable_metrics()
+
+    handoff = metrics.skill_handoff_gap.samples()[0][1]
+    return {
+        'elapsed': elapsed,
+        'idle_gaps': domain.idle_gaps(),
+        'handoff_gap': handoff['sum'] / handoff['count'] if handoff['count'] else 0.,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-skills', type=int, default=8)
+    parser.add_argument('--skill-duration', type=float, default=0.05)
+    parser.add_argument('--tick-rate', type=float, default=20.)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-same-tick', action='store_true', help='end every tick after the first yield, as before same-tick propagation')
+    args = parser.parse_args()
+
+    for prefetch in (False, True):
+        results = [measure(prefetch, args.n_skills, args.skill_duration, args.tick_rate, same_tick=not args.no_same_tick)
+                   for _ in range(args.repeat)]
+        idle_gaps = [gap for r in results for gap in r['idle_gaps']]
+        print(f'prefetch={prefetch!s:5}: total {mean(r["elapsed"] for r in results) * 1000:7.1f} ms, '
+              f'robot idle between skills mean {mean(idle_gaps) * 1000:6.1f} ms / max {max(idle_gaps) * 1000:6.1f} ms, '
+              f'bt_skill_handoff_gap_seconds mean {mean(r["handoff_gap"] for r in results) * 1000:6.2f} ms')
@@ -1,21 +1,15 @@
 import logging
 from pathlib import Path
 
-from iam_bt.bt import FallBack, Sequence, NegationDecorator, ConditionNode, SkillParamSelector, SkillNode
+from iam_bt.bt import FallBack, Sequence, SkillParamSelector, SkillNode
+from iam_bt.predicates import PredicateConditionNode, field
 from iam_bt.mock_domain import MockBoxInCabinetDomainClient
 from iam_bt.utils import run_tree
+from iam_bt.render import render_frames
 
 
-class BoxOnTableConditionNode(ConditionNode):
-
-    def _eval(self, state):
-        return state['frame:box:pose/position'][2] < 0.1
-
-
-class CabinetOpenConditionNode(ConditionNode):
-
-    def _eval(self, state):
-        return state['frame:cabinet:open'][0]
+box_on_table = field('frame:box:pose/position', 2) < 0.1
+cabinet_open = field('frame:cabinet:open', 0) == True
 
 
 class OpenCabinetParamSelector(SkillParamSelector):
@@ -41,11 +35,11 @@ if __name__ == '__main__':
 
     logging.info('Creating tree')
     tree = FallBack([
-        NegationDecorator(BoxOnTableConditionNode()),
+        PredicateConditionNode(~box_on_table),
         Sequence([
             SkillNode('reset'),
             FallBack([
-                CabinetOpenConditionNode(),
+                PredicateConditionNode(cabinet_open),
                 SkillNode('open', OpenCabinetParamSelector())
             ]),
             SkillNode('grasp', GraspBoxParamSelector()),
@@ -59,5 +53,8 @@ if __name__ == '__main__':
     domain = MockBoxInCabinetDomainClient()
 
     save_dir = Path('box_in_cabinet')
-    logging.info(f'Running tree and saving viz to {save_dir}...')
+    logging.info(f'Running tree and logging status changes to {save_dir}...')
     run_tree(tree, domain, save_dir=save_dir)
+
+    logging.info(f'Rendering viz to {save_dir}...')
+    render_frames(save_dir)
@@ -0,0 +1,34 @@
+import logging
+
+from iam_bt.bt import FallBack, Sequence, NegationDecorator, ConditionNode, SkillNode
+from iam_bt.mock_domain import MockPenInJarParallelDomainClient
+from iam_bt.monitor import TreeMonitor
+from iam_bt.utils import run_tree
+
+
+class PenOnTableConditionNode(ConditionNode):
+
+    def _eval(self, state):
+        return state['frame:pen:pose/position'][2] < 0.1
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.INFO)
+
+    tree = FallBack([
+        NegationDecorator(PenOnTableConditionNode()),
+        Sequence([
+            SkillNode('reset', {}),
+            SkillNode('grasp', {}),
+            SkillNode('move_ee_to_pose', {}),
+            SkillNode('open_gripper', {}),
+            SkillNode('reset', {})
+        ])
+    ])
+
+    # Open the printed URL in a browser before pressing enter to watch the tree run
+    monitor = TreeMonitor(tree)
+    input('Press enter to start the tree...')
+    run_tree(tree, MockPenInJarParallelDomainClient(), tick_rate=5, monitor=monitor)
+    input('Done. Press enter to exit...')
+    monitor.close()
@@ -0,0 +1,41 @@
+import logging
+
+from iam_bt.bt import FallBack, Sequence, NegationDecorator, ConditionNode, SkillNode
+from iam_bt.executor import TreeExecutor
+from iam_bt.mock_domain import MockPenInJarParallelDomainClient
+
+
+class PenOnTableConditionNode(ConditionNode):
+
+    def _eval(self, state):
+        return state['frame:pen:pose/position'][2] < 0.1
+
+
+def make_pen_in_jar_tree():
+    return FallBack([
+        NegationDecorator(PenOnTableConditionNode()),
+        Sequence([
+            SkillNode('reset', {}),
+            SkillNode('grasp', {}),
+            SkillNode('move_ee_to_pose', {}),
+            SkillNode('open_gripper', {}),
+            SkillNode('reset', {})
+        ])
+    ])
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.INFO)
+
+    logging.info('Creating trees')
+    left_arm_tree = make_pen_in_jar_tree()
+    right_arm_tree = make_pen_in_jar_tree()
+    monitor_tree = Sequence([SkillNode('reset', {}), SkillNode('reset', {})])
+
+    executor = TreeExecutor()
+    executor.add_tree(left_arm_tree, MockPenInJarParallelDomainClient(), name='left_arm', priority=1, tick_rate=50)
+    executor.add_tree(right_arm_tree, MockPenInJarParallelDomainClient(), name='right_arm', priority=1, tick_rate=50)
+    executor.add_tree(monitor_tree, MockPenInJarParallelDomainClient(), name='monitor', tick_rate=10)
+
+    logging.info('Running all trees in one executor...')
+    executor.run()
@@ -5,6 +5,7 @@ from pathlib import Path
 from iam_bt.bt import FallBack, Sequence, NegationDecorator, ConditionNode, SkillParamSelector, SkillNode
 from iam_bt.mock_domain import MockPenInJarDomainClient
 from iam_bt.utils import run_tree
+from iam_bt.render import render_frames
 
 
 class PenOnTableConditionNode(ConditionNode):
@@ -50,5 +51,8 @@ if __name__ == '__main__':
     domain = MockPenInJarDomainClient()
 
     save_dir = Path('pen_in_jar')
-    logging.info(f'Running tree and saving viz to {save_dir}...')
+    logging.info(f'Running tree and logging status changes to {save_dir}...')
     run_tree(tree, domain, save_dir=save_dir)
+
+    logging.info(f'Rendering viz to {save_dir}...')
+    render_frames(save_dir)
@@ -6,6 +6,7 @@ from pathlib import Path
 
 from iam_bt.bt import QueryNode, While, FallBack, Sequence, NegationDecorator, ConditionNode, SkillParamSelector, SkillNode, GetSkillTrajNode, ResolveButtonNode
 from iam_bt.utils import run_tree, assign_unique_name
+from iam_bt.render import render_frames
 from iam_domain_handler.domain_client import DomainClient 
 
 
@@ -34,5 +35,8 @@ if __name__ == '__main__':
     domain = DomainClient()
 
     save_dir = Path('query_trajs')
-    logging.info(f'Running tree and saving viz to {save_dir}...')
-    run_tree(simple_tree, domain, save_dir=save_dir)
\ No newline at end of file
+    logging.info(f'Running tree and logging status changes to {save_dir}...')
+    run_tree(simple_tree, domain, save_dir=save_dir)
+
+    logging.info(f'Rendering viz to {save_dir}...')
+    render_frames(save_dir)
@@ -0,0 +1,44 @@
+import logging
+from pathlib import Path
+
+from iam_bt.bt import FallBack, Sequence, NegationDecorator, ConditionNode, SkillNode
+from iam_bt.mock_domain import MockPenInJarDomainClient
+from iam_bt.replay import RecordingDomain, ReplayDomain
+from iam_bt.utils import run_tree
+
+
+class PenOnTableConditionNode(ConditionNode):
+
+    def _eval(self, state):
+        return state['frame:pen:pose/position'][2] < 0.1
+
+
+def make_tree():
+    return FallBack([
+        NegationDecorator(PenOnTableConditionNode()),
+        Sequence([
+            SkillNode('reset', {}),
+            SkillNode('grasp', {}),
+            SkillNode('move_ee_to_pose', {}),
+            SkillNode('open_gripper', {}),
+            SkillNode('reset', {})
+        ])
+    ])
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.INFO)
+
+    recording_path = Path('pen_in_jar.rec')
+    if recording_path.exists():
+        recording_path.unlink()
+
+    logging.info(f'Recording a session against the mock domain to {recording_path}')
+    domain = RecordingDomain(MockPenInJarDomainClient(), recording_path)
+    run_tree(make_tree(), domain)
+    domain.close()
+
+    logging.info('Replaying the session without the domain')
+    replay_domain = ReplayDomain(recording_path, check_args=True)
+    run_tree(make_tree(), replay_domain)
+    logging.info(f'Replayed {replay_domain.n_replayed} records, {replay_domain.n_remaining} left over')
@@ -5,6 +5,7 @@ from iam_domain_handler.domain_client import DomainClient
 
 from iam_bt.bt import Sequence, SkillNode
 from iam_bt.utils import run_tree
+from iam_bt.render import render_frames
 
 
 if __name__ == '__main__':
@@ -21,5 +22,8 @@ if __name__ == '__main__':
     domain = DomainClient()
 
     save_dir = Path('simple_real_domain')
-    logging.info(f'Running tree and saving viz to {save_dir}...')
+    logging.info(f'Running tree and logging status changes to {save_dir}...')
     run_tree(tree, domain, save_dir=save_dir)
+
+    logging.info(f'Rendering viz to {save_dir}...')
+    render_frames(save_dir)
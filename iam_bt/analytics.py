@@ -0,0 +1,282 @@
+'''
+Where the time of a recorded run went, from the event log written by run_tree(save_dir=...):
+
+    python -m iam_bt.analytics SAVE_DIR [--segment N] [--json]
+
+Reports how long every skill and query took, how long the robot sat idle between one skill and the
+next, how long ResolveQueryNodes waited on a human, and which branch of every Parallel decided how
+long it ran (its critical path). Times come from the tick at which nodes were seen to start and
+finish, so they are accurate to about one tick.
+'''
+import json
+import bisect
+import argparse
+from collections import namedtuple, defaultdict
+
+from .bt_status import BTStatus
+from .event_log import read_event_log
+
+
+# One run of a leaf node. `status` is 'success', 'failure' or 'halted' (stopped by its parent, or still running at the end of the log).
+Span = namedtuple('Span', ['node', 'start_event', 'end_event', 'start', 'end', 'status'])
+
+_STATUS_NAMES = {BTStatus.SUCCESS.value: 'success', BTStatus.FAILURE.value: 'failure'}
+
+
+def _summary(durations):
+    durations = list(durations)
+    total = sum(durations)
+    return {
+        'count': len(durations),
+        'total': total,
+        'mean': total / len(durations) if durations else 0.,
+        'max': max(durations, default=0.),
+    }
+
+
+def _events(records):
+    '''
+    Yields (event, time, [(node id, leaf status)]) per event of the log.
+    '''
+    events = records['event'].tolist()
+    times = records['time'].tolist()
+    nodes = records['node'].tolist()
+    leaf_statuses = records['leaf_status'].tolist()
+
+    i, n = 0, len(events)
+    while i < n:
+        j = i
+        while j < n and events[j] == events[i]:
+            j += 1
+        yield events[i], times[i], [(nodes[k], leaf_statuses[k]) for k in range(i, j) if nodes[k] >= 0]
+        i = j
+
+
+def leaf_spans(records):
+    '''
+    Splits the event log into Spans, in the order the leaves finished.
+    '''
+    spans = []
+    # Node id -> (start event, start time, last event, last time) of leaves seen running
+    running = {}
+    last_finished = {}
+
+    last_event = last_time = None
+    for event, t, leaves in _events(records):
+        seen = set()
+        for node, leaf_status in leaves:
+            seen.add(node)
+            if leaf_status == BTStatus.RUNNING.value:
+                start_event, start = running[node][:2] if node in running else (event, t)
+                running[node] = (start_event, start, event, t)
+                continue
+
+            if node in running:
+                start_event, start = running.pop(node)[:2]
+            elif last_finished.get(node) == (event - 1, leaf_status):
+                # A Parallel keeps reporting the last status of children that have finished
+                last_finished[node] = (event, leaf_status)
+                continue
+            else:
+                # Finished in the tick it started
+                start_event, start = event, t
+            last_finished[node] = (event, leaf_status)
+            spans.append(Span(node, start_event, event, start, t, _STATUS_NAMES[leaf_status]))
+
+        # Every running leaf is reported in every event, so one that is missing has been halted
+        for node in [node for node in running if node not in seen]:
+            start_event, start, halt_event, halt_time = running.pop(node)
+            spans.append(Span(node, start_event, halt_event, start, halt_time, 'halted'))
+        last_event, last_time = event, t
+
+    for node, (start_event, start, _, _) in running.items():
+        spans.append(Span(node, start_event, last_event, start, last_time, 'halted'))
+    return spans
+
+
+def _query_names(structure):
+    '''
+    ResolveQueryNodes don't show which query they resolve; it is the one sent by the closest QueryNode before them.
+    '''
+    nodes = structure['nodes']
+    names = {}
+    for node in nodes.values():
+        query_name = None
+        for child_id in node['children']:
+            child = nodes[child_id]
+            if child['type'] == 'QueryNode':
+                query_name = child['label'][len('RunQuery-'):] if child['label'].startswith('RunQuery-') else child['label']
+            elif child['type'] == 'ResolveQueryNode':
+                names[child_id] = query_name if query_name is not None else f'{child["label"]} {child_id}'
+    return names
+
+
+def _descendant_leaves(structure):
+    nodes = structure['nodes']
+    leaves = {}
+
+    def collect(node_id):
+        if node_id not in leaves:
+            children = nodes[node_id]['children']
+            leaves[node_id] = frozenset([node_id]) if not children else frozenset().union(*(collect(c) for c in children))
+        return leaves[node_id]
+
+    for node_id in nodes:
+        collect(node_id)
+    return leaves
+
+
+def skill_idle_gaps(structure, spans):
+    '''
+    Time between one skill finishing and the next one starting, by transition.
+    '''
+    nodes = structure['nodes']
+    skills = sorted((span for span in spans if nodes[span.node]['type'] == 'SkillNode'), key=lambda span: span.start)
+    by_transition = defaultdict(list)
+    for previous, span in zip(skills, skills[1:]):
+        gap = max(0., span.start - previous.end)
+        by_transition[f'{nodes[previous.node]["label"]} -> {nodes[span.node]["label"]}'].append(gap)
+
+    all_gaps = [gap for gaps in by_transition.values() for gap in gaps]
+    return {
+        'total': _summary(all_gaps),
+        'by_transition': {transition: _summary(gaps) for transition, gaps in by_transition.items()},
+    }
+
+
+def parallel_critical_paths(structure, records, spans):
+    '''
+    For every Parallel, how long its runs took, how often each child was the last to finish
+    (and so set the duration), the children's slack, and the leaves on the critical child by total time.
+    '''
+    nodes = structure['nodes']
+    leaves = _descendant_leaves(structure)
+    events = [(event, set(node for node, _ in event_leaves)) for event, _, event_leaves in _events(records)]
+    spans = sorted(spans, key=lambda span: span.start_event)
+    span_start_events = [span.start_event for span in spans]
+
+    report = {}
+    for parallel_id, parallel in nodes.items():
+        if parallel['type'] != 'Parallel':
+            continue
+        parallel_leaves = leaves[parallel_id]
+
+        # A run of the Parallel is a stretch of consecutive events that only involve its leaves
+        activations = []
+        for event, event_nodes in events:
+            if event_nodes and event_nodes <= parallel_leaves:
+                if activations and activations[-1][1] == event - 1:
+                    activations[-1][1] = event
+                else:
+                    activations.append([event, event])
+
+        durations = []
+        child_durations = defaultdict(list)
+        child_slack = defaultdict(list)
+        n_critical = defaultdict(int)
+        critical_leaf_time = defaultdict(float)
+        for first_event, last_event in activations:
+            window = spans[bisect.bisect_left(span_start_events, first_event):bisect.bisect_right(span_start_events, last_event)]
+            child_windows = {}
+            for child_id in parallel['children']:
+                child_spans = [span for span in window if span.node in leaves[child_id]]
+                if child_spans:
+                    child_windows[child_id] = (min(s.start for s in child_spans), max(s.end for s in child_spans), child_spans)
+            if not child_windows:
+                continue
+
+            start = min(child_start for child_start, _, _ in child_windows.values())
+            end = max(child_end for _, child_end, _ in child_windows.values())
+            durations.append(end - start)
+            critical_child = max(child_windows, key=lambda child_id: (child_windows[child_id][1], -child_windows[child_id][0]))
+            n_critical[critical_child] += 1
+            for child_id, (child_start, child_end, child_spans) in child_windows.items():
+                child_durations[child_id].append(child_end - child_start)
+                child_slack[child_id].append(end - child_end)
+            for span in child_windows[critical_child][2]:
+                critical_leaf_time[nodes[span.node]['label']] += span.end - span.start
+
+        report[parallel_id] = {
+            'label': parallel['label'],
+            'duration': _summary(durations),
+            'children': [{
+                'node': child_id,
+                'label': nodes[child_id]['label'],
+                'critical': n_critical[child_id],
+                'duration': _summary(child_durations[child_id]),
+                'slack': _summary(child_slack[child_id]),
+            } for child_id in parallel['children']],
+            'critical_path': dict(sorted(critical_leaf_time.items(), key=lambda item: -item[1])),
+        }
+    return report
+
+
+def analyze(save_dir, segment=None):
+    '''
+    Returns a JSON-serializable report of the run recorded in `save_dir`, or of an earlier session kept as `segment`.
+    '''
+    structure, header, records = read_event_log(save_dir, segment)
+    nodes = structure['nodes']
+    spans = leaf_spans(records)
+    query_names = _query_names(structure)
+
+    skills = defaultdict(list)
+    queries = defaultdict(list)
+    human_wait = defaultdict(list)
+    for span in spans:
+        node = nodes[span.node]
+        duration = span.end - span.start
+        if node['type'] == 'SkillNode':
+            skills[node['label']].append(duration)
+        elif node['type'] == 'QueryNode':
+            queries[node['label']].append(duration)
+        elif node['type'] == 'ResolveQueryNode':
+            human_wait[query_names.get(span.node, node['label'])].append(duration)
+
+    times = records['time']
+    return {
+        'duration': float(times[-1] - times[0]) if len(times) else 0.,
+        'ticks': int(records['tick'][-1]) if len(records) else 0,
+        'skills': {label: _summary(durations) for label, durations in skills.items()},
+        'queries': {label: _summary(durations) for label, durations in queries.items()},
+        'human_wait': {name: _summary(durations) for name, durations in human_wait.items()},
+        'skill_idle_gaps': skill_idle_gaps(structure, spans),
+        'parallels': parallel_critical_paths(structure, records, spans),
+    }
+
+
+def _table(title, summaries):
+    lines = [title, f'  {"":40s} {"count":>6s} {"total s":>9s} {"mean s":>8s} {"max s":>8s}']
+    for name, summary in sorted(summaries.items(), key=lambda item: -item[1]['total']):
+        lines.append(f'  {name[:40]:40s} {summary["count"]:6d} {summary["total"]:9.2f} {summary["mean"]:8.3f} {summary["max"]:8.3f}')
+    return lines
+
+
+def format_report(report):
+    lines = [f'Run: {report["duration"]:.1f}s over {report["ticks"]} ticks', '']
+    lines += _table('Skills', report['skills']) + ['']
+    lines += _table('Queries', report['queries']) + ['']
+    lines += _table('Waiting on humans (ResolveQueryNode)', report['human_wait']) + ['']
+    idle = report['skill_idle_gaps']
+    lines += _table(f'Robot idle between skills ({idle["total"]["total"]:.2f}s in total)', idle['by_transition']) + ['']
+    for parallel_id, parallel in report['parallels'].items():
+        duration = parallel['duration']
+        lines.append(f'Parallel {parallel["label"]} (node {parallel_id}): {duration["count"]} runs, mean {duration["mean"]:.3f}s')
+        for child in parallel['children']:
+            lines.append(f'  child {child["label"]} (node {child["node"]}): critical in {child["critical"]} runs, '
+                         f'mean {child["duration"]["mean"]:.3f}s, mean slack {child["slack"]["mean"]:.3f}s')
+        if parallel['critical_path']:
+            lines.append('  on the critical path: ' + ', '.join(f'{label} {t:.2f}s' for label, t in parallel['critical_path'].items()))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('save_dir')
+    parser.add_argument('--segment', type=int, help='analyze an earlier session kept when the run was resumed')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = analyze(args.save_dir, args.segment)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
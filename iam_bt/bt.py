@@ -1,62 +1,153 @@
 import json
+import time
+import importlib
+import itertools
+from contextlib import contextmanager, closing
 from abc import ABC, abstractmethod
-from typing import Tuple, Generator
+from typing import Tuple, Generator, TYPE_CHECKING
 import logging
 
-from shortuuid import uuid
-from pydot import Dot, Edge, Node
-from pillar_state import State
-
 from .bt_status import BTStatus
-from .utils import merge_graphs
+from .context import ActiveBlackboard, get_run_context
 
 import math
-import numpy as np
-from autolab_core import RigidTransform
-from frankapy.utils import convert_rigid_transform_to_array
+
+if TYPE_CHECKING:
+    from pydot import Dot, Node
+    from pillar_state import State
 
 
 logger = logging.getLogger(__name__)
 
+# Nodes defined in other modules, e.g. robot-specific ones that pull in numpy, autolab_core and frankapy, are only imported on first use
+_LAZY_ATTRS = {
+    'GeneratePickAndPlacePositionsNode': '.robot_nodes',
+    'PredicateConditionNode': '.predicates',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        return getattr(importlib.import_module(_LAZY_ATTRS[name], __package__), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+_node_ids = itertools.count()
+
+
+@contextmanager
+def node_id_scope(start=0):
+    '''
+    Nodes created inside the block get consecutive ids from `start`, so a tree
+    built the same way twice gets the same ids. Afterwards, ids carry on past the highest
+    one handed out, so nodes created later never reuse the ids of the block's nodes.
+    Ids below `start` must not be in use by nodes that run with the ones created here.
+    '''
+    global _node_ids
+    previous_node_ids = _node_ids
+    _node_ids = itertools.count(start)
+    try:
+        yield
+    finally:
+        _node_ids = itertools.count(max(next(previous_node_ids), next(_node_ids)))
+
+
+def _cancel_in_flight(node, cancel, request_id, get_status=None):
+    '''
+    Called when `node` is halted while its skill or query may still be in flight.
+    Halting happens while unwinding, so a failed cancel is logged rather than raised.
+    '''
+    try:
+        if get_status is not None and get_status(request_id) != 'running':
+            return
+        logger.debug(f'{node} halted, cancelling {request_id}')
+        cancel(request_id)
+    except Exception as e:
+        logger.warning(f'{node} could not cancel {request_id}: {e}')
+
+
+def _call_write_behind(node, write_behind, fn, *args):
+    '''
+    Runs `fn(*args)` on the write-behind queue if `write_behind` is set, yielding RUNNING while the queue
+    is full and while the write is in flight, and returns its result. Use with `yield from`.
+    '''
+    if not write_behind:
+        return fn(*args)
+
+    from .write_behind import get_write_behind_queue
+    queue = get_write_behind_queue(write_behind)
+    while True:
+        future = queue.try_submit(fn, *args)
+        if future is not None:
+            break
+        logger.debug(f'{node} to yield running b/c the write-behind queue is full')
+        yield node, BTStatus.RUNNING, BTStatus.RUNNING
+
+    try:
+        while not future.done():
+            logger.debug(f'{node} to yield running while its write is flushed')
+            yield node, BTStatus.RUNNING, BTStatus.RUNNING
+    finally:
+        # Drops the write if it has not started yet; one that is running is left to finish
+        future.cancel()
+    return future.result()
+
 
 class BTNode(ABC):
-    # Corresponding information we want to store internally inside the BT
-    blackboard = {
-        # "buttons" : {},
-        # "sliders" : {},
-        # "bboxes" : [],
-        # "text_inputs" : [],
-        # "instruction_text" : [],
-        # "camera_topic" : [],
-        # "display_type" : [],
-        # "traj1" : [],
-        # "traj2" : [],
-        # "robot" : [],
-        # "robot_joint_topic" : [],
-    }
+    __slots__ = ('_id',)
+
+    # Corresponding information we want to store internally inside the BT, e.g. "query_response", "skill_id".
+    # Resolves to the blackboard of the active RunContext, so every run of a tree can have its own.
+    blackboard = ActiveBlackboard()
+
+    # Set to a BTMetrics instance by iam_bt.metrics.enable_metrics()
+    metrics = None
+
+    dot_shape = 'box'
 
     def __init__(self):
-        self._uuid_str = f'{self.__class__.__name__}_{uuid()}'
+        self._id = next(_node_ids)
+
+    @property
+    def id(self):
+        return self._id
 
     @property
     def uuid_str(self):
-        return self._uuid_str
+        # Stable, unique label for visualization; built on demand so nodes don't carry a string each
+        return f'{self.__class__.__name__}_{self._id}'
+
+    @property
+    def children(self):
+        return ()
+
+    @property
+    def dot_label(self):
+        return self.__class__.__name__
 
     @abstractmethod
     def run(self, domain) -> Generator[Tuple['BTNode', BTStatus, BTStatus], None, None]:
         pass
 
-    @abstractmethod
-    def get_dot_graph(self) -> Tuple[Node, Dot]:
-        pass
+    def get_dot_graph(self) -> Tuple['Node', 'Dot']:
+        from .viz import get_dot_graph
+        return get_dot_graph(self)
+
+    # Kept for nodes that still override get_dot_graph() and draw themselves with pydot
+    @property
+    def _uuid_str(self):
+        return self.uuid_str
 
     def _create_dot_graph(self):
-        return Dot('BT', graph_type='digraph', splines=False)
+        from .viz import create_dot_graph
+        return create_dot_graph()
 
     def __str__(self):
-        return self._uuid_str
+        return self.uuid_str
 
 class While(BTNode):
+    __slots__ = ('_condition_child', '_action_child')
+
     def __init__(self, children):
         super().__init__()
         assert len(children) == 2
@@ -65,242 +156,324 @@ class While(BTNode):
     
     def run(self, domain):
         logger.debug(f'run {self}')
-        while True:
-            condition_success = False
-            status_gen = self._condition_child.run(domain)
-            for leaf_node, leaf_status, status in status_gen:
-                if status == BTStatus.RUNNING:
-                    logger.debug(f'{self} to yield running b/c condition_child {leaf_node} yielded running')
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
-                elif status == BTStatus.SUCCESS:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded success')
-                    condition_success = True
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
-                    break
-                elif status == BTStatus.FAILURE:
-                    logger.debug(f'{self} to yield failure b/c {leaf_node} yielded failure')
+        context = get_run_context()
+        # Cursor: 0 if the condition is checked next, 1 if the action is run next. Like every cursor,
+        # it is cleared before the final status is yielded, so it only exists while the node has work left.
+        run_action = context.take_resume_cursor(self) == 1
+        try:
+            while True:
+                if not run_action:
+                    context.set_cursor(self, 0)
+                    condition_success = False
+                    with closing(self._condition_child.run(domain)) as status_gen:
+                        for leaf_node, leaf_status, status in status_gen:
+                            if status == BTStatus.RUNNING:
+                                logger.debug(f'{self} to yield running b/c condition_child {leaf_node} yielded running')
+                                yield leaf_node, leaf_status, BTStatus.RUNNING
+                            elif status == BTStatus.SUCCESS:
+                                logger.debug(f'{self} to yield running b/c {leaf_node} yielded success')
+                                condition_success = True
+                                context.set_cursor(self, 1)
+                                yield leaf_node, leaf_status, BTStatus.RUNNING
+                                break
+                            elif status == BTStatus.FAILURE:
+                                logger.debug(f'{self} to yield failure b/c {leaf_node} yielded failure')
+                                context.clear_cursor(self)
+                                yield leaf_node, leaf_status, BTStatus.FAILURE
+                                break
+                            else:
+                                raise ValueError(f'Unknown status {status}')
+
+                    if not condition_success:
+                        logger.debug(f'while failure b/c condition_child failure')
+                        yield leaf_node, leaf_status, BTStatus.FAILURE
+                        break
+                run_action = False
+
+                success = False
+                with closing(self._action_child.run(domain)) as status_gen:
+                    for leaf_node, leaf_status, status in status_gen:
+                        if status == BTStatus.RUNNING:
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                        elif status == BTStatus.SUCCESS:
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded success')
+                            success = True
+                            context.set_cursor(self, 0)
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                            break
+                        elif status == BTStatus.FAILURE:
+                            logger.debug(f'{self} to yield failure b/c {leaf_node} yielded failure')
+                            context.clear_cursor(self)
+                            yield leaf_node, leaf_status, BTStatus.FAILURE
+                            break
+                        else:
+                            raise ValueError(f'Unknown status {status}')
+
+                if not success:
+                    logger.debug(f'while failure b/c action_child failure')
                     yield leaf_node, leaf_status, BTStatus.FAILURE
                     break
-                else:
-                    raise ValueError(f'Unknown status {status}')
-
-            if not condition_success:
-                logger.debug(f'while failure b/c condition_child failure')
-                yield leaf_node, leaf_status, BTStatus.FAILURE
-                break
-
-            status_gen = self._action_child.run(domain)
-            success = False
-            for leaf_node, leaf_status, status in status_gen:
-                if status == BTStatus.RUNNING:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
-                elif status == BTStatus.SUCCESS:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded success')
-                    success = True
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
-                    break
-                elif status == BTStatus.FAILURE:
-                    logger.debug(f'{self} to yield failure b/c {leaf_node} yielded failure')
-                    yield leaf_node, leaf_status, BTStatus.FAILURE
-                    break
-                else:
-                    raise ValueError(f'Unknown status {status}')
-
-            if not success:
-                logger.debug(f'while failure b/c action_child failure')
-                yield leaf_node, leaf_status, BTStatus.FAILURE
-                break
+        finally:
+            context.clear_cursor(self)
     
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label='...', shape='diamond')
-        graph.add_node(this_node)
+    dot_label = '...'
+    dot_shape = 'diamond'
 
-        for child in [self._condition_child, self._action_child]:
-            child_root_node, child_graph = child.get_dot_graph()
-            merge_graphs(graph, child_graph)
-            graph.add_edge(Edge(this_node, child_root_node))
-
-        return this_node, graph
+    @property
+    def children(self):
+        return (self._condition_child, self._action_child)
 
 
 class FallBack(BTNode):
+    __slots__ = ('_children',)
 
     def __init__(self, children):
         super().__init__()
         assert len(children) > 0
-        self._children = children
+        self._children = tuple(children)
 
     def run(self, domain):
         logger.debug(f'run {self}')
+        context = get_run_context()
+        # Cursor: index of the child to run next
+        start = context.take_resume_cursor(self) or 0
         any_child_success = False
-        for child in self._children:
-            status_gen = child.run(domain)
-            success = False
-            for leaf_node, leaf_status, status in status_gen:
-                if status == BTStatus.RUNNING:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
-                elif status == BTStatus.SUCCESS:
-                    logger.debug(f'{self} to yield success b/c {leaf_node} yielded success')
-                    success = True
-                    yield leaf_node, leaf_status, BTStatus.SUCCESS
-                    break
-                elif status == BTStatus.FAILURE:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded failure')
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
+        try:
+            for idx in range(start, len(self._children)):
+                child = self._children[idx]
+                context.set_cursor(self, idx)
+                success = False
+                # Closing the child halts it if this node is halted while the child is still running
+                with closing(child.run(domain)) as status_gen:
+                    for leaf_node, leaf_status, status in status_gen:
+                        if status == BTStatus.RUNNING:
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                        elif status == BTStatus.SUCCESS:
+                            logger.debug(f'{self} to yield success b/c {leaf_node} yielded success')
+                            success = True
+                            context.clear_cursor(self)
+                            yield leaf_node, leaf_status, BTStatus.SUCCESS
+                            break
+                        elif status == BTStatus.FAILURE:
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded failure')
+                            if idx + 1 < len(self._children):
+                                context.set_cursor(self, idx + 1)
+                            else:
+                                context.clear_cursor(self)
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                            break
+                        else:
+                            raise ValueError(f'Unknown status {status}')
+
+                if success:
+                    any_child_success = True
                     break
-                else:
-                    raise ValueError(f'Unknown status {status}')
-
-            if success:
-                any_child_success = True
-                break
+        finally:
+            context.clear_cursor(self)
 
         if not any_child_success:
             logger.debug(f'{self} to yield failure b/c no children yielded success')
             yield leaf_node, leaf_status, BTStatus.FAILURE
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label='?', shape='square')
-        graph.add_node(this_node)
-
-        for child in self._children:
-            child_root_node, child_graph = child.get_dot_graph()
-            merge_graphs(graph, child_graph)
-            graph.add_edge(Edge(this_node, child_root_node))
+    dot_label = '?'
+    dot_shape = 'square'
 
-        return this_node, graph
+    @property
+    def children(self):
+        return self._children
 
 
 class Sequence(BTNode):
+    '''
+    With `prefetch`, a SkillNode followed by another SkillNode resolves and serializes the next skill while
+    the current one runs, and sends it to the domain in the same tick the current one succeeds.
+    '''
+    __slots__ = ('_children', '_prefetch')
 
-    def __init__(self, children):
+    def __init__(self, children, prefetch=False):
         super().__init__()
         assert len(children) > 0
-        self._children = children
+        self._children = tuple(children)
+        self._prefetch = prefetch
 
     def run(self, domain):
         logger.debug('run sequence')
-        
+        context = get_run_context()
+        # Cursor: index of the child to run next
+        start = context.take_resume_cursor(self) or 0
+
         any_child_failure = False
-        for child in self._children:
-            status_gen = child.run(domain)
-            failure = False
-            for leaf_node, leaf_status, status in status_gen:
-                if status == BTStatus.RUNNING:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
-                elif status == BTStatus.SUCCESS:
-                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded success')
-                    yield leaf_node, leaf_status, BTStatus.RUNNING
+        # SkillNode that was handed a skill ahead of its own run(); halted with this node if it never gets to run
+        handoff_child = None
+        try:
+            for idx in range(start, len(self._children)):
+                child = self._children[idx]
+                context.set_cursor(self, idx)
+                next_child = self._children[idx + 1] if idx + 1 < len(self._children) else None
+                skill_handoff = isinstance(child, SkillNode) and isinstance(next_child, SkillNode)
+                prepared = None
+                prepare_attempted = False
+
+                failure = False
+                with closing(child.run(domain)) as status_gen:
+                    for leaf_node, leaf_status, status in status_gen:
+                        if status == BTStatus.RUNNING:
+                            if skill_handoff and self._prefetch and not prepare_attempted:
+                                prepare_attempted = True
+                                prepared = next_child.try_prepare(self.blackboard)
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                        elif status == BTStatus.SUCCESS:
+                            if skill_handoff:
+                                handoff_child = next_child
+                                next_child.begin_handoff(domain, prepared if self._prefetch else None, dispatch=self._prefetch)
+                            if next_child is not None:
+                                context.set_cursor(self, idx + 1)
+                            else:
+                                context.clear_cursor(self)
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded success')
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                            break
+                        elif status == BTStatus.FAILURE:
+                            logger.debug(f'sequence failure')
+                            failure = True
+                            context.clear_cursor(self)
+                            logger.debug(f'{self} to yield failure b/c {leaf_node} yielded failure')
+                            yield leaf_node, leaf_status, BTStatus.FAILURE
+                            break
+                        else:
+                            raise ValueError(f'Unknown status {status}')
+
+                if failure:
+                    any_child_failure = True
                     break
-                elif status == BTStatus.FAILURE:
-                    logger.debug(f'sequence failure')
-                    failure = True
-                    logger.debug(f'{self} to yield failure b/c {leaf_node} yielded failure')
-                    yield leaf_node, leaf_status, BTStatus.FAILURE
-                    break
-                else:
-                    raise ValueError(f'Unknown status {status}')
-
-            if failure:
-                any_child_failure = True
-                break
+        finally:
+            context.clear_cursor(self)
+            if handoff_child is not None:
+                handoff_child.cancel_handoff(domain)
 
         if not any_child_failure:
             logger.debug(f'{self} to yield success b/c no child yielded failure')
             yield leaf_node, leaf_status, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label='->', shape='square')
-        graph.add_node(this_node)
-
-        for child in self._children:
-            child_root_node, child_graph = child.get_dot_graph()
-            merge_graphs(graph, child_graph)
-            graph.add_edge(Edge(this_node, child_root_node))
+    dot_label = '->'
+    dot_shape = 'square'
 
-        return this_node, graph
+    @property
+    def children(self):
+        return self._children
 
 
 class Parallel(BTNode):
-
-    def __init__(self, children, success_threshold):
+    '''
+    Ticks all children each tick. Succeeds once `success_threshold` children have succeeded and fails once
+    `failure_threshold` children have failed (by default, as soon as the success threshold is out of reach).
+    Children that have finished are never ticked again, and the ones still running are halted once the outcome is decided.
+    '''
+    __slots__ = ('_children', '_success_threshold', '_failure_threshold')
+
+    def __init__(self, children, success_threshold, failure_threshold=None):
         super().__init__()
         assert len(children) > 0
         assert success_threshold > 0 and success_threshold <= len(children)
-        self._children = children
+        if failure_threshold is None:
+            failure_threshold = len(children) - success_threshold + 1
+        assert failure_threshold > 0 and failure_threshold <= len(children)
+        # Otherwise all children could finish without either threshold being reached
+        assert success_threshold + failure_threshold <= len(children) + 1
+        self._children = tuple(children)
         self._success_threshold = success_threshold
+        self._failure_threshold = failure_threshold
 
     def run(self, domain):
         logger.debug('run parallel')
-        
-        status_gens = [child.run(domain) for child in self._children]
-        statuses = [None] * len(self._children)
+        context = get_run_context()
+        # Cursor: the status value of every child that has finished, None for the ones still running
+        outcomes = context.take_resume_cursor(self) or [None] * len(self._children)
+
+        # Entries are set to None once a child has finished
+        status_gens = [child.run(domain) if outcome is None else None for child, outcome in zip(self._children, outcomes)]
         leaf_nodes = [None] * len(self._children)
         leaf_statuses = [None] * len(self._children)
-        
-        n_successes = 0
-        n_failures = 0
-
-        succeeded = False
-        should_break = False
-        while True:
-            for idx, status_gen in enumerate(status_gens):
-                try:
-                    leaf_node, leaf_status, status = next(status_gen)
-                    statuses[idx] = status
+        active = [idx for idx, outcome in enumerate(outcomes) if outcome is None]
+
+        n_successes = outcomes.count(BTStatus.SUCCESS.value)
+        n_failures = outcomes.count(BTStatus.FAILURE.value)
+
+        result = None
+        try:
+            while True:
+                still_active = []
+                for idx in active:
+                    if result is not None:
+                        # Decided part way through the round; the rest are halted below without another tick
+                        break
+
+                    try:
+                        leaf_node, leaf_status, status = next(status_gens[idx])
+                    except StopIteration:
+                        status_gens[idx] = None
+                        continue
 
                     leaf_nodes[idx] = leaf_node
                     leaf_statuses[idx] = leaf_status
 
+                    if status == BTStatus.RUNNING:
+                        still_active.append(idx)
+                        continue
+
+                    status_gens[idx].close()
+                    status_gens[idx] = None
+                    outcomes[idx] = status.value
+                    context.set_cursor(self, list(outcomes))
                     if status == BTStatus.SUCCESS:
                         n_successes += 1
-
-                    if status == BTStatus.FAILURE:
+                        if n_successes >= self._success_threshold:
+                            result = BTStatus.SUCCESS
+                    elif status == BTStatus.FAILURE:
                         n_failures += 1
-                except StopIteration:
-                    pass
+                        if n_failures >= self._failure_threshold:
+                            result = BTStatus.FAILURE
+                    else:
+                        raise ValueError(f'Unknown status {status}')
 
-                if n_successes >= self._success_threshold:
-                    succeeded = True
-                    should_break = True
+                if result is not None:
                     break
-
-                if n_failures > len(self._children) - self._success_threshold:
-                    should_break = True
+                if not still_active:
+                    # Only reachable if children stop without reporting success or failure
+                    logger.debug(f'{self} has no running children left')
+                    result = BTStatus.FAILURE
                     break
+                active = still_active
 
-            if should_break:
-                break
-
-            yield leaf_nodes, leaf_statuses, BTStatus.RUNNING
+                yield leaf_nodes, leaf_statuses, BTStatus.RUNNING
+        finally:
+            context.clear_cursor(self)
+            for status_gen in status_gens:
+                if status_gen is not None:
+                    status_gen.close()
 
-        if succeeded:
+        if result == BTStatus.SUCCESS:
             logger.debug(f'{self} to yield success b/c {n_successes} successes')
-            yield leaf_nodes, leaf_statuses, BTStatus.SUCCESS
         else:
             logger.debug(f'{self} to yield failure b/c {n_failures} failures')
-            yield leaf_nodes, leaf_statuses, BTStatus.FAILURE
+        yield leaf_nodes, leaf_statuses, result
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label=f'=>{self._success_threshold}', shape='square')
-        graph.add_node(this_node)
+    dot_shape = 'square'
 
-        for child in self._children:
-            child_root_node, child_graph = child.get_dot_graph()
-            merge_graphs(graph, child_graph)
-            graph.add_edge(Edge(this_node, child_root_node))
+    @property
+    def dot_label(self):
+        return f'=>{self._success_threshold}'
 
-        return this_node, graph
+    @property
+    def children(self):
+        return self._children
 
 
 class NegationDecorator(BTNode):
+    __slots__ = ('_child',)
 
     def __init__(self, child):
         super().__init__()
@@ -308,38 +481,174 @@ class NegationDecorator(BTNode):
 
     def run(self, domain):
         logger.debug('run negation')
-        status_gen = self._child.run(domain)
-        for leaf_node, leaf_status, status in status_gen:
-            if status == BTStatus.RUNNING:
-                logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+        with closing(self._child.run(domain)) as status_gen:
+            for leaf_node, leaf_status, status in status_gen:
+                if status == BTStatus.RUNNING:
+                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+                    yield leaf_node, leaf_status, BTStatus.RUNNING
+                elif status == BTStatus.SUCCESS:
+                    logger.debug(f'{self} to yield failure b/c {leaf_node} yielded success')
+                    yield leaf_node, leaf_status, BTStatus.FAILURE
+                    break
+                elif status == BTStatus.FAILURE:
+                    logger.debug(f'{self} to yield success b/c {leaf_node} yielded failure')
+                    yield leaf_node, leaf_status, BTStatus.SUCCESS
+                    break
+                else:
+                    raise ValueError(f'Unknown status {status}')
+
+    dot_label = '!='
+    dot_shape = 'diamond'
+
+    @property
+    def children(self):
+        return (self._child,)
+
+
+class Timeout(BTNode):
+    '''
+    Fails and halts the child if it is still running `seconds` after this node started.
+    The deadline is checked every tick, so the tree never blocks waiting for it.
+    '''
+    __slots__ = ('_child', '_seconds')
+
+    def __init__(self, child, seconds):
+        super().__init__()
+        assert seconds > 0
+        self._child = child
+        self._seconds = seconds
+
+    def run(self, domain):
+        logger.debug(f'run timeout {self._seconds}s')
+        deadline = time.monotonic() + self._seconds
+        with closing(self._child.run(domain)) as status_gen:
+            for leaf_node, leaf_status, status in status_gen:
+                if status == BTStatus.RUNNING:
+                    logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+                    yield leaf_node, leaf_status, BTStatus.RUNNING
+                    if time.monotonic() >= deadline:
+                        status_gen.close()
+                        logger.debug(f'{self} to yield failure b/c {self._child} ran over {self._seconds}s')
+                        yield leaf_node, leaf_status, BTStatus.FAILURE
+                        break
+                elif status in (BTStatus.SUCCESS, BTStatus.FAILURE):
+                    logger.debug(f'{self} to yield {status} b/c {leaf_node} yielded {status}')
+                    yield leaf_node, leaf_status, status
+                    break
+                else:
+                    raise ValueError(f'Unknown status {status}')
+
+    dot_shape = 'diamond'
+
+    @property
+    def dot_label(self):
+        return f'Timeout {self._seconds}s'
+
+    @property
+    def children(self):
+        return (self._child,)
+
+
+class Retry(BTNode):
+    '''
+    Runs the child again after it fails, up to `max_attempts` runs in total.
+    '''
+    __slots__ = ('_child', '_max_attempts')
+
+    def __init__(self, child, max_attempts):
+        super().__init__()
+        assert max_attempts > 0
+        self._child = child
+        self._max_attempts = max_attempts
+
+    def _delay(self, n_failures):
+        return 0.
+
+    def run(self, domain):
+        logger.debug(f'run retry x{self._max_attempts}')
+        context = get_run_context()
+        # Cursor: the attempt to make next. A resumed Retry starts it without waiting out the backoff.
+        first_attempt = context.take_resume_cursor(self) or 1
+        try:
+            for attempt in range(first_attempt, self._max_attempts + 1):
+                context.set_cursor(self, attempt)
+                success = False
+                with closing(self._child.run(domain)) as status_gen:
+                    for leaf_node, leaf_status, status in status_gen:
+                        if status == BTStatus.RUNNING:
+                            logger.debug(f'{self} to yield running b/c {leaf_node} yielded running')
+                            yield leaf_node, leaf_status, BTStatus.RUNNING
+                        elif status == BTStatus.SUCCESS:
+                            logger.debug(f'{self} to yield success b/c {leaf_node} yielded success')
+                            success = True
+                            context.clear_cursor(self)
+                            yield leaf_node, leaf_status, BTStatus.SUCCESS
+                            break
+                        elif status == BTStatus.FAILURE:
+                            break
+                        else:
+                            raise ValueError(f'Unknown status {status}')
+
+                if success:
+                    return
+                if attempt == self._max_attempts:
+                    break
+
+                context.set_cursor(self, attempt + 1)
+                logger.debug(f'{self} to yield running b/c {leaf_node} yielded failure on attempt {attempt}')
                 yield leaf_node, leaf_status, BTStatus.RUNNING
-            elif status == BTStatus.SUCCESS:
-                logger.debug(f'{self} to yield failure b/c {leaf_node} yielded success')
-                yield leaf_node, leaf_status, BTStatus.FAILURE
-                break
-            elif status == BTStatus.FAILURE:
-                logger.debug(f'{self} to yield success b/c {leaf_node} yielded failure')
-                yield leaf_node, leaf_status, BTStatus.SUCCESS
-                break
-            else:
-                raise ValueError(f'Unknown status {status}')
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label='!=', shape='diamond')
-        graph.add_node(this_node)
+                # Wait out the backoff a tick at a time rather than sleeping, so other trees keep being ticked
+                retry_time = time.monotonic() + self._delay(attempt)
+                while time.monotonic() < retry_time:
+                    yield self, BTStatus.RUNNING, BTStatus.RUNNING
+        finally:
+            context.clear_cursor(self)
 
-        child_root_node, child_graph = self._child.get_dot_graph()
-        merge_graphs(graph, child_graph)
-        graph.add_edge(Edge(this_node, child_root_node))
+        logger.debug(f'{self} to yield failure b/c {self._child} failed {self._max_attempts} times')
+        yield leaf_node, leaf_status, BTStatus.FAILURE
 
-        return this_node, graph
+    dot_shape = 'diamond'
+
+    @property
+    def dot_label(self):
+        return f'Retry x{self._max_attempts}'
+
+    @property
+    def children(self):
+        return (self._child,)
+
+
+class RetryWithBackoff(Retry):
+    '''
+    Retry that waits `initial_delay` seconds after the first failure, multiplied by `factor`
+    after every further failure and capped at `max_delay`.
+    '''
+    __slots__ = ('_initial_delay', '_factor', '_max_delay')
+
+    def __init__(self, child, max_attempts, initial_delay, factor=2., max_delay=None):
+        super().__init__(child, max_attempts)
+        assert initial_delay >= 0 and factor >= 1
+        self._initial_delay = initial_delay
+        self._factor = factor
+        self._max_delay = max_delay
+
+    def _delay(self, n_failures):
+        delay = self._initial_delay * self._factor ** (n_failures - 1)
+        if self._max_delay is not None:
+            delay = min(delay, self._max_delay)
+        return delay
+
+    @property
+    def dot_label(self):
+        return f'Retry x{self._max_attempts} (backoff {self._initial_delay}s)'
 
 
 class ConditionNode(BTNode):
+    __slots__ = ()
 
     @abstractmethod
-    def _eval(self, state: State) -> bool:
+    def _eval(self, state: 'State') -> bool:
         pass
 
     def run(self, domain):
@@ -353,81 +662,185 @@ class ConditionNode(BTNode):
                 yield self, BTStatus.FAILURE, BTStatus.FAILURE
             break
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label=self.__class__.__name__, shape='ellipse')
-        graph.add_node(this_node)
+    dot_shape = 'ellipse'
+
+
+class ConstantConditionNode(ConditionNode):
+    '''
+    Always succeeds or always fails, without reading the domain state. optimize_tree() folds it into its parent.
+    '''
+    __slots__ = ('_value',)
+
+    def __init__(self, value):
+        super().__init__()
+        self._value = bool(value)
+
+    @property
+    def value(self):
+        return self._value
+
+    def _eval(self, state):
+        return self._value
 
-        return this_node, graph
+    def run(self, domain):
+        status = BTStatus.SUCCESS if self._value else BTStatus.FAILURE
+        logger.debug(f'{self} to yield {status}')
+        yield self, status, status
+
+    @property
+    def dot_label(self):
+        return str(self._value).lower()
 
 
 class SkillNode(BTNode):
+    __slots__ = ('_skill_name', '_skill_param')
 
     def __init__(self, skill_name, skill_param):
         super().__init__()
         self._skill_name = skill_name
         self._skill_param = skill_param
 
-    def run(self, domain):        
-        if self._skill_name == 'record_trajectory' and 'skill_duration' in self.blackboard.keys():
-            self._skill_param['duration'] = float(self.blackboard['skill_duration'])
-        elif self._skill_name == 'reset_arm':
-            self._skill_param['goal_joints'] = [0, -math.pi / 4, 0, -3 * math.pi / 4, 0, math.pi / 2, math.pi / 4]
-            self._skill_name = 'one_step_joint'
-        elif self._skill_name == 'go_to_start' and 'skill_name' in self.blackboard.keys():
-            self._skill_param['goal_joints'] = list(self.blackboard[self.blackboard['skill_name']]['trajectory']['skill_state_dict']['q'][0])
-            self._skill_name = 'one_step_joint'
-        elif self._skill_name == 'one_step_pose':
-            if not isinstance(self._skill_param['goal_pose'], list):
-                self._skill_param['goal_pose'] = self.blackboard['goal_poses'][self._skill_param['goal_pose']]
-        elif self._skill_name == 'replay_trajectory' and 'skill_name' in self.blackboard.keys():
-            self._skill_param['traj'] = self.blackboard[self.blackboard['skill_name']]['trajectory']['skill_state_dict']['q'].tolist()
-            self._skill_name = 'stream_joint_traj'
-        elif self._skill_name == 'execute_dmp_trajectory' and 'skill_name' in self.blackboard.keys():
-            if self.blackboard[self.blackboard['skill_name']]['dmp_params']['dmp_type'] == 0:
-                self._skill_param = {
+    def resolve(self, blackboard):
+        '''
+        Returns the (skill name, skill param) to send to the domain for the current blackboard
+        without modifying the node, so the same node can be run again or from several trees.
+        '''
+        skill_name = self._skill_name
+        skill_param = dict(self._skill_param)
+
+        if skill_name == 'record_trajectory' and 'skill_duration' in blackboard.keys():
+            skill_param['duration'] = float(blackboard['skill_duration'])
+        elif skill_name == 'reset_arm':
+            skill_param['goal_joints'] = [0, -math.pi / 4, 0, -3 * math.pi / 4, 0, math.pi / 2, math.pi / 4]
+            skill_name = 'one_step_joint'
+        elif skill_name == 'go_to_start' and 'skill_name' in blackboard.keys():
+            skill_param['goal_joints'] = list(blackboard[blackboard['skill_name']]['trajectory']['skill_state_dict']['q'][0])
+            skill_name = 'one_step_joint'
+        elif skill_name == 'one_step_pose':
+            # `goal_index` (a number, or a blackboard key holding one) picks a goal from the batch of generated poses
+            goal_index = skill_param.pop('goal_index', None)
+            if not isinstance(skill_param['goal_pose'], list):
+                if goal_index is None:
+                    skill_param['goal_pose'] = blackboard['goal_poses'][skill_param['goal_pose']]
+                else:
+                    from .robot_nodes import GOAL_POSE_KINDS
+                    if isinstance(goal_index, str):
+                        goal_index = blackboard[goal_index]
+                    skill_param['goal_pose'] = blackboard['goal_pose_array'][goal_index, GOAL_POSE_KINDS.index(skill_param['goal_pose'])].tolist()
+        elif skill_name == 'replay_trajectory' and 'skill_name' in blackboard.keys():
+            skill_param['traj'] = blackboard[blackboard['skill_name']]['trajectory']['skill_state_dict']['q'].tolist()
+            skill_name = 'stream_joint_traj'
+        elif skill_name == 'execute_dmp_trajectory' and 'skill_name' in blackboard.keys():
+            if blackboard[blackboard['skill_name']]['dmp_params']['dmp_type'] == 0:
+                skill_param = {
                     'duration' : 5,
                     'dt' : 0.01,
-                    'position_dmp_params' : self.blackboard[self.blackboard['skill_name']]['dmp_params'],
-                    'quat_dmp_params' : self.blackboard[self.blackboard['skill_name']]['dmp_params']['quat_dmp_params']
+                    'position_dmp_params' : blackboard[blackboard['skill_name']]['dmp_params'],
+                    'quat_dmp_params' : blackboard[blackboard['skill_name']]['dmp_params']['quat_dmp_params']
                 }
-                self._skill_name = 'one_step_quat_pose_dmp'
+                skill_name = 'one_step_quat_pose_dmp'
             else:
-                self._skill_param = {
+                skill_param = {
                     'duration' : 5,
                     'dt' : 0.01,
-                    'dmp_params' : self.blackboard[self.blackboard['skill_name']]['dmp_params']
+                    'dmp_params' : blackboard[blackboard['skill_name']]['dmp_params']
                 }
-                self._skill_name = 'one_step_joint_dmp'
-
-        self.blackboard['skill_id'] = domain.run_skill(self._skill_name, json.dumps(self._skill_param))
-        
-        logger.debug(f'{self} running skill with {self._skill_name} on {self.blackboard["skill_id"]}')
-        while True:
-            skill_status = domain.get_skill_status(self.blackboard['skill_id'])
-            if skill_status in ('running', 'registered'):
-                logger.debug(f'{self} to yield running')
-                yield self, BTStatus.RUNNING, BTStatus.RUNNING
-            elif skill_status == 'success':
-                logger.debug(f'{self} to yield success')
-                yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
-                break
-            elif skill_status == 'failure':
-                logger.debug(f'{self} to yield failure')
-                yield self, BTStatus.FAILURE, BTStatus.FAILURE
-                break
-            else:
-                raise ValueError(f'Unknown status {skill_status}')
+                skill_name = 'one_step_joint_dmp'
+
+        return skill_name, skill_param
+
+    def prepare(self, blackboard):
+        '''
+        Returns the (skill name, serialized skill param) to pass to run_skill.
+        '''
+        skill_name, skill_param = self.resolve(blackboard)
+        return skill_name, json.dumps(skill_param)
+
+    def try_prepare(self, blackboard):
+        # Used for prefetching, where the blackboard may not hold everything the skill needs yet
+        try:
+            return self.prepare(blackboard)
+        except Exception as e:
+            logger.debug(f'{self} cannot be prepared ahead of time: {e}')
+            return None
+
+    def _start(self, domain, prepared=None):
+        '''
+        Sends the skill and returns (skill name, skill id, metrics). `metrics` is the BTMetrics that counted
+        the skill as in flight, or None, and is the one to take it off again even if metrics were switched since.
+        '''
+        skill_name, skill_param_json = prepared if prepared is not None else self.prepare(self.blackboard)
+        skill_id = self.blackboard['skill_id'] = domain.run_skill(skill_name, skill_param_json)
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.skills_started.labels(skill_name).inc()
+            metrics.skills_in_flight.inc()
+            handoff_start = get_run_context().node_state(self).pop('handoff_start', None)
+            if handoff_start is not None:
+                metrics.skill_handoff_gap.observe(time.monotonic() - handoff_start)
+        return skill_name, skill_id, metrics
+
+    def begin_handoff(self, domain, prepared=None, dispatch=False):
+        '''
+        Called by a Sequence when the SkillNode before this one succeeds. With `dispatch`, the skill
+        is sent to the domain right away and run() picks it up on the next tick.
+        '''
+        state = get_run_context().node_state(self)
+        if self.metrics is not None:
+            state['handoff_start'] = time.monotonic()
+        if dispatch:
+            state['dispatched'] = self._start(domain, prepared)
+
+    def cancel_handoff(self, domain):
+        # Cancels a skill sent by begin_handoff() if run() never picked it up
+        state = get_run_context().node_state(self)
+        state.pop('handoff_start', None)
+        dispatched = state.pop('dispatched', None)
+        if dispatched is not None:
+            _, skill_id, metrics = dispatched
+            _cancel_in_flight(self, domain.cancel_skill, skill_id)
+            if metrics is not None:
+                metrics.skills_in_flight.dec()
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        this_node = Node(self._uuid_str, label=self._skill_name, shape='box')
-        graph.add_node(this_node)
+    def run(self, domain):
+        dispatched = get_run_context().node_state(self).pop('dispatched', None)
+        skill_name, skill_id, metrics = dispatched if dispatched is not None else self._start(domain)
+
+        logger.debug(f'{self} running skill with {skill_name} on {skill_id}')
+        finished = False
+        try:
+            while True:
+                skill_status = domain.get_skill_status(skill_id)
+                if skill_status in ('running', 'registered'):
+                    logger.debug(f'{self} to yield running')
+                    yield self, BTStatus.RUNNING, BTStatus.RUNNING
+                elif skill_status == 'success':
+                    logger.debug(f'{self} to yield success')
+                    finished = True
+                    yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
+                    break
+                elif skill_status in ('failure', 'cancelled'):
+                    # Cancelled e.g. by a CancelSkillNode in another branch
+                    logger.debug(f'{self} to yield failure b/c the skill is {skill_status}')
+                    finished = True
+                    yield self, BTStatus.FAILURE, BTStatus.FAILURE
+                    break
+                else:
+                    raise ValueError(f'Unknown status {skill_status}')
+        finally:
+            if not finished:
+                # Halted before the skill finished, so free the robot right away
+                _cancel_in_flight(self, domain.cancel_skill, skill_id)
+            if metrics is not None:
+                metrics.skills_in_flight.dec()
 
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return self._skill_name
 
 class ResolveQueryNode(BTNode):
+    __slots__ = ('_query_name', '_query_param')
 
     def __init__(self, query_name, query_param):
         super().__init__()
@@ -436,6 +849,21 @@ class ResolveQueryNode(BTNode):
 
     def run(self, domain):
         logger.debug(f'{self} running resolving query {self._query_name} with query name: {self._query_name}')  
+        metrics = self.metrics
+        wait_start = time.monotonic() if metrics is not None else None
+
+        # The query shown by the preceding QueryNode is taken down if this node is halted before it resolves
+        query_id = self.blackboard.get('query_id')
+        finished = False
+        try:
+            for leaf_node, leaf_status, status in self._resolve(domain, metrics, wait_start):
+                finished = status != BTStatus.RUNNING
+                yield leaf_node, leaf_status, status
+        finally:
+            if not finished and query_id is not None:
+                _cancel_in_flight(self, domain.cancel_query, query_id, get_status=domain.get_query_status)
+
+    def _resolve(self, domain, metrics, wait_start):
         while True:
             query_status = 'success'
 
@@ -471,33 +899,9 @@ class ResolveQueryNode(BTNode):
                         continue
                 query_response['text_inputs'] = text_inputs
             if has_dmp_params:
+                from .robot_nodes import dmp_params_from_memory
                 dmp_info = domain.get_memory_objects(['dmp_params'])['dmp_params']
-                dmp_params = {}
-                quat_dmp_params = {}
-                dmp_params['dmp_type'] = dmp_info.dmp_type
-                dmp_params['tau'] = dmp_info.tau
-                dmp_params['alpha'] = dmp_info.alpha
-                dmp_params['beta'] = dmp_info.beta
-                dmp_params['num_dims'] = dmp_info.num_dims
-                dmp_params['num_basis'] = dmp_info.num_basis
-                dmp_params['num_sensors'] = dmp_info.num_sensors
-                dmp_params['mu'] = dmp_info.mu
-                dmp_params['h'] = dmp_info.h
-                dmp_params['phi_j'] = dmp_info.phi_j
-                dmp_params['weights'] = np.array(dmp_info.weights).reshape((dmp_info.num_dims,dmp_info.num_sensors,dmp_info.num_basis)).tolist()
-                if dmp_info.dmp_type == 0:
-                    quat_dmp_params['tau'] = dmp_info.quat_tau
-                    quat_dmp_params['alpha'] = dmp_info.quat_alpha
-                    quat_dmp_params['beta'] = dmp_info.quat_beta
-                    quat_dmp_params['num_dims'] = dmp_info.quat_num_dims
-                    quat_dmp_params['num_basis'] = dmp_info.quat_num_basis
-                    quat_dmp_params['num_sensors'] = dmp_info.quat_num_sensors
-                    quat_dmp_params['mu'] = dmp_info.quat_mu
-                    quat_dmp_params['h'] = dmp_info.quat_h
-                    quat_dmp_params['phi_j'] = dmp_info.quat_phi_j
-                    quat_dmp_params['weights'] = np.array(dmp_info.quat_weights).reshape((dmp_info.quat_num_dims,dmp_info.quat_num_sensors,dmp_info.quat_num_basis)).tolist()
-                    dmp_params['quat_dmp_params'] = quat_dmp_params
-                query_response['dmp_params'] = dmp_params
+                query_response['dmp_params'] = dmp_params_from_memory(dmp_info)
             if label_image:
                 query_response = domain.get_memory_objects(['request_next_image', 'object_names', 'masks', 'bounding_boxes'])
                 query_response['button_inputs'] = {'request_next_image': query_response['request_next_image']}
@@ -509,6 +913,8 @@ class ResolveQueryNode(BTNode):
             else:
                 self.blackboard['query_response'] = query_response
                 domain.clear_human_inputs()
+                if metrics is not None:
+                    metrics.query_wait.labels(self._query_name).observe(time.monotonic() - wait_start)
 
             if query_status == 'running':
                 logger.debug(f'{self} to yield running')
@@ -524,68 +930,85 @@ class ResolveQueryNode(BTNode):
             else:
                 raise ValueError(f'Unknown status {query_status}')
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-        this_node = Node(self._uuid_str, label='Resolve Query', shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Resolve Query'
 
 
 class QueryNode(BTNode):
+    '''
+    With `image_pipeline` (an ImagePipeline or the name it was registered under), images are sent
+    encoded as `bokeh_image_encoded` instead of as nested lists, and the node keeps yielding RUNNING while they are encoded.
+    '''
+    __slots__ = ('_query_name', '_query_param', '_image_pipeline')
 
-    def __init__(self, query_name, query_param):
+    def __init__(self, query_name, query_param, image_pipeline=None):
         super().__init__()
         self._query_name = query_name
         self._query_param = query_param
+        self._image_pipeline = image_pipeline
 
     def run(self, domain):
-        if 'display_type' in self._query_param.keys() and self._query_param['display_type'] == 2:
-            self._query_param['traj1'] = list(self.blackboard['recorded_trajectory']['skill_state_dict']['q'].flatten())
-        elif 'display_type' in self._query_param.keys() and self._query_param['display_type'] == 3:
-            if self._query_param['bokeh_display_type'] == 0:
-                bokeh_traj = {}
-                bokeh_traj['time_since_skill_started'] = list(self.blackboard['recorded_trajectory']['skill_state_dict']['time_since_skill_started'])
-                bokeh_traj['num_joints'] = 7
-                bokeh_traj['cart_traj'] = list(np.array(self.blackboard['recorded_trajectory']['skill_state_dict']['O_T_EE']).flatten())
-                bokeh_traj['joint_traj'] = list(self.blackboard['recorded_trajectory']['skill_state_dict']['q'].flatten())
-                self._query_param['bokeh_traj'] = bokeh_traj
-            elif self._query_param['bokeh_display_type'] == 1 or self._query_param['bokeh_display_type'] == 2:
-                self._query_param['bokeh_image'] = self.blackboard['image'].tolist()
+        query_param = dict(self._query_param)
+        if 'display_type' in query_param.keys() and query_param['display_type'] == 2:
+            query_param['traj1'] = list(self.blackboard['recorded_trajectory']['skill_state_dict']['q'].flatten())
+        elif 'display_type' in query_param.keys() and query_param['display_type'] == 3:
+            if query_param['bokeh_display_type'] == 0:
+                from .robot_nodes import bokeh_trajectory_from_recording
+                query_param['bokeh_traj'] = bokeh_trajectory_from_recording(self.blackboard['recorded_trajectory'])
+            elif query_param['bokeh_display_type'] == 1 or query_param['bokeh_display_type'] == 2:
+                if self._image_pipeline is None:
+                    query_param['bokeh_image'] = self.blackboard['image'].tolist()
+                else:
+                    from .image_pipeline import get_image_pipeline
+                    image_pipeline = get_image_pipeline(self._image_pipeline)
+                    encoded_image = image_pipeline.submit(self.blackboard['image'])
+                    while not encoded_image.done():
+                        logger.debug(f'{self} to yield running while the image is encoded')
+                        yield self, BTStatus.RUNNING, BTStatus.RUNNING
+                    query_param['bokeh_image_encoded'] = encoded_image.result().to_payload(image_pipeline.crop)
         
-        self.blackboard['query_id'] = domain.run_query(self._query_name, json.dumps(self._query_param))
-        logger.debug(f'{self} running query {self._query_name} with id: {self.blackboard["query_id"]}') 
-        while True:
-            query_status = domain.get_query_status(self.blackboard['query_id'])
-            if query_status in ('running', 'registered'):
-                logger.debug(f'{self} to yield running')
-                yield self, BTStatus.RUNNING, BTStatus.RUNNING
-            elif query_status == 'success':
-                logger.debug(f'{self} to yield success')
-                yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
-                break
-            elif query_status == 'failure':
-                logger.debug(f'{self} to yield failure')
-                yield self, BTStatus.FAILURE, BTStatus.FAILURE
-                break
-            elif query_status == 'cancelled':
-                logger.debug(f'{self} to yield cancelled')
-                yield self, BTStatus.RUNNING, BTStatus.RUNNING
-                break
-            else:
-                raise ValueError(f'Unknown status {query_status}')
-
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'RunQuery-'+self._query_name
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
+        query_id = self.blackboard['query_id'] = domain.run_query(self._query_name, json.dumps(query_param))
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.queries_in_flight.inc()
+
+        logger.debug(f'{self} running query {self._query_name} with id: {query_id}') 
+        finished = False
+        try:
+            while True:
+                query_status = domain.get_query_status(query_id)
+                if query_status in ('running', 'registered'):
+                    logger.debug(f'{self} to yield running')
+                    yield self, BTStatus.RUNNING, BTStatus.RUNNING
+                elif query_status == 'success':
+                    logger.debug(f'{self} to yield success')
+                    finished = True
+                    yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
+                    break
+                elif query_status == 'failure':
+                    logger.debug(f'{self} to yield failure')
+                    finished = True
+                    yield self, BTStatus.FAILURE, BTStatus.FAILURE
+                    break
+                elif query_status == 'cancelled':
+                    logger.debug(f'{self} to yield cancelled')
+                    finished = True
+                    yield self, BTStatus.RUNNING, BTStatus.RUNNING
+                    break
+                else:
+                    raise ValueError(f'Unknown status {query_status}')
+        finally:
+            if not finished:
+                _cancel_in_flight(self, domain.cancel_query, query_id)
+            if metrics is not None:
+                metrics.queries_in_flight.dec()
 
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return 'RunQuery-'+self._query_name
 
 class GenerateDepthImagePathNode(BTNode):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -596,17 +1019,10 @@ class GenerateDepthImagePathNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Generate Depth Image Path'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Generate Depth Image Path'
 
 class GenerateGoalPointsNode(BTNode):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -621,71 +1037,31 @@ class GenerateGoalPointsNode(BTNode):
             logger.debug(f'{self} to yield failure')
             yield self, BTStatus.FAILURE, BTStatus.FAILURE
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Generate Goal Points'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
-
-class GeneratePickAndPlacePositionsNode(BTNode):
-
-    def __init__(self):
-        super().__init__()
-
-    def run(self, domain):
-
-        goal_pose_1 = self.blackboard['goal_points'][0]
-        goal_pose_1.y -= 0.04
-        intermediate_height_offset = 0.11
-        tong_height = 0.22
-        intermediate_pose = RigidTransform(rotation=np.array([
-            [1, 0, 0],
-            [0, -1, 0],
-            [0, 0, -1],
-        ]), translation=np.array([goal_pose_1.x, goal_pose_1.y, tong_height+intermediate_height_offset]))
-
-        grasp_pose = RigidTransform(rotation=np.array([
-            [1, 0, 0],
-            [0, -1, 0],
-            [0, 0, -1],
-        ]), translation=np.array([goal_pose_1.x, goal_pose_1.y, tong_height]))
-
-        self.blackboard['goal_poses'] = { 'intermediate' : list(convert_rigid_transform_to_array(intermediate_pose)),
-                                          'grasp' : list(convert_rigid_transform_to_array(grasp_pose))
-                                        }
-
-        logger.debug(f'{self} to yield success')
-        yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
-
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Generate Pick and Place Positions'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Generate Goal Points'
 
 class SaveImageNode(BTNode):
+    '''
+    With `write_behind` (True for the shared queue, or a WriteBehindQueue), the save runs off the tick thread
+    and the node yields RUNNING until it is done. The domain client must then be safe to call from another thread.
+    '''
+    __slots__ = ('_camera_topic_name', '_camera_type', '_save_image_path_flag', '_use_saved_image_path_flag', '_write_behind')
 
-    def __init__(self, camera_topic_name, camera_type, save_image_path_flag, use_saved_image_path_flag):
+    def __init__(self, camera_topic_name, camera_type, save_image_path_flag, use_saved_image_path_flag, write_behind=False):
         super().__init__()
         self._camera_topic_name = camera_topic_name
         self._camera_type = camera_type
         self._save_image_path_flag = save_image_path_flag
         self._use_saved_image_path_flag = use_saved_image_path_flag
+        self._write_behind = write_behind
 
     def run(self, domain):
         if self._camera_type == 'rgb':
-            (image_request_success, image_path) = domain.save_rgb_camera_image(self._camera_topic_name)
+            (image_request_success, image_path) = yield from _call_write_behind(
+                self, self._write_behind, domain.save_rgb_camera_image, self._camera_topic_name)
         elif self._camera_type == 'depth':
             if self._use_saved_image_path_flag:
-                (image_request_success, image_path) = domain.save_depth_camera_image(self._camera_topic_name, self.blackboard['depth_image_path'])
+                (image_request_success, image_path) = yield from _call_write_behind(
+                    self, self._write_behind, domain.save_depth_camera_image, self._camera_topic_name, self.blackboard['depth_image_path'])
 
         while True:
             if image_request_success:
@@ -698,24 +1074,26 @@ class SaveImageNode(BTNode):
                 yield self, BTStatus.FAILURE, BTStatus.FAILURE
             break
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'save_rgb_camera_image-'+self._camera_topic_name
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return 'save_rgb_camera_image-'+self._camera_topic_name
 
 class SaveMasksNode(BTNode):
+    '''
+    `write_behind` works as for SaveImageNode.
+    '''
+    __slots__ = ('_write_behind',)
 
-    def __init__(self):
+    def __init__(self, write_behind=False):
         super().__init__()
+        self._write_behind = write_behind
 
     def run(self, domain):
 
-        (request_success, image_path) = domain.save_image_labels(self.blackboard['image_path'], self.blackboard['query_response']['object_names'], self.blackboard['query_response']['masks'], self.blackboard['query_response']['bounding_boxes'])
+        query_response = self.blackboard['query_response']
+        (request_success, image_path) = yield from _call_write_behind(
+            self, self._write_behind, domain.save_image_labels,
+            self.blackboard['image_path'], query_response['object_names'], query_response['masks'], query_response['bounding_boxes'])
         while True:
             if request_success:
                 self.blackboard['image_path'] = image_path
@@ -726,17 +1104,10 @@ class SaveMasksNode(BTNode):
                 yield self, BTStatus.FAILURE, BTStatus.FAILURE
             break
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Save Image Masks'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Save Image Masks'
 
 class SaveTextInputToBlackBoardNode(BTNode):
+    __slots__ = ('_text_input_name', '_blackboard_key')
 
     def __init__(self, text_input_name, blackboard_key):
         super().__init__()
@@ -749,17 +1120,12 @@ class SaveTextInputToBlackBoardNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Save ' + self._text_input_name + ' To Blackboard'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return 'Save ' + self._text_input_name + ' To Blackboard'
 
 class SaveQueryItemToBlackBoardNode(BTNode):
+    __slots__ = ('_query_item_name', '_blackboard_key')
 
     def __init__(self, query_item_name, blackboard_key):
         super().__init__()
@@ -772,17 +1138,12 @@ class SaveQueryItemToBlackBoardNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Save ' + self._query_item_name + ' To Blackboard'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return 'Save ' + self._query_item_name + ' To Blackboard'
 
 class SaveTrajectoryInfoToMemoryNode(BTNode):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -794,17 +1155,10 @@ class SaveTrajectoryInfoToMemoryNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Save Trajectory Info To Memory'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Save Trajectory Info To Memory'
 
 class SaveMemoryToBlackBoardNode(BTNode):
+    __slots__ = ('_memory_name', '_blackboard_key')
 
     def __init__(self, memory_name, blackboard_key):
         super().__init__()
@@ -813,26 +1167,23 @@ class SaveMemoryToBlackBoardNode(BTNode):
 
     def run(self, domain):
 
-        if self._memory_name[0] == '<' and self._memory_name[-1] == '>':
-            self._memory_name = self.blackboard[self._memory_name[1:-1]]
-        if self._blackboard_key[0] == '<' and self._blackboard_key[-1] == '>':
-            self._blackboard_key = self.blackboard[self._blackboard_key[1:-1]]
+        memory_name = self._memory_name
+        blackboard_key = self._blackboard_key
+        if memory_name[0] == '<' and memory_name[-1] == '>':
+            memory_name = self.blackboard[memory_name[1:-1]]
+        if blackboard_key[0] == '<' and blackboard_key[-1] == '>':
+            blackboard_key = self.blackboard[blackboard_key[1:-1]]
 
-        self.blackboard[self._blackboard_key] = domain.get_memory_objects([self._memory_name])[self._memory_name]
+        self.blackboard[blackboard_key] = domain.get_memory_objects([memory_name])[memory_name]
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Save ' + self._memory_name + ' To Blackboard'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return 'Save ' + self._memory_name + ' To Blackboard'
 
 class ClearMemoryNode(BTNode):
+    __slots__ = ('_memory_name',)
 
     def __init__(self, memory_name):
         super().__init__()
@@ -844,38 +1195,26 @@ class ClearMemoryNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Clear ' + self._memory_name + ' From Memory'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    @property
+    def dot_label(self):
+        return 'Clear ' + self._memory_name + ' From Memory'
 
 class ClearBlackBoardNode(BTNode):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
 
     def run(self, domain):
 
-        self.blackboard = {}
+        self.blackboard.clear()
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Clear Blackboard'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Clear Blackboard'
 
 class CancelSkillNode(BTNode):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -888,17 +1227,10 @@ class CancelSkillNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Cancel_Skill'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Cancel_Skill'
 
 class CancelQueryNode(BTNode):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -911,23 +1243,25 @@ class CancelQueryNode(BTNode):
         logger.debug(f'{self} to yield success')
         yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
-
-        param_str = 'Cancel_Query'
-
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
-
-        return this_node, graph
+    dot_label = 'Cancel_Query'
 
 class GetImageNode(BTNode):
+    '''
+    With `frame_buffer` (a FrameRingBuffer or the name of one), the latest frame is copied out of shared memory
+    instead of being requested from the domain; the image path on the blackboard is left unchanged.
+    '''
+    __slots__ = ('_use_saved_image_path_flag', '_frame_buffer')
 
-    def __init__(self, use_saved_image_path_flag):
+    def __init__(self, use_saved_image_path_flag, frame_buffer=None):
         super().__init__()
         self._use_saved_image_path_flag = use_saved_image_path_flag
+        self._frame_buffer = frame_buffer
 
     def run(self, domain):
+        if self._frame_buffer is not None:
+            yield from self._run_from_frame_buffer()
+            return
+
         if self._use_saved_image_path_flag:
             (image_request_success, image_path, image) = domain.get_rgb_image(self.blackboard['image_path'])
         else:
@@ -942,19 +1276,108 @@ class GetImageNode(BTNode):
             logger.debug(f'{self} to yield failure')
             yield self, BTStatus.FAILURE, BTStatus.FAILURE
 
-    def get_dot_graph(self):
-        graph = self._create_dot_graph()
+    def _run_from_frame_buffer(self):
+        from .frame_buffer import get_frame_buffer, FrameUnavailableError
+
+        try:
+            # Copied because the writer reuses the slot once it has gone around the ring
+            frame = get_frame_buffer(self._frame_buffer).latest(copy=True)
+        except FrameUnavailableError as e:
+            logger.debug(f'{self} to yield failure b/c {e}')
+            yield self, BTStatus.FAILURE, BTStatus.FAILURE
+            return
+
+        self.blackboard['image'] = frame.rgb
+        self.blackboard['image_frame_index'] = frame.index
+        if frame.depth is not None:
+            self.blackboard['depth_image'] = frame.depth
+        logger.debug(f'{self} to yield success')
+        yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
+
+    dot_label = 'get_rgb_image'
+
+
+_prefetch_pool = None
+
+
+def _get_prefetch_pool():
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bt-image-prefetch')
+    return _prefetch_pool
 
-        param_str = 'get_rgb_image'
 
-        this_node = Node(self._uuid_str, label=param_str, shape='box')
-        graph.add_node(this_node)
+class PrefetchingGetImageNode(BTNode):
+    '''
+    Gets the next image like GetImageNode(use_saved_image_path_flag=False), but as soon as it has handed an image out
+    it starts fetching the one after in the background, so a loop that labels image after image rarely waits on the domain.
+    With `image_pipeline`, the prefetched image is also encoded ahead of time for a QueryNode using the same pipeline.
+
+    The image fetched ahead is kept in the run context for the next run, however long the consumer takes, but a fetch
+    still in flight when the node is halted is dropped. With `max_age`, one requested more than `max_age` seconds
+    before it is used is dropped and fetched again, e.g. when the scene may change between rounds.
+    The domain client is called from a worker thread and must be safe to use from there.
+    '''
+    __slots__ = ('_image_pipeline', '_max_age')
+
+    def __init__(self, image_pipeline=None, max_age=None):
+        super().__init__()
+        self._image_pipeline = image_pipeline
+        self._max_age = max_age
+
+    def _fetch(self, domain):
+        (image_request_success, image_path, image) = domain.get_rgb_image()
+        if image_request_success and self._image_pipeline is not None:
+            from .image_pipeline import get_image_pipeline
+            get_image_pipeline(self._image_pipeline).submit(image)
+        return image_request_success, image_path, image
+
+    def _prefetch(self, domain):
+        return time.monotonic(), _get_prefetch_pool().submit(self._fetch, domain)
+
+    def run(self, domain):
+        node_state = get_run_context().node_state(self)
+        prefetch = node_state.pop('prefetch', None)
+        if prefetch is not None and self._max_age is not None and time.monotonic() - prefetch[0] > self._max_age:
+            logger.debug(f'{self} dropping a prefetched image older than {self._max_age}s')
+            prefetch[1].cancel()
+            prefetch = None
+        if prefetch is None:
+            prefetch = self._prefetch(domain)
+
+        future = prefetch[1]
+        try:
+            while not future.done():
+                logger.debug(f'{self} to yield running while the image is fetched')
+                yield self, BTStatus.RUNNING, BTStatus.RUNNING
+        finally:
+            if not future.done():
+                # Halted: the loop around the node is ending, so the next run fetches a new image
+                future.cancel()
+
+        try:
+            (image_request_success, image_path, image) = future.result()
+        except Exception as e:
+            logger.debug(f'{self} to yield failure b/c the fetch raised {e!r}')
+            yield self, BTStatus.FAILURE, BTStatus.FAILURE
+            return
+
+        if image_request_success:
+            self.blackboard['image'] = image
+            self.blackboard['image_path'] = image_path
+            node_state['prefetch'] = self._prefetch(domain)
+            logger.debug(f'{self} to yield success')
+            yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
+        else:
+            logger.debug(f'{self} to yield failure')
+            yield self, BTStatus.FAILURE, BTStatus.FAILURE
 
-        return this_node, graph
+    dot_label = 'get_rgb_image (prefetch)'
 
 
 class SkillParamSelector(ABC):
 
     @abstractmethod
-    def __call__(self, state: State) -> str:
+    def __call__(self, state: 'State') -> str:
         pass
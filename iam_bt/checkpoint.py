@@ -0,0 +1,263 @@
+'''
+Checkpoints of a running tree, so a crashed session can carry on where it stopped instead of starting over.
+
+A checkpoint holds the cursors of the running composites (which child each Sequence and FallBack is on,
+While phases, Retry attempts, finished Parallel children) and the blackboard. Numpy arrays on the
+blackboard are stored as .npy files named by their contents next to a pickled manifest that is replaced
+atomically, so an array that hasn't changed since the last checkpoint isn't written again.
+
+On resume, composites carry on from their cursors and the leaves that were running start again,
+e.g. a skill that was executing is sent again. Composites shared between branches of a Parallel that
+run at the same time share one cursor, so checkpoint such trees before deduping them (see iam_bt.optimizer).
+'''
+import os
+import time
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from .context import RunContext
+from .tree_loader import _write_atomic
+from .write_behind import WriteBehindQueue
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'checkpoint.pkl'
+ARRAYS_DIR = 'arrays'
+FORMAT_VERSION = 3
+
+# Smaller arrays are pickled with the rest of the blackboard
+MIN_ARRAY_BYTES = 1 << 16
+
+
+class CheckpointMismatchError(ValueError):
+    pass
+
+
+class _ArrayRef:
+    # Index into the manifest's list of array files
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _node_order(tree):
+    # Every node once, depth first; shared nodes at their first position
+    order = []
+    seen = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.id in seen:
+            continue
+        seen.add(node.id)
+        order.append(node)
+        stack.extend(reversed(node.children))
+    return order
+
+
+def tree_fingerprint(tree):
+    '''
+    Hash of the tree's node types, labels and edges, independent of node ids, so the same tree built in
+    another process has the same fingerprint. Cursors are saved by node position and only apply to a tree
+    with the same fingerprint.
+    '''
+    order = _node_order(tree)
+    positions = {node.id: position for position, node in enumerate(order)}
+    digest = hashlib.blake2b(digest_size=16)
+    for node in order:
+        digest.update(f'{type(node).__name__}:{node.dot_label}:{[positions[child.id] for child in node.children]};'.encode())
+    return digest.hexdigest()
+
+
+def _cursors_by_position(tree, cursors):
+    # Node ids depend on what else the process built, so cursors are saved by node position
+    positions = {node.id: position for position, node in enumerate(_node_order(tree))}
+    return {positions[node_id]: cursor for node_id, cursor in cursors.items() if node_id in positions}
+
+
+def _extract_arrays(value, arrays):
+    '''
+    Replaces large arrays in `value` by references, appending the arrays to `arrays`.
+    '''
+    if isinstance(value, np.ndarray) and value.dtype != object and value.nbytes >= MIN_ARRAY_BYTES:
+        arrays.append(value)
+        return _ArrayRef(len(arrays) - 1)
+    if isinstance(value, dict):
+        return {k: _extract_arrays(v, arrays) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_extract_arrays(v, arrays) for v in value]
+    if type(value) is tuple:
+        return tuple(_extract_arrays(v, arrays) for v in value)
+    return value
+
+
+def _restore_arrays(value, arrays_dir, file_names):
+    if isinstance(value, _ArrayRef):
+        return np.load(arrays_dir / file_names[value.index], allow_pickle=False)
+    if isinstance(value, dict):
+        return {k: _restore_arrays(v, arrays_dir, file_names) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_restore_arrays(v, arrays_dir, file_names) for v in value]
+    if type(value) is tuple:
+        return tuple(_restore_arrays(v, arrays_dir, file_names) for v in value)
+    return value
+
+
+def _array_file_name(array):
+    digest = hashlib.blake2b(f'{array.dtype.str}{array.shape}'.encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(array).data)
+    return f'{digest.hexdigest()}.npy'
+
+
+def _snapshot(tree, context, tick_count):
+    '''
+    Returns (manifest, arrays) for a checkpoint. Only this part has to run between ticks;
+    the arrays are referenced, not copied, and written by _write().
+    '''
+    arrays = []
+    blackboard = {}
+    for key, value in context.blackboard.items():
+        n_arrays = len(arrays)
+        value = _extract_arrays(value, arrays)
+        try:
+            blackboard[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            del arrays[n_arrays:]
+            logger.warning(f'Not checkpointing blackboard entry {key!r}: {e}')
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'fingerprint': tree_fingerprint(tree),
+        'time': time.time(),
+        'tick_count': tick_count,
+        'cursors': _cursors_by_position(tree, context.cursors),
+        'blackboard': blackboard,
+    }
+    return manifest, arrays
+
+
+def _write(directory, manifest, arrays):
+    directory = Path(directory)
+    arrays_dir = directory / ARRAYS_DIR
+    arrays_dir.mkdir(parents=True, exist_ok=True)
+
+    file_names = []
+    n_written = 0
+    for array in arrays:
+        file_name = _array_file_name(array)
+        file_names.append(file_name)
+        path = arrays_dir / file_name
+        if path.exists():
+            # Written by an earlier checkpoint, or earlier in this one
+            continue
+        with open(path.with_suffix('.tmp'), 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(path.with_suffix('.tmp'), path)
+        n_written += 1
+
+    _write_atomic(directory / MANIFEST_FILE, pickle.dumps(dict(manifest, arrays=file_names), protocol=pickle.HIGHEST_PROTOCOL))
+
+    # Arrays of earlier checkpoints are only removed once the new manifest is in place
+    current = set(file_names)
+    for path in arrays_dir.iterdir():
+        if path.name not in current:
+            path.unlink()
+    logger.debug(f'Checkpointed tick {manifest["tick_count"]} to {directory} ({n_written} of {len(arrays)} arrays written)')
+
+
+def save_checkpoint(directory, tree, context, tick_count=0):
+    '''
+    Writes a checkpoint of `tree` running in `context`. Call it between ticks; Checkpointer does the same
+    without blocking the tick. Blackboard entries that can't be pickled are left out with a warning.
+    '''
+    _write(directory, *_snapshot(tree, context, tick_count))
+
+
+def has_checkpoint(directory):
+    return (Path(directory) / MANIFEST_FILE).exists()
+
+
+def load_checkpoint(directory, tree, context=None):
+    '''
+    Restores the blackboard and cursors saved for `tree` into `context` (a new RunContext by default),
+    so the next run of `tree` in it carries on from the checkpoint. Returns (context, tick count at the checkpoint).
+    '''
+    directory = Path(directory)
+    manifest = pickle.loads((directory / MANIFEST_FILE).read_bytes())
+    if manifest.get('version') != FORMAT_VERSION:
+        raise CheckpointMismatchError(f'{directory} has checkpoint format {manifest.get("version")}, expected {FORMAT_VERSION}')
+    if manifest['fingerprint'] != tree_fingerprint(tree):
+        raise CheckpointMismatchError(f'{directory} was saved from a different tree than {tree}')
+
+    context = context if context is not None else RunContext()
+    arrays_dir = directory / ARRAYS_DIR
+    for key, data in manifest['blackboard'].items():
+        context.blackboard[key] = _restore_arrays(pickle.loads(data), arrays_dir, manifest['arrays'])
+    order = _node_order(tree)
+    context.resume_from({order[position].id: cursor for position, cursor in manifest['cursors'].items()})
+
+    age = time.time() - manifest['time']
+    logger.info(f'Resuming {tree} from tick {manifest["tick_count"]}, checkpointed {age:.1f}s ago')
+    return context, manifest['tick_count']
+
+
+class Checkpointer:
+    '''
+    TreeSession observer that checkpoints the session to `directory` at most every `interval` seconds.
+    The checkpoint is taken between ticks and written to disk on a background thread, so arrays on the
+    blackboard should be replaced rather than modified in place. While a write is still in progress,
+    the next checkpoint waits for it instead of queuing up behind it.
+    '''
+
+    def __init__(self, directory, interval=5.):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._last_time = time.monotonic()
+        self._queue = WriteBehindQueue(max_pending=1)
+
+    def __call__(self, session):
+        now = time.monotonic()
+        if now - self._last_time < self.interval or self._queue.n_pending:
+            return
+        self._last_time = now
+        self.save(session)
+
+    def save(self, session):
+        manifest, arrays = _snapshot(session.tree, session.context, session.tick_count)
+        if self._queue.try_submit(self._write, session.name, manifest, arrays) is None:
+            logger.debug(f'Skipping checkpoint of {session.name}: the previous one is still being written')
+
+    def _write(self, name, manifest, arrays):
+        try:
+            _write(self.directory, manifest, arrays)
+        except OSError as e:
+            # A failed checkpoint shouldn't stop the run
+            logger.warning(f'Could not checkpoint {name} to {self.directory}: {e}')
+
+    def flush(self, timeout=None):
+        '''
+        Waits for the checkpoint being written, if any. Returns True if it finished within `timeout`.
+        '''
+        return self._queue.flush(timeout)
+
+    def close(self):
+        self.flush()
+        self._queue.shutdown()
+
+    def clear(self):
+        '''
+        Removes the checkpoint, e.g. once the tree has finished.
+        '''
+        self.flush()
+        (self.directory / MANIFEST_FILE).unlink(missing_ok=True)
+        arrays_dir = self.directory / ARRAYS_DIR
+        if arrays_dir.exists():
+            for path in arrays_dir.iterdir():
+                path.unlink()
+            os.rmdir(arrays_dir)
@@ -0,0 +1,148 @@
+import logging
+import threading
+
+from .domain_proxy import DomainProxy
+
+
+logger = logging.getLogger(__name__)
+
+# Domain calls that only read. Everything else is treated as a write.
+DEFAULT_READ_METHODS = ('get_skill_status', 'get_query_status', 'get_memory_objects')
+DEFAULT_READ_ATTRS = ('state',)
+
+
+def _freeze(value):
+    # Raises TypeError for arguments that can't be used as a cache key
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    hash(value)
+    return value
+
+
+class _PendingRead:
+    __slots__ = ('_done', 'result', 'error')
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class CoalescingDomain(DomainProxy):
+    '''
+    Memoizes read-only domain calls until the next tick, and merges identical reads made
+    concurrently from several threads into one RPC. Any other call may change what the reads
+    return, so it clears the cache. Cached results are shared between callers and must not be modified.
+    '''
+    caches_reads = True
+
+    def __init__(self, domain, read_methods=DEFAULT_READ_METHODS, read_attrs=DEFAULT_READ_ATTRS):
+        super().__init__(domain)
+        self._read_methods = frozenset(read_methods)
+        self._read_attrs = frozenset(read_attrs)
+
+        self._lock = threading.Lock()
+        self._cache = {}
+
+        self._hits = 0
+        self._merged = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def begin_tick(self):
+        self.invalidate()
+        super().begin_tick()
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._merged + self._misses
+            return {
+                'hits': self._hits,
+                'merged': self._merged,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+                'hit_rate': (self._hits + self._merged) / lookups if lookups else 0.,
+            }
+
+    def _read(self, name, key, fetch):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._cache[key] = _PendingRead()
+                self._misses += 1
+                outcome = 'miss'
+            elif entry.done:
+                self._hits += 1
+                outcome = 'hit'
+            else:
+                self._merged += 1
+                outcome = 'merged'
+
+        from .bt import BTNode
+        metrics = BTNode.metrics
+        if metrics is not None:
+            metrics.domain_cache_lookups.labels(name, outcome).inc()
+
+        if outcome != 'miss':
+            return entry.wait()
+
+        try:
+            result = fetch()
+        except Exception as e:
+            # Don't cache failures; callers already waiting on this read get the same error
+            with self._lock:
+                if self._cache.get(key) is entry:
+                    del self._cache[key]
+            entry.finish(error=e)
+            raise
+        entry.finish(result=result)
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            return super().__getattr__(name)
+
+        if name in self._read_attrs:
+            return self._read(name, ('attr', name), lambda: getattr(self._domain, name))
+
+        attr = getattr(self._domain, name)
+        if not callable(attr):
+            return attr
+
+        if name in self._read_methods:
+            def coalesced_read(*args, **kwargs):
+                try:
+                    key = ('call', name, _freeze(args), _freeze(kwargs))
+                except TypeError:
+                    return attr(*args, **kwargs)
+                return self._read(name, key, lambda: attr(*args, **kwargs))
+            return coalesced_read
+
+        def write(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.invalidate()
+        return write
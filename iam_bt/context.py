@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class RunContext:
+    '''
+    Per-execution state of a tree: the blackboard plus scratch state nodes keep for one run.
+    Node definitions are never modified while running, so one tree can be run with many contexts.
+    '''
+    __slots__ = ('blackboard', '_node_states', '_cursors', '_resume_cursors')
+
+    def __init__(self, blackboard=None):
+        self.blackboard = blackboard if blackboard is not None else {}
+        self._node_states = {}
+        # Where each running composite will carry on from, e.g. the index of a Sequence's current child
+        self._cursors = {}
+        self._resume_cursors = {}
+
+    def node_state(self, node):
+        state = self._node_states.get(node.id)
+        if state is None:
+            state = self._node_states[node.id] = {}
+        return state
+
+    def clear_node_state(self, node):
+        self._node_states.pop(node.id, None)
+
+    def set_cursor(self, node, cursor):
+        self._cursors[node.id] = cursor
+
+    def clear_cursor(self, node):
+        self._cursors.pop(node.id, None)
+
+    @property
+    def cursors(self):
+        return dict(self._cursors)
+
+    def resume_from(self, cursors):
+        '''
+        Makes the composites in `cursors` (as saved from `cursors` in an earlier run of the same tree)
+        carry on from there the next time they start, instead of from their first child.
+        '''
+        self._resume_cursors = dict(cursors)
+
+    def take_resume_cursor(self, node):
+        if not self._resume_cursors:
+            return None
+        return self._resume_cursors.pop(node.id, None)
+
+
+_default_context = RunContext()
+_active_context = ContextVar('iam_bt_run_context', default=_default_context)
+
+
+def get_run_context():
+    return _active_context.get()
+
+
+def get_default_context():
+    return _default_context
+
+
+@contextmanager
+def activate_context(context):
+    token = _active_context.set(context)
+    try:
+        yield context
+    finally:
+        _active_context.reset(token)
+
+
+class ActiveBlackboard:
+    '''
+    Descriptor behind BTNode.blackboard that resolves to the blackboard of the active RunContext.
+    '''
+
+    def __get__(self, instance, owner=None):
+        return _active_context.get().blackboard
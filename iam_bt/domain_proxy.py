@@ -0,0 +1,24 @@
+class DomainProxy:
+    '''
+    Base class for wrappers that sit between the tree and a domain client.
+    Anything not overridden by a subclass is forwarded to the wrapped domain.
+    '''
+
+    # Set by proxies that answer some calls without reaching the wrapped domain
+    caches_reads = False
+
+    def __init__(self, domain):
+        self._domain = domain
+
+    @property
+    def wrapped_domain(self):
+        return self._domain
+
+    def __getattr__(self, name):
+        if name == '_domain':
+            raise AttributeError(name)
+        return getattr(self._domain, name)
+
+    def begin_tick(self):
+        if isinstance(self._domain, DomainProxy):
+            self._domain.begin_tick()
@@ -0,0 +1,195 @@
+'''
+Append-only binary log of everything a tree yields, cheap enough to leave on for whole sessions.
+
+Every leaf status yielded by the root becomes one fixed-width record:
+(tick, monotonic time, event number, leaf node id, leaf status, propagated status). A Parallel
+yields one leaf per child, so its events span several records sharing an event number.
+Records are packed into a preallocated chunk that is written out when it fills up or every
+`flush_interval` seconds, whichever comes first; read them back with read_events() as a numpy array.
+
+A run resumed from a checkpoint starts a new log in the same directory; the log of the earlier session
+is kept as a numbered segment (see archive_event_log()).
+'''
+import os
+import time
+import json
+import struct
+import logging
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+STRUCTURE_FILE = 'structure.json'
+EVENTS_FILE = 'events.bin'
+
+_MAGIC = b'IAMBTEV1'
+# magic, record size, wall clock time and monotonic time at the start of the log
+_HEADER = struct.Struct('<8sIdd')
+_RECORD = struct.Struct('<QdIiBB')
+
+# Node id and leaf status of the children of a Parallel that haven't yielded yet
+NO_NODE = -1
+NO_STATUS = 255
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([('tick', '<u8'), ('time', '<f8'), ('event', '<u4'), ('node', '<i4'),
+                     ('leaf_status', 'u1'), ('status', 'u1')])
+
+
+class EventLog:
+    '''
+    Low-level writer of the binary event log at `path`.
+    '''
+
+    def __init__(self, path, chunk_records=4096, flush_interval=1.):
+        self._file = open(path, 'wb', buffering=0)
+        self.start_time = time.monotonic()
+        self._file.write(_HEADER.pack(_MAGIC, _RECORD.size, time.time(), self.start_time))
+
+        self._chunk = bytearray(chunk_records * _RECORD.size)
+        self._chunk_records = chunk_records
+        self._n = 0
+        self._flush_interval = flush_interval
+        self._last_flush_time = self.start_time
+        self.n_records = 0
+
+    def append(self, tick, timestamp, event, node_id, leaf_status, status):
+        _RECORD.pack_into(self._chunk, self._n * _RECORD.size, tick, timestamp, event, node_id, leaf_status, status)
+        self._n += 1
+        self.n_records += 1
+        if self._n == self._chunk_records:
+            self.flush()
+
+    def maybe_flush(self, now=None):
+        now = now if now is not None else time.monotonic()
+        if self._n and now - self._last_flush_time >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._n:
+            self._file.write(memoryview(self._chunk)[:self._n * _RECORD.size])
+            self._n = 0
+        self._last_flush_time = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def read_events(path):
+    '''
+    Returns (header, records): the header as a dict and the records as a numpy structured array.
+    A record cut short by a crash at the end of the file is dropped.
+    '''
+    import numpy as np
+
+    data = Path(path).read_bytes()
+    magic, record_size, start_wall_time, start_time = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError(f'{path} is not an event log')
+    dtype = record_dtype()
+    if record_size != dtype.itemsize:
+        raise ValueError(f'{path} has {record_size} byte records, expected {dtype.itemsize}')
+
+    n_records = (len(data) - _HEADER.size) // record_size
+    records = np.frombuffer(data, dtype=dtype, count=n_records, offset=_HEADER.size)
+    return {'start_wall_time': start_wall_time, 'start_time': start_time}, records
+
+
+def _flatten(leaf_nodes, leaf_statuses):
+    # A Parallel inside a Parallel reports a list of leaves for that child
+    for leaf_node, leaf_status in zip(leaf_nodes, leaf_statuses):
+        if isinstance(leaf_node, list):
+            yield from _flatten(leaf_node, leaf_status)
+        else:
+            yield leaf_node, leaf_status
+
+
+class EventLogWriter:
+    '''
+    TreeSession observer that records the tree structure and every event yielded by the root to `save_dir`.
+    '''
+
+    def __init__(self, tree, save_dir, skip_running_nodes=True, chunk_records=4096, flush_interval=1.):
+        from .monitor import tree_structure
+
+        self._save_dir = Path(save_dir)
+        self._save_dir.mkdir(parents=True, exist_ok=True)
+        structure = tree_structure(tree)
+        structure['skip_running_nodes'] = skip_running_nodes
+        (self._save_dir / STRUCTURE_FILE).write_text(json.dumps(structure))
+
+        self._log = EventLog(self._save_dir / EVENTS_FILE, chunk_records=chunk_records, flush_interval=flush_interval)
+        self._n_events = 0
+
+    def __call__(self, session):
+        now = time.monotonic()
+        append = self._log.append
+        tick = session.tick_count
+        for leaf_nodes, leaf_statuses, status in session.tick_events:
+            event = self._n_events
+            self._n_events += 1
+            if isinstance(leaf_nodes, list):
+                for leaf_node, leaf_status in _flatten(leaf_nodes, leaf_statuses):
+                    if leaf_node is None:
+                        append(tick, now, event, NO_NODE, NO_STATUS, status.value)
+                    else:
+                        append(tick, now, event, leaf_node.id, leaf_status.value, status.value)
+            else:
+                append(tick, now, event, leaf_nodes.id, leaf_statuses.value, status.value)
+        self._log.maybe_flush(now)
+
+    def close(self):
+        self._log.close()
+
+
+def _segment_paths(save_dir, segment=None):
+    save_dir = Path(save_dir)
+    if segment is None:
+        return save_dir / STRUCTURE_FILE, save_dir / EVENTS_FILE
+    return save_dir / f'structure-{segment}.json', save_dir / f'events-{segment}.bin'
+
+
+def archived_segments(save_dir):
+    '''
+    Returns the numbers of the segments kept by archive_event_log() in `save_dir`, oldest first.
+    '''
+    segments = []
+    for path in Path(save_dir).glob('events-*.bin'):
+        number = path.stem[len('events-'):]
+        if number.isdigit():
+            segments.append(int(number))
+    return sorted(segments)
+
+
+def archive_event_log(save_dir):
+    '''
+    Keeps the log in `save_dir` as the next numbered segment, so that a new EventLogWriter doesn't overwrite it.
+    Returns the segment number, or None if there was no log.
+    '''
+    structure_path, events_path = _segment_paths(save_dir)
+    if not events_path.exists():
+        return None
+    segment = max(archived_segments(save_dir), default=0) + 1
+    archived_structure_path, archived_events_path = _segment_paths(save_dir, segment)
+    if structure_path.exists():
+        os.replace(structure_path, archived_structure_path)
+    os.replace(events_path, archived_events_path)
+    logger.info(f'Kept the event log in {save_dir} as segment {segment}')
+    return segment
+
+
+def read_event_log(save_dir, segment=None):
+    '''
+    Returns (structure, header, records) for a run recorded by EventLogWriter,
+    or for one of the earlier sessions kept as `segment`.
+    '''
+    structure_path, events_path = _segment_paths(save_dir, segment)
+    structure = json.loads(structure_path.read_text())
+    # JSON object keys are always strings
+    structure['nodes'] = {int(node_id): node for node_id, node in structure['nodes'].items()}
+    header, records = read_events(events_path)
+    return structure, header, records
@@ -0,0 +1,203 @@
+import time
+import logging
+
+from .bt import BTNode
+from .bt_status import BTStatus
+from .context import RunContext, activate_context
+from .domain_proxy import DomainProxy
+
+
+logger = logging.getLogger(__name__)
+
+# Bounds how far a tick propagates, so a loop made only of instant nodes can't stall the scheduler
+MAX_EVENTS_PER_TICK = 1000
+
+
+def _leaf_finished(leaf_status):
+    # Parallel yields one status per child, and a list of them for a child that is a Parallel itself
+    if isinstance(leaf_status, list):
+        return all(_leaf_finished(status) for status in leaf_status)
+    return leaf_status != BTStatus.RUNNING
+
+
+def _snapshot(value):
+    # Parallel updates its leaf lists in place and yields the same lists every round
+    if isinstance(value, list):
+        return [_snapshot(v) for v in value]
+    return value
+
+
+def _record(event):
+    leaf_nodes, leaf_statuses, status = event
+    if isinstance(leaf_nodes, list):
+        return _snapshot(leaf_nodes), _snapshot(leaf_statuses), status
+    return event
+
+
+class TreeSession:
+    '''
+    One execution of a tree: its status generator, RunContext and tick bookkeeping.
+    Each call to tick() advances the tree by one tick.
+
+    With `same_tick`, a tick keeps propagating while the yielded leaf has finished rather than waiting,
+    so chains of instant nodes (conditions, blackboard updates) resolve within one tick.
+    '''
+
+    def __init__(self, tree, domain, context=None, name=None, priority=0, tick_rate=None, same_tick=True):
+        from .metrics import instrument_domain
+
+        self._metrics = BTNode.metrics
+        if self._metrics is not None:
+            domain = instrument_domain(domain, self._metrics)
+
+        self.tree = tree
+        self.domain = domain
+        self.context = context if context is not None else RunContext()
+        self.name = name if name is not None else tree.uuid_str
+        self.priority = priority
+        self.period = 1. / tick_rate if tick_rate else 0.
+        self.same_tick = same_tick
+
+        self.tick_count = 0
+        self.status = None
+        self.last_event = None
+        # Every (leaf nodes, leaf statuses, status) yielded during the last tick, in order
+        self.tick_events = []
+        self.next_tick_time = 0.
+
+        self._status_gen = None
+        self._done = False
+        self._observers = []
+
+    @property
+    def done(self):
+        return self._done
+
+    def add_observer(self, observer):
+        '''
+        `observer(session)` is called after every tick, and can read tick_events and tick_count.
+        It runs inside the tick loop, so it should hand work off rather than block.
+        '''
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
+
+    def tick(self):
+        '''
+        Returns the last (leaf nodes, leaf statuses, status) yielded by the root during this tick,
+        or None once the tree has finished.
+        '''
+        if self._done:
+            return None
+        if self._status_gen is None:
+            self._status_gen = self.tree.run(self.domain)
+
+        if isinstance(self.domain, DomainProxy):
+            self.domain.begin_tick()
+
+        metrics = self._metrics
+        if metrics is not None:
+            tick_start = time.perf_counter()
+
+        events = self.tick_events = []
+        try:
+            with activate_context(self.context):
+                event = _record(next(self._status_gen))
+                events.append(event)
+                if self.same_tick:
+                    while event[2] == BTStatus.RUNNING and _leaf_finished(event[1]) and len(events) < MAX_EVENTS_PER_TICK:
+                        event = _record(next(self._status_gen))
+                        events.append(event)
+        except StopIteration:
+            self._done = True
+            if not events:
+                logger.debug(f'{self.name} finished with {self.status}')
+                return None
+        event = events[-1]
+
+        if metrics is not None:
+            metrics.record_tick(tick_start, time.perf_counter())
+
+        self.tick_count += 1
+        self.last_event = event
+        self.status = event[2]
+        for observer in self._observers:
+            observer(self)
+        return event
+
+    def halt(self):
+        if self._status_gen is not None and not self._done:
+            with activate_context(self.context):
+                self._status_gen.close()
+        self._done = True
+
+
+class TreeExecutor:
+    '''
+    Ticks many trees in one process. Every tree gets its own RunContext (and so its own blackboard)
+    and may have its own tick rate; trees that are due at the same time are ticked in priority order.
+    '''
+
+    def __init__(self):
+        self._sessions = []
+
+    @property
+    def sessions(self):
+        return list(self._sessions)
+
+    def add_tree(self, tree, domain, name=None, priority=0, tick_rate=None, context=None, same_tick=True):
+        session = TreeSession(tree, domain, context=context, name=name, priority=priority, tick_rate=tick_rate, same_tick=same_tick)
+        session.next_tick_time = time.monotonic()
+        self._sessions.append(session)
+        return session
+
+    def remove_tree(self, session):
+        session.halt()
+        self._sessions.remove(session)
+
+    def _due_sessions(self, now):
+        due = [session for session in self._sessions if not session.done and session.next_tick_time <= now]
+        # Higher priority first, then whichever is most overdue; the sort is stable so ties keep insertion order
+        due.sort(key=lambda session: (-session.priority, session.next_tick_time))
+        return due
+
+    def step(self):
+        '''
+        Ticks every tree that is due once. Returns the number of trees ticked.
+        '''
+        now = time.monotonic()
+        due = self._due_sessions(now)
+        for session in due:
+            session.tick()
+            if session.period > 0:
+                # Don't try to catch up on missed ticks; just keep the cadence from here on
+                session.next_tick_time = max(session.next_tick_time + session.period, now)
+            if session.done:
+                logger.info(f'Tree {session.name} finished after {session.tick_count} ticks with {session.status}')
+        return len(due)
+
+    def next_due_time(self):
+        pending = [session.next_tick_time for session in self._sessions if not session.done]
+        return min(pending) if pending else None
+
+    def run(self, timeout=None):
+        '''
+        Runs until every tree has finished or `timeout` seconds have passed.
+        Returns True if all trees finished.
+        '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            self.step()
+
+            next_due_time = self.next_due_time()
+            if next_due_time is None:
+                return True
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+
+            wake_time = next_due_time if deadline is None else min(next_due_time, deadline)
+            if wake_time > now:
+                time.sleep(wake_time - now)
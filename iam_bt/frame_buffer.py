@@ -0,0 +1,256 @@
+'''
+Shared-memory ring buffer of recent camera frames. A camera process writes RGB and depth frames
+into a fixed set of slots; readers in other processes get numpy views straight onto shared memory.
+
+Every slot has a sequence counter that the writer makes odd while it is filling the slot and even
+once the frame is complete (a seqlock), so readers can tell whether a frame changed under them
+without any locking on the writer side.
+'''
+import os
+import sys
+import time
+import struct
+import logging
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'IAMBTFB1'
+# magic, n_slots, rgb shape (h, w, c), depth shape (h, w), rgb dtype, depth dtype
+_HEADER = struct.Struct('<8sI3I2I8s8s')
+_HEADER_SIZE = 128
+# Written by the writer after every frame: number of frames written so far
+_COUNTER_OFFSET = _HEADER_SIZE
+_SLOT_META_OFFSET = _COUNTER_OFFSET + 8
+
+_DATA_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + _DATA_ALIGNMENT - 1) // _DATA_ALIGNMENT * _DATA_ALIGNMENT
+
+
+# Buffers created by this process and not closed yet
+_created_names = set()
+
+
+class Frame(namedtuple('Frame', ['index', 'timestamp', 'rgb', 'depth', 'slot', 'sequence'])):
+    '''
+    A frame read from a FrameRingBuffer. Unless it was read with copy=True, `rgb` and `depth` are views
+    onto shared memory that the writer reuses once it has gone around the ring; check
+    FrameRingBuffer.is_current(frame) after using them.
+    '''
+
+
+class FrameUnavailableError(RuntimeError):
+    pass
+
+
+class FrameRingBuffer:
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self._owner = owner
+
+        magic, n_slots, rgb_h, rgb_w, rgb_c, depth_h, depth_w, rgb_dtype, depth_dtype = _HEADER.unpack_from(shm.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f'{shm.name} is not a frame buffer')
+        self.n_slots = n_slots
+        self.rgb_shape = (rgb_h, rgb_w, rgb_c)
+        self.depth_shape = (depth_h, depth_w) if depth_h else None
+        self.rgb_dtype = np.dtype(rgb_dtype.rstrip(b'\0').decode())
+        self.depth_dtype = np.dtype(depth_dtype.rstrip(b'\0').decode())
+
+        self._counter = np.ndarray((1,), np.uint64, shm.buf, _COUNTER_OFFSET)
+        # Per slot: sequence counter, frame index
+        self._slot_meta = np.ndarray((n_slots, 2), np.uint64, shm.buf, _SLOT_META_OFFSET)
+        timestamps_offset = _SLOT_META_OFFSET + self._slot_meta.nbytes
+        self._timestamps = np.ndarray((n_slots,), np.float64, shm.buf, timestamps_offset)
+
+        offset = _align(timestamps_offset + self._timestamps.nbytes)
+        self._rgb = np.ndarray((n_slots,) + self.rgb_shape, self.rgb_dtype, shm.buf, offset)
+        self._depth = None
+        if self.depth_shape is not None:
+            offset = _align(offset + self._rgb.nbytes)
+            self._depth = np.ndarray((n_slots,) + self.depth_shape, self.depth_dtype, shm.buf, offset)
+
+    @staticmethod
+    def _size(n_slots, rgb_shape, depth_shape, rgb_dtype, depth_dtype):
+        offset = _align(_SLOT_META_OFFSET + n_slots * 2 * 8 + n_slots * 8)
+        offset = _align(offset + n_slots * int(np.prod(rgb_shape)) * rgb_dtype.itemsize)
+        if depth_shape is not None:
+            offset += n_slots * int(np.prod(depth_shape)) * depth_dtype.itemsize
+        return offset
+
+    @classmethod
+    def create(cls, rgb_shape, depth_shape=None, n_slots=4, rgb_dtype=np.uint8, depth_dtype=np.uint16, name=None):
+        '''
+        Allocates a new buffer; the creating side is the writer and unlinks the memory on close().
+        '''
+        assert n_slots >= 2
+        rgb_dtype, depth_dtype = np.dtype(rgb_dtype), np.dtype(depth_dtype)
+        rgb_shape = tuple(rgb_shape) if len(rgb_shape) == 3 else tuple(rgb_shape) + (1,)
+        size = cls._size(n_slots, rgb_shape, depth_shape, rgb_dtype, depth_dtype)
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created_names.add(shm.name)
+        depth_h, depth_w = depth_shape if depth_shape is not None else (0, 0)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, n_slots, *rgb_shape, depth_h, depth_w,
+                          rgb_dtype.str.encode(), depth_dtype.str.encode())
+        buffer = cls(shm, owner=True)
+        buffer._counter[0] = 0
+        buffer._slot_meta[:] = 0
+        logger.debug(f'Created frame buffer {shm.name} ({size} bytes, {n_slots} slots)')
+        return buffer
+
+    @classmethod
+    def attach(cls, name):
+        '''
+        Attaches a reader to an existing buffer. Only the writer unlinks the memory.
+        '''
+        if sys.version_info >= (3, 13):
+            return cls(shared_memory.SharedMemory(name=name, track=False), owner=False)
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix' and shm.name not in _created_names:
+            # Otherwise the reader's resource tracker unlinks the writer's memory when the reader exits.
+            # A writer in this process shares the tracker registration, which its close() removes.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def n_frames_written(self):
+        return int(self._counter[0])
+
+    def write(self, rgb, depth=None, timestamp=None):
+        '''
+        Copies a frame into the next slot. Only one process may write to a buffer.
+        '''
+        index = int(self._counter[0])
+        slot = index % self.n_slots
+        meta = self._slot_meta[slot]
+
+        meta[0] += 1  # odd: slot being written
+        self._rgb[slot].reshape(rgb.shape)[...] = rgb
+        if depth is not None and self._depth is not None:
+            self._depth[slot] = depth
+        self._timestamps[slot] = timestamp if timestamp is not None else time.time()
+        meta[1] = index
+        meta[0] += 1  # even: slot complete
+
+        self._counter[0] = index + 1
+        return index
+
+    def _read_slot(self, slot, copy):
+        sequence = int(self._slot_meta[slot, 0])
+        if sequence % 2 == 1:
+            return None
+        index = int(self._slot_meta[slot, 1])
+        timestamp = float(self._timestamps[slot])
+        rgb = self._rgb[slot]
+        if rgb.shape[-1] == 1:
+            rgb = rgb[..., 0]
+        depth = self._depth[slot] if self._depth is not None else None
+        if copy:
+            rgb = rgb.copy()
+            depth = depth.copy() if depth is not None else None
+        frame = Frame(index, timestamp, rgb, depth, slot, sequence)
+        # A copy made while the writer got to the slot is torn; a view is only checked later by the caller
+        if copy and not self.is_current(frame):
+            return None
+        return frame
+
+    def latest(self, copy=False, retries=3):
+        '''
+        Returns the most recent complete frame. Raises FrameUnavailableError if nothing has been written yet.
+        '''
+        for _ in range(retries + 1):
+            n_frames = int(self._counter[0])
+            if n_frames == 0:
+                raise FrameUnavailableError(f'No frames written to {self.name} yet')
+            frame = self._read_slot((n_frames - 1) % self.n_slots, copy)
+            if frame is not None:
+                return frame
+        raise FrameUnavailableError(f'Could not read a consistent frame from {self.name}')
+
+    def is_current(self, frame):
+        '''
+        True if the writer has not touched the frame's slot since it was read.
+        '''
+        return int(self._slot_meta[frame.slot, 0]) == frame.sequence
+
+    def close(self):
+        # Views onto the memory have to go before it can be closed
+        self._counter = self._slot_meta = self._timestamps = self._rgb = self._depth = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            _created_names.discard(self._shm.name)
+
+
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+def get_frame_buffer(buffer_or_name):
+    '''
+    Returns `buffer_or_name` if it is a FrameRingBuffer; otherwise attaches to the named buffer once per process.
+    '''
+    if isinstance(buffer_or_name, FrameRingBuffer):
+        return buffer_or_name
+    with _attached_lock:
+        buffer = _attached.get(buffer_or_name)
+        if buffer is None:
+            buffer = _attached[buffer_or_name] = FrameRingBuffer.attach(buffer_or_name)
+        return buffer
+
+
+class SyntheticCameraWriter:
+    '''
+    Local stand-in for a camera process: writes frames from `frame_source` (by default a moving
+    synthetic pattern) into `buffer` at `rate` Hz on a background thread.
+    '''
+
+    def __init__(self, buffer, rate=30., frame_source=None):
+        self._buffer = buffer
+        self._period = 1. / rate
+        self._frame_source = frame_source if frame_source is not None else self._synthetic_frame
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bt-synthetic-camera', daemon=True)
+
+    def _synthetic_frame(self, index):
+        h, w, c = self._buffer.rgb_shape
+        x = (np.arange(w, dtype=np.uint16) + 4 * index) % 256
+        rgb = np.broadcast_to(x[None, :, None], (h, w, c)).astype(self._buffer.rgb_dtype)
+        depth = None
+        if self._buffer.depth_shape is not None:
+            y = np.arange(self._buffer.depth_shape[0], dtype=np.float64)[:, None]
+            depth = np.broadcast_to(500 + y + index, self._buffer.depth_shape).astype(self._buffer.depth_dtype)
+        return rgb, depth
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        next_time = time.monotonic()
+        index = 0
+        while not self._stop.is_set():
+            rgb, depth = self._frame_source(index)
+            self._buffer.write(rgb, depth)
+            index += 1
+            next_time += self._period
+            self._stop.wait(max(0., next_time - time.monotonic()))
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,136 @@
+'''
+Crops, downsamples and encodes images on a worker pool before they are sent to the UI,
+so queries carry a small encoded payload and the tree keeps ticking while images are encoded.
+'''
+import io
+import base64
+import logging
+import weakref
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+class EncodedImage(namedtuple('EncodedImage', ['data', 'format', 'width', 'height', 'scale'])):
+    '''
+    `scale` is the encoded size divided by the size after cropping, for mapping UI coordinates back.
+    '''
+
+    def to_payload(self, crop=None):
+        return {
+            'format': self.format,
+            'data': base64.b64encode(self.data).decode('ascii'),
+            'width': self.width,
+            'height': self.height,
+            'scale': self.scale,
+            'crop': list(crop) if crop is not None else None,
+        }
+
+
+class ImagePipeline:
+    '''
+    `crop` is (left, top, right, bottom) in pixels, `max_size` the largest (width, height) to send;
+    the aspect ratio is kept. `image_format` is 'png' or 'jpeg'. Pillow is needed for encoding.
+
+    Encoded images are cached per frame, so sending the same image again is free. Frames are told apart by
+    the array object (or by an explicit `key`, e.g. a frame index), not by their content, so nothing is hashed
+    or copied on the tick thread; an image must not be modified in place once it has been submitted.
+    '''
+
+    def __init__(self, max_size=None, crop=None, image_format='png', jpeg_quality=85, workers=2, cache_size=8):
+        assert image_format in ('png', 'jpeg')
+        self.max_size = max_size
+        self.crop = crop
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bt-image-pipeline')
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def frame_key(image):
+        return ('object', id(image))
+
+    def _encode(self, image):
+        from PIL import Image
+        import numpy as np
+
+        if image.dtype != np.uint8:
+            # e.g. float images in [0, 1]
+            image = np.clip(image * 255 if image.dtype.kind == 'f' else image, 0, 255).astype(np.uint8)
+        pil_image = Image.fromarray(image)
+        if self.crop is not None:
+            pil_image = pil_image.crop(tuple(self.crop))
+
+        cropped_width = pil_image.width
+        if self.max_size is not None:
+            pil_image.thumbnail(tuple(self.max_size), Image.BILINEAR)
+
+        out = io.BytesIO()
+        if self.image_format == 'jpeg':
+            pil_image.convert('RGB').save(out, format='JPEG', quality=self.jpeg_quality)
+        else:
+            # Speed matters more than size here
+            pil_image.save(out, format='PNG', compress_level=1)
+        return EncodedImage(out.getvalue(), self.image_format, pil_image.width, pil_image.height, pil_image.width / cropped_width)
+
+    def submit(self, image, key=None):
+        '''
+        Returns a Future of the EncodedImage for `image`, shared with earlier requests for the same frame.
+        '''
+        # The id of a freed array can be reused, so entries keyed by object also hold a weak reference to it
+        image_ref = None
+        if key is None:
+            key = self.frame_key(image)
+            image_ref = weakref.ref(image)
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and (entry[0] is None or entry[0]() is image):
+                self._cache.move_to_end(key)
+                return entry[1]
+            future = self._pool.submit(self._encode, image)
+            self._cache[key] = (image_ref, future)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        future.add_done_callback(lambda future: self._forget_failure(key, future))
+        return future
+
+    def _forget_failure(self, key, future):
+        # A failed encode is retried the next time the frame is submitted
+        if future.exception() is not None:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry[1] is future:
+                    del self._cache[key]
+
+    def encode(self, image, key=None):
+        return self.submit(image, key).result()
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+_pipelines = {}
+
+
+def register_image_pipeline(name, pipeline):
+    '''
+    Makes `pipeline` available to nodes by name, e.g. for trees loaded from YAML.
+    '''
+    _pipelines[name] = pipeline
+
+
+def get_image_pipeline(pipeline_or_name):
+    if isinstance(pipeline_or_name, ImagePipeline):
+        return pipeline_or_name
+    try:
+        return _pipelines[pipeline_or_name]
+    except KeyError:
+        raise KeyError(f'No image pipeline registered as {pipeline_or_name!r}') from None
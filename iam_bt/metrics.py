@@ -0,0 +1,392 @@
+import math
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .domain_proxy import DomainProxy
+
+
+logger = logging.getLogger(__name__)
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in pairs) + '}'
+
+
+class _CounterChild:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+class _GaugeChild:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        self._value = float(value)
+
+    @property
+    def value(self):
+        return self._value
+
+
+class _HistogramChild:
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._upper_bounds = buckets
+        self._bucket_counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        idx = bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._bucket_counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def value(self):
+        with self._lock:
+            bucket_counts = list(self._bucket_counts)
+            total, count = self._sum, self._count
+
+        cumulative = []
+        running = 0
+        for upper_bound, bucket_count in zip(self._upper_bounds + (math.inf,), bucket_counts):
+            running += bucket_count
+            cumulative.append((upper_bound, running))
+        return {'buckets': cumulative, 'sum': total, 'count': count}
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._default_child = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        assert len(labelvalues) == len(self.labelnames), \
+            f'{self.name} expects labels {self.labelnames}, got {labelvalues}'
+        key = tuple(str(v) for v in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        return [(labelvalues, child.value) for labelvalues, child in children]
+
+    def render(self):
+        lines = [f'# TYPE {self.name} {self.type_name}', f'# HELP {self.name} {self.documentation}']
+        for labelvalues, value in self.samples():
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+    def _render_sample(self, labelvalues, value):
+        return [f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default_child.inc(amount)
+
+    def _render_sample(self, labelvalues, value):
+        return [f'{self.name}_total{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}']
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self._default_child.inc(amount)
+
+    def dec(self, amount=1):
+        self._default_child.dec(amount)
+
+    def set(self, value):
+        self._default_child.set(value)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self._buckets = tuple(sorted(float(b) for b in buckets if b != math.inf))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._buckets)
+
+    def observe(self, value):
+        self._default_child.observe(value)
+
+    def _render_sample(self, labelvalues, value):
+        lines = []
+        for upper_bound, count in value['buckets']:
+            labels = _format_labels(self.labelnames, labelvalues, [('le', _format_value(upper_bound))])
+            lines.append(f'{self.name}_bucket{labels} {count}')
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f'{self.name}_count{labels} {value["count"]}')
+        lines.append(f'{self.name}_sum{labels} {_format_value(value["sum"])}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, metric_cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f'Metric {name} already registered with a different type or labels')
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        '''
+        Returns {metric name: {label values tuple: value}} for in-process consumers.
+        Histogram values are dicts with cumulative 'buckets', 'sum' and 'count'.
+        '''
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: dict(metric.samples()) for metric in metrics}
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class BTMetrics:
+    '''
+    The metrics the runner, the node base classes and InstrumentedDomain report into.
+    '''
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+
+        self.ticks = self.registry.counter('bt_ticks', 'Number of tree ticks executed.')
+        self.tick_latency = self.registry.histogram('bt_tick_latency_seconds', 'Time spent inside a single tree tick.')
+        self.tick_rate = self.registry.gauge('bt_tick_rate_hz', 'Tick rate measured between the last two ticks.')
+        self.skills_started = self.registry.counter('bt_skills_started', 'Skills sent to the domain.', ['skill'])
+        self.skills_in_flight = self.registry.gauge('bt_skills_in_flight', 'Skills sent to the domain that have not finished.')
+        self.skill_handoff_gap = self.registry.histogram('bt_skill_handoff_gap_seconds',
+                                                         'Time between a skill succeeding and the next skill in its Sequence being sent.')
+        self.queries_in_flight = self.registry.gauge('bt_queries_in_flight', 'Queries sent to the domain that have not finished.')
+        self.query_wait = self.registry.histogram('bt_query_wait_seconds', 'Time ResolveQueryNode waited for human input.',
+                                                  ['query'], buckets=WAIT_BUCKETS)
+        self.domain_calls = self.registry.counter('bt_domain_calls', 'Domain RPCs by method.', ['method'])
+        self.domain_latency = self.registry.histogram('bt_domain_call_latency_seconds', 'Domain RPC latency by method.', ['method'])
+        self.domain_cache_lookups = self.registry.counter('bt_domain_cache_lookups',
+                                                          'Reads through CoalescingDomain by method and result (hit, merged or miss).',
+                                                          ['method', 'result'])
+
+        self._last_tick_start = None
+
+    def record_tick(self, tick_start, tick_end):
+        self.ticks.inc()
+        self.tick_latency.observe(tick_end - tick_start)
+        if self._last_tick_start is not None and tick_start > self._last_tick_start:
+            self.tick_rate.set(1. / (tick_start - self._last_tick_start))
+        self._last_tick_start = tick_start
+
+    def record_domain_call(self, method, duration):
+        self.domain_calls.labels(method).inc()
+        self.domain_latency.labels(method).observe(duration)
+
+
+class InstrumentedDomain(DomainProxy):
+
+    def __init__(self, domain, metrics):
+        super().__init__(domain)
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            return super().__getattr__(name)
+
+        # Properties such as `state` may be RPCs themselves, so time the lookup too
+        start = time.perf_counter()
+        attr = getattr(self._domain, name)
+        if not callable(attr):
+            self._metrics.record_domain_call(name, time.perf_counter() - start)
+            return attr
+
+        def instrumented_call(*args, **kwargs):
+            call_start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self._metrics.record_domain_call(name, time.perf_counter() - call_start)
+
+        return instrumented_call
+
+
+def instrument_domain(domain, metrics):
+    '''
+    Returns `domain` with its calls reported to `metrics`. The instrumentation goes below any caching
+    proxy (e.g. CoalescingDomain) so that only calls that reach the domain count. A domain that is
+    already instrumented, e.g. by an earlier session, reports to `metrics` from now on.
+    '''
+    innermost_cache = None
+    proxy = domain
+    while isinstance(proxy, DomainProxy):
+        if isinstance(proxy, InstrumentedDomain):
+            proxy._metrics = metrics
+            return domain
+        if proxy.caches_reads:
+            innermost_cache = proxy
+        proxy = proxy.wrapped_domain
+
+    if innermost_cache is None:
+        return InstrumentedDomain(domain, metrics)
+    innermost_cache._domain = InstrumentedDomain(innermost_cache.wrapped_domain, metrics)
+    return domain
+
+
+def get_metrics():
+    from .bt import BTNode
+    return BTNode.metrics
+
+
+def enable_metrics(registry=None):
+    from .bt import BTNode
+    if BTNode.metrics is None or (registry is not None and BTNode.metrics.registry is not registry):
+        BTNode.metrics = BTMetrics(registry)
+    return BTNode.metrics
+
+
+def disable_metrics():
+    from .bt import BTNode
+    BTNode.metrics = None
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f'metrics endpoint: {format % args}')
+
+
+class MetricsServer:
+
+    def __init__(self, registry, host='127.0.0.1', port=9464):
+        handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='bt-metrics', daemon=True)
+        self._thread.start()
+        logger.info(f'Serving metrics on http://{host}:{self.port}/metrics')
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+
+def serve_metrics(host='127.0.0.1', port=9464):
+    '''
+    Enables metrics collection if needed and exposes it over HTTP in OpenMetrics text format.
+    '''
+    metrics = enable_metrics()
+    return MetricsServer(metrics.registry, host=host, port=port)
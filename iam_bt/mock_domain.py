@@ -43,6 +43,10 @@ class BaseMockDomainClient(ABC):
         self._mock_tick()
         return self._skill_dict[skill_id]['status']
 
+    def cancel_skill(self, skill_id):
+        if self._skill_dict[skill_id]['status'] == 'running':
+            self._skill_dict[skill_id]['status'] = 'cancelled'
+
 
 class MockBoxInCabinetDomainClient(BaseMockDomainClient):
 
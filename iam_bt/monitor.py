@@ -0,0 +1,313 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .bt_status import BTStatus
+from .event_log import _flatten
+
+
+logger = logging.getLogger(__name__)
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Clients that can't take a message within this many seconds are disconnected
+SEND_TIMEOUT = 5.
+
+
+def tree_structure(tree):
+    '''
+    Returns a JSON-serializable description of the tree: every node once, keyed by node id, with child ids.
+    '''
+    nodes = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.id in nodes:
+            continue
+        nodes[node.id] = {
+            'type': type(node).__name__,
+            'label': node.dot_label,
+            'shape': node.dot_shape,
+            'children': [child.id for child in node.children],
+        }
+        stack.extend(node.children)
+    return {'root': tree.id, 'nodes': nodes}
+
+
+class _MonitorClient:
+    '''
+    Pending updates for one client. Updates to the same node are coalesced, so a slow client
+    gets the latest status of every node instead of an ever growing backlog.
+    '''
+
+    def __init__(self, send):
+        self._send = send
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._tick = None
+        self.closed = False
+
+    def offer(self, changes, tick):
+        with self._lock:
+            self._pending.update(changes)
+            self._tick = tick
+        self._wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+
+    def serve(self, hello):
+        '''
+        Sends `hello`, then pending updates as they arrive. Runs on the client's own thread.
+        '''
+        try:
+            self._send(hello)
+            while True:
+                self._wakeup.wait()
+                if self.closed:
+                    return
+                with self._lock:
+                    self._wakeup.clear()
+                    pending, self._pending = self._pending, {}
+                    tick = self._tick
+                if pending:
+                    self._send({'type': 'delta', 'tick': tick, 'changes': [[node_id, status] for node_id, status in pending.items()]})
+        except OSError as e:
+            logger.debug(f'monitor client disconnected: {e}')
+        finally:
+            self.closed = True
+
+
+def _encode_websocket_frame(message):
+    payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x81, length])
+    elif length < (1 << 16):
+        header = bytes([0x81, 126]) + length.to_bytes(2, 'big')
+    else:
+        header = bytes([0x81, 127]) + length.to_bytes(8, 'big')
+    return header + payload
+
+
+class _MonitorRequestHandler(BaseHTTPRequestHandler):
+    monitor = None
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/ws' and self.headers.get('Upgrade', '').lower() == 'websocket':
+            self._serve_websocket()
+        elif path in ('/', '/index.html'):
+            body = _VIEWER_HTML.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def _serve_websocket(self):
+        key = self.headers.get('Sec-WebSocket-Key')
+        if key is None:
+            self.send_error(400)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        # The viewer never sends anything we need, so the connection is write-only from here on
+        self.connection.settimeout(SEND_TIMEOUT)
+        self.monitor._serve_client(lambda message: self.connection.sendall(_encode_websocket_frame(message)))
+
+    def log_message(self, format, *args):
+        logger.debug(f'monitor endpoint: {format % args}')
+
+
+class _UnixStreamHandler(socketserver.BaseRequestHandler):
+    monitor = None
+
+    def handle(self):
+        # Newline-delimited JSON, same messages as the WebSocket
+        self.request.settimeout(SEND_TIMEOUT)
+        self.monitor._serve_client(
+            lambda message: self.request.sendall(json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'))
+
+
+class _ThreadingUnixStreamServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TreeMonitor:
+    '''
+    Streams a running tree to local viewers. The structure is sent once when a client connects,
+    followed by deltas of [node id, status] pairs tagged with the tick they happened in.
+    Serves a browser viewer and a WebSocket on http://host:port/, and newline-delimited JSON on `unix_path` if given.
+
+    Register it with TreeSession.add_observer() (or pass it to run_tree); observing a tick only
+    updates in-memory state, and every client is fed from its own thread.
+    '''
+
+    def __init__(self, tree, host='127.0.0.1', port=8765, unix_path=None):
+        self._structure = tree_structure(tree)
+        self._lock = threading.Lock()
+        self._clients = []
+        self._statuses = {}
+        self._tick = 0
+
+        handler = type('MonitorRequestHandler', (_MonitorRequestHandler,), {'monitor': self})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._threads = [threading.Thread(target=self._httpd.serve_forever, name='bt-monitor', daemon=True)]
+
+        self._unix_server = None
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            unix_handler = type('MonitorUnixStreamHandler', (_UnixStreamHandler,), {'monitor': self})
+            self._unix_server = _ThreadingUnixStreamServer(unix_path, unix_handler)
+            self._threads.append(threading.Thread(target=self._unix_server.serve_forever, name='bt-monitor-unix', daemon=True))
+
+        for thread in self._threads:
+            thread.start()
+        logger.info(f'Serving tree monitor on http://{host}:{self.port}/')
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def n_clients(self):
+        with self._lock:
+            return len(self._clients)
+
+    def _serve_client(self, send):
+        client = _MonitorClient(send)
+        with self._lock:
+            hello = {'type': 'structure', 'tick': self._tick, **self._structure,
+                     'statuses': [[node_id, status] for node_id, status in self._statuses.items()]}
+            self._clients.append(client)
+        try:
+            client.serve(hello)
+        finally:
+            with self._lock:
+                self._clients.remove(client)
+
+    def publish(self, events, tick):
+        changes = {}
+        for leaf_nodes, leaf_statuses, _ in events:
+            if not isinstance(leaf_nodes, list):
+                leaf_nodes = [leaf_nodes]
+                leaf_statuses = [leaf_statuses]
+            for leaf_node, leaf_status in _flatten(leaf_nodes, leaf_statuses):
+                if leaf_node is not None:
+                    changes[leaf_node.id] = leaf_status.value
+        if events:
+            changes[self._structure['root']] = events[-1][2].value
+
+        with self._lock:
+            self._tick = tick
+            changes = {node_id: status for node_id, status in changes.items() if self._statuses.get(node_id) != status}
+            if not changes:
+                return
+            self._statuses.update(changes)
+            clients = list(self._clients)
+        for client in clients:
+            client.offer(changes, tick)
+
+    def __call__(self, session):
+        self.publish(session.tick_events, session.tick_count)
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.close()
+        servers = [self._httpd] + ([self._unix_server] if self._unix_server is not None else [])
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if self._unix_server is not None and os.path.exists(self._unix_server.server_address):
+            os.unlink(self._unix_server.server_address)
+        for thread in self._threads:
+            thread.join()
+
+
+_VIEWER_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>iam_bt monitor</title>
+<style>
+body { font-family: monospace; margin: 1em; }
+ul { list-style: none; padding-left: 1.5em; border-left: 1px dotted #ccc; }
+.node { padding: 0 0.3em; border-radius: 3px; }
+.s0 { background: #f5d76e; }
+.s1 { background: #8fd18f; }
+.s2 { background: #f08c8c; }
+#status { color: #666; }
+</style>
+</head>
+<body>
+<div id="status">connecting...</div>
+<div id="tree"></div>
+<script>
+const STATUS_NAMES = %s;
+let tick = 0;
+
+function render(structure, id) {
+  const node = structure.nodes[id];
+  const li = document.createElement('li');
+  const span = document.createElement('span');
+  span.className = 'node';
+  span.dataset.id = id;
+  span.textContent = node.label;
+  li.appendChild(span);
+  if (node.children.length) {
+    const ul = document.createElement('ul');
+    for (const child of node.children) ul.appendChild(render(structure, child));
+    li.appendChild(ul);
+  }
+  return li;
+}
+
+function apply(changes) {
+  for (const [id, status] of changes) {
+    for (const el of document.querySelectorAll('[data-id="' + id + '"]')) {
+      el.className = 'node s' + status;
+      el.title = STATUS_NAMES[status];
+    }
+  }
+}
+
+const ws = new WebSocket('ws://' + location.host + '/ws');
+ws.onmessage = (event) => {
+  const message = JSON.parse(event.data);
+  if (message.type === 'structure') {
+    const root = document.createElement('ul');
+    root.appendChild(render(message, message.root));
+    document.getElementById('tree').replaceChildren(root);
+    apply(message.statuses);
+  } else {
+    apply(message.changes);
+  }
+  tick = message.tick;
+  document.getElementById('status').textContent = 'tick ' + tick;
+};
+ws.onclose = () => { document.getElementById('status').textContent = 'disconnected at tick ' + tick; };
+</script>
+</body>
+</html>
+''' % json.dumps({status.value: status.name for status in BTStatus})
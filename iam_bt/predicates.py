@@ -0,0 +1,283 @@
+'''
+Declarative conditions on the domain state, usable on a single state and on a batch of states at once:
+
+    box_on_table = field('frame:box:pose/position', 2) < 0.1
+    cabinet_open = field('frame:cabinet:open', 0) == True
+    node = PredicateConditionNode(box_on_table & ~cabinet_open)
+
+A batch maps every state key to an array with one row per state (see stack_states()), and is
+evaluated with numpy comparisons over whole columns, e.g. for Monte-Carlo evaluation of a tree
+over thousands of sampled states. In tree definitions, predicates are written as specs:
+
+    {type: PredicateConditionNode, predicate: {all: [{key: 'frame:box:pose/position', index: 2, op: '<', value: 0.1},
+                                                     {not: {key: 'frame:cabinet:open', index: 0, op: '==', value: true}}]}}
+'''
+import operator
+from abc import ABC, abstractmethod
+
+from .bt import ConditionNode
+
+
+_OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+class Predicate(ABC):
+    '''
+    Combine predicates with `&`, `|` and `~`. Predicates are immutable and compare equal when they test the same thing.
+    '''
+    __slots__ = ()
+
+    @abstractmethod
+    def evaluate(self, state) -> bool:
+        pass
+
+    @abstractmethod
+    def evaluate_batch(self, states):
+        '''
+        Returns a boolean array with one entry per state in the batch.
+        '''
+
+    @abstractmethod
+    def keys(self):
+        '''
+        Returns the set of state keys the predicate reads.
+        '''
+
+    @abstractmethod
+    def to_spec(self):
+        pass
+
+    @staticmethod
+    def from_spec(spec):
+        if isinstance(spec, Predicate):
+            return spec
+        if not isinstance(spec, dict):
+            raise ValueError(f'Predicate spec must be a mapping, got {spec!r}')
+        if 'all' in spec:
+            return All(*(Predicate.from_spec(s) for s in spec['all']))
+        if 'any' in spec:
+            return Any(*(Predicate.from_spec(s) for s in spec['any']))
+        if 'not' in spec:
+            return Not(Predicate.from_spec(spec['not']))
+        try:
+            return Compare(spec['key'], spec.get('index'), spec['op'], spec['value'])
+        except KeyError as e:
+            raise ValueError(f'Predicate spec {spec!r} is missing {e}') from None
+
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def __call__(self, state):
+        return self.evaluate(state)
+
+    def _identity(self):
+        return repr(self.to_spec())
+
+    def __eq__(self, other):
+        return isinstance(other, Predicate) and self._identity() == other._identity()
+
+    def __hash__(self):
+        return hash(self._identity())
+
+
+class Compare(Predicate):
+    '''
+    `state[key][index] <op> value`, or `state[key] <op> value` if `index` is None. Without an index, a
+    batch compares each state's value elementwise and matches the states where every element does.
+    '''
+    __slots__ = ('_key', '_index', '_op', '_value')
+
+    def __init__(self, key, index, op, value):
+        if op not in _OPS:
+            raise ValueError(f'Unknown comparison {op!r}; use one of {list(_OPS)}')
+        self._key = key
+        self._index = index
+        self._op = op
+        self._value = value
+
+    def evaluate(self, state):
+        value = state[self._key]
+        if self._index is not None:
+            return bool(_OPS[self._op](value[self._index], self._value))
+        import numpy as np
+        # Elementwise like evaluate_batch, rather than Python's ordering of lists
+        return bool(np.all(_OPS[self._op](np.asarray(value), self._value)))
+
+    def evaluate_batch(self, states):
+        import numpy as np
+
+        column = np.asarray(states[self._key])
+        if self._index is not None:
+            column = column[:, self._index]
+        result = _OPS[self._op](column, self._value)
+        if result.ndim > 1:
+            # Without an index a state holds the whole value, so a state matches when every element does
+            result = result.reshape(len(result), -1).all(axis=1)
+        return result
+
+    def keys(self):
+        return {self._key}
+
+    def to_spec(self):
+        return {'key': self._key, 'index': self._index, 'op': self._op, 'value': self._value}
+
+    def __str__(self):
+        index = f'[{self._index}]' if self._index is not None else ''
+        return f'{self._key}{index} {self._op} {self._value}'
+
+
+class _Combination(Predicate):
+    __slots__ = ('_predicates',)
+    _spec_key = None
+    _symbol = None
+
+    def __init__(self, *predicates):
+        assert len(predicates) > 0
+        flattened = []
+        for predicate in predicates:
+            # (a & b) & c is kept as one All of three
+            flattened.extend(predicate._predicates if type(predicate) is type(self) else (predicate,))
+        self._predicates = tuple(flattened)
+
+    def keys(self):
+        return set().union(*(predicate.keys() for predicate in self._predicates))
+
+    def to_spec(self):
+        return {self._spec_key: [predicate.to_spec() for predicate in self._predicates]}
+
+    def __str__(self):
+        return '(' + f' {self._symbol} '.join(str(predicate) for predicate in self._predicates) + ')'
+
+
+class All(_Combination):
+    __slots__ = ()
+    _spec_key = 'all'
+    _symbol = '&'
+
+    def evaluate(self, state):
+        return all(predicate.evaluate(state) for predicate in self._predicates)
+
+    def evaluate_batch(self, states):
+        import numpy as np
+        return np.logical_and.reduce([predicate.evaluate_batch(states) for predicate in self._predicates])
+
+
+class Any(_Combination):
+    __slots__ = ()
+    _spec_key = 'any'
+    _symbol = '|'
+
+    def evaluate(self, state):
+        return any(predicate.evaluate(state) for predicate in self._predicates)
+
+    def evaluate_batch(self, states):
+        import numpy as np
+        return np.logical_or.reduce([predicate.evaluate_batch(states) for predicate in self._predicates])
+
+
+class Not(Predicate):
+    __slots__ = ('_predicate',)
+
+    def __init__(self, predicate):
+        self._predicate = predicate
+
+    def __invert__(self):
+        return self._predicate
+
+    def evaluate(self, state):
+        return not self._predicate.evaluate(state)
+
+    def evaluate_batch(self, states):
+        import numpy as np
+        return np.logical_not(self._predicate.evaluate_batch(states))
+
+    def keys(self):
+        return self._predicate.keys()
+
+    def to_spec(self):
+        return {'not': self._predicate.to_spec()}
+
+    def __str__(self):
+        if isinstance(self._predicate, _Combination):
+            return f'~{self._predicate}'
+        return f'~({self._predicate})'
+
+
+class field:
+    '''
+    Builds Compare predicates with comparison operators: `field(key, index) < value`.
+    '''
+    __slots__ = ('_key', '_index')
+
+    def __init__(self, key, index=None):
+        self._key = key
+        self._index = index
+
+    def __lt__(self, value):
+        return Compare(self._key, self._index, '<', value)
+
+    def __le__(self, value):
+        return Compare(self._key, self._index, '<=', value)
+
+    def __gt__(self, value):
+        return Compare(self._key, self._index, '>', value)
+
+    def __ge__(self, value):
+        return Compare(self._key, self._index, '>=', value)
+
+    def __eq__(self, value):
+        return Compare(self._key, self._index, '==', value)
+
+    def __ne__(self, value):
+        return Compare(self._key, self._index, '!=', value)
+
+    __hash__ = None
+
+
+def stack_states(states, keys):
+    '''
+    Turns a sequence of states into a batch holding `keys`, e.g. predicate.keys().
+    '''
+    import numpy as np
+    return {key: np.asarray([state[key] for state in states]) for key in keys}
+
+
+class PredicateConditionNode(ConditionNode):
+    '''
+    Condition given by a Predicate, or by a predicate spec in tree definitions.
+    '''
+    __slots__ = ('_predicate',)
+
+    def __init__(self, predicate):
+        super().__init__()
+        self._predicate = Predicate.from_spec(predicate)
+
+    @property
+    def predicate(self):
+        return self._predicate
+
+    def _eval(self, state):
+        return self._predicate.evaluate(state)
+
+    def eval_batch(self, states):
+        '''
+        Evaluates the condition over a batch of states (see stack_states()); returns a boolean array.
+        '''
+        return self._predicate.evaluate_batch(states)
+
+    @property
+    def dot_label(self):
+        return str(self._predicate)
@@ -0,0 +1,173 @@
+'''
+Offline rendering of runs recorded by run_tree(save_dir=...):
+
+    python -m iam_bt.render SAVE_DIR [--segment N] [--format png] [--workers N] [--gif run.gif] [--mp4 run.mp4] [--fps 5]
+
+The tree is laid out once with Graphviz `dot`; every frame reuses that layout through `neato -n2`,
+so frames only differ in colors and are rendered in parallel across a process pool.
+'''
+import os
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from .bt_status import BTStatus
+from .event_log import NO_STATUS, read_event_log
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_COLORS = {
+    BTStatus.RUNNING.value: 'goldenrod4',
+    BTStatus.SUCCESS.value: 'green',
+    BTStatus.FAILURE.value: 'red',
+}
+
+
+def _dot_escape(text):
+    return str(text).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def structure_to_dot(structure):
+    lines = ['digraph BT {', 'splines=false;']
+    for node_id, node in structure['nodes'].items():
+        lines.append(f'n{node_id} [label="{_dot_escape(node["label"])}", shape={node["shape"]}];')
+    for node_id, node in structure['nodes'].items():
+        for child_id in node['children']:
+            lines.append(f'n{node_id} -> n{child_id};')
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def layout(structure):
+    '''
+    Runs the Graphviz layout once and returns DOT source with node positions filled in.
+    '''
+    result = subprocess.run(['dot', '-Tdot'], input=structure_to_dot(structure).encode('utf-8'),
+                            stdout=subprocess.PIPE, check=True)
+    return result.stdout.decode('utf-8')
+
+
+def frame_colors(records, skip_running_nodes=True):
+    '''
+    Returns one {node id: color} per event in the event log `records`, highlighting the leaves that changed status in that event.
+    '''
+    frames = []
+    last_event = None
+    for event, leaf_id, leaf_status in zip(records['event'].tolist(), records['node'].tolist(), records['leaf_status'].tolist()):
+        if event != last_event:
+            frames.append({})
+            last_event = event
+        if leaf_status == NO_STATUS:
+            continue
+        if leaf_status == BTStatus.RUNNING.value and skip_running_nodes:
+            continue
+        frames[-1][leaf_id] = STATUS_COLORS[leaf_status]
+    return frames
+
+
+_worker_layout = None
+
+
+def _init_worker(laid_out_dot):
+    global _worker_layout
+    _worker_layout = laid_out_dot
+
+
+def _render_frame(colors, path, fmt):
+    # Later node statements add to earlier ones, so the colors can be appended without parsing the layout
+    overrides = ''.join(f'n{node_id} [color={color}, penwidth=2];\n' for node_id, color in colors.items())
+    source = _worker_layout[:_worker_layout.rindex('}')] + overrides + '}\n'
+    result = subprocess.run(['neato', '-n2', f'-T{fmt}'], input=source.encode('utf-8'), stdout=subprocess.PIPE, check=True)
+    Path(path).write_bytes(result.stdout)
+    return path
+
+
+def render_frames(save_dir, out_dir=None, fmt='png', workers=None, skip_running_nodes=None, segment=None):
+    '''
+    Renders one frame per recorded status transition into `out_dir` (by default `save_dir`, or `save_dir`/segment-N
+    for an earlier session kept as `segment`). Returns the frame paths in order.
+    '''
+    save_dir = Path(save_dir)
+    if out_dir is None:
+        out_dir = save_dir if segment is None else save_dir / f'segment-{segment}'
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    structure, _, records = read_event_log(save_dir, segment)
+    if skip_running_nodes is None:
+        skip_running_nodes = structure.get('skip_running_nodes', True)
+
+    laid_out_dot = layout(structure)
+    frames = frame_colors(records, skip_running_nodes)
+    paths = [out_dir / f'{frame:010d}.{fmt}' for frame in range(1, len(frames) + 1)]
+
+    workers = workers or os.cpu_count() or 1
+    logger.info(f'Rendering {len(frames)} frames to {out_dir} with {workers} workers')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(laid_out_dot,)) as pool:
+        chunksize = max(1, len(frames) // (8 * workers))
+        return list(pool.map(_render_frame, frames, paths, [fmt] * len(frames), chunksize=chunksize))
+
+
+def make_animation(frame_paths, out_path, fps=5):
+    '''
+    Writes PNG frames to an animated GIF or, with imageio-ffmpeg installed, an MP4, depending on `out_path`'s suffix.
+    '''
+    try:
+        import imageio.v2 as imageio
+    except ImportError:
+        raise ImportError('make_animation requires imageio (pip install imageio, plus imageio-ffmpeg for MP4)') from None
+    import numpy as np
+
+    out_path = Path(out_path)
+    images = [imageio.imread(path) for path in frame_paths]
+    # Graphviz sizes each frame to its contents, so pad them to a common size
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    if out_path.suffix == '.mp4':
+        # Most encoders need even dimensions
+        height, width = height + height % 2, width + width % 2
+    channels = max(image.shape[2] if image.ndim == 3 else 1 for image in images)
+    padded = []
+    for image in images:
+        if image.ndim == 2:
+            image = image[:, :, None]
+        canvas = np.full((height, width, channels), 255, dtype=np.uint8)
+        canvas[:image.shape[0], :image.shape[1], :image.shape[2]] = image
+        padded.append(canvas)
+
+    if out_path.suffix == '.gif':
+        imageio.mimsave(out_path, padded, duration=1. / fps)
+    elif out_path.suffix == '.mp4':
+        with imageio.get_writer(out_path, fps=fps) as writer:
+            for image in padded:
+                writer.append_data(image[:, :, :3])
+    else:
+        raise ValueError(f'Unsupported animation format {out_path.suffix!r}')
+    return out_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('save_dir', type=Path)
+    parser.add_argument('--out-dir', type=Path)
+    parser.add_argument('--segment', type=int, help='render an earlier session kept when the run was resumed')
+    parser.add_argument('--format', default='png', choices=['png', 'svg'])
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--show-running', action='store_true', help='also highlight nodes that are still running')
+    parser.add_argument('--gif', type=Path)
+    parser.add_argument('--mp4', type=Path)
+    parser.add_argument('--fps', type=float, default=5.)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    frame_paths = render_frames(args.save_dir, out_dir=args.out_dir, fmt=args.format, workers=args.workers,
+                                skip_running_nodes=False if args.show_running else None, segment=args.segment)
+    for animation_path in (args.gif, args.mp4):
+        if animation_path is not None:
+            if args.format != 'png':
+                parser.error('animations need --format png')
+            make_animation(frame_paths, animation_path, fps=args.fps)
+            logger.info(f'Wrote {animation_path}')
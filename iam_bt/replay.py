@@ -0,0 +1,185 @@
+import time
+import pickle
+import logging
+import threading
+from collections import namedtuple, deque
+
+from .domain_proxy import DomainProxy
+
+
+logger = logging.getLogger(__name__)
+
+RECORDING_MAGIC = b'IAMBTREC1\n'
+
+# kind is 'call' for method calls and 'attr' for attribute/property reads such as `domain.state`
+DomainRecord = namedtuple('DomainRecord', ['elapsed', 'kind', 'method', 'args', 'kwargs', 'result', 'error'])
+
+
+class ReplayMismatchError(RuntimeError):
+    pass
+
+
+class UnpicklableValue(namedtuple('UnpicklableValue', ['repr'])):
+    '''
+    Recorded in place of an argument, result or exception that could not be pickled.
+    '''
+
+
+class UnpicklableError(RuntimeError):
+    # Recorded in place of an exception that could not be pickled
+    pass
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return value
+    except Exception:
+        return UnpicklableValue(repr(value))
+
+
+class RecordingDomain(DomainProxy):
+    '''
+    Forwards everything to the wrapped domain and appends each call and its response
+    to an append-only pickle stream that ReplayDomain can play back.
+    '''
+
+    def __init__(self, domain, path):
+        super().__init__(domain)
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(RECORDING_MAGIC)
+        self._start = time.monotonic()
+        self._n_records = 0
+
+    @property
+    def n_records(self):
+        return self._n_records
+
+    def _append(self, kind, method, args, kwargs, result, error):
+        record = DomainRecord(time.monotonic() - self._start, kind, method, args, kwargs, result, error)
+        # Pickled in full before anything is written, so a value that can't be pickled doesn't leave half a record
+        try:
+            data = pickle.dumps(tuple(record), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            logger.warning(f'Recording a placeholder for what could not be pickled in {kind} {method}')
+            record = record._replace(
+                args=tuple(_picklable(arg) for arg in args),
+                kwargs={k: _picklable(v) for k, v in kwargs.items()},
+                result=_picklable(result),
+                error=error if error is None or not isinstance(_picklable(error), UnpicklableValue) else UnpicklableError(repr(error)))
+            data = pickle.dumps(tuple(record), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            self._n_records += 1
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            return super().__getattr__(name)
+
+        try:
+            attr = getattr(self._domain, name)
+        except AttributeError:
+            raise
+        except Exception as e:
+            # e.g. a `state` property whose RPC failed
+            self._append('attr', name, (), {}, None, e)
+            raise
+        if not callable(attr):
+            self._append('attr', name, (), {}, attr, None)
+            return attr
+
+        def recorded_call(*args, **kwargs):
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._append('call', name, args, kwargs, None, e)
+                raise
+            self._append('call', name, args, kwargs, result, None)
+            return result
+
+        return recorded_call
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        logger.info(f'Recorded {self._n_records} domain interactions to {self._path}')
+
+
+def read_recording(path):
+    with open(path, 'rb') as f:
+        magic = f.read(len(RECORDING_MAGIC))
+        if magic != RECORDING_MAGIC:
+            raise ValueError(f'{path} is not a domain recording')
+        while True:
+            try:
+                record = pickle.load(f)
+            except EOFError:
+                break
+            except pickle.UnpicklingError:
+                # A crash can leave a truncated last record behind; everything before it is usable
+                logger.warning(f'Ignoring truncated record at the end of {path}')
+                break
+            yield DomainRecord(*record)
+
+
+class ReplayDomain:
+    '''
+    Plays back a RecordingDomain file at full speed. Calls and attribute reads must arrive in the recorded
+    order; with check_args the arguments must match the recorded ones too.
+    '''
+
+    def __init__(self, path, check_args=False):
+        self._records = deque(read_recording(path))
+        self._n_total = len(self._records)
+        self._check_args = check_args
+        # Whether each recorded name was read as an attribute or called
+        self._kinds = {}
+        for record in self._records:
+            self._kinds.setdefault(record.method, set()).add(record.kind)
+
+    @property
+    def n_remaining(self):
+        return len(self._records)
+
+    @property
+    def n_replayed(self):
+        return self._n_total - len(self._records)
+
+    def _next_record(self, kind, method):
+        if not self._records:
+            raise ReplayMismatchError(f'Recording exhausted after {self._n_total} records, got {kind} {method}')
+        record = self._records[0]
+        if record.kind != kind or record.method != method:
+            raise ReplayMismatchError(f'Record {self.n_replayed} is {record.kind} {record.method}, got {kind} {method}')
+        return self._records.popleft()
+
+    @staticmethod
+    def _respond(record):
+        if record.error is not None:
+            raise record.error
+        if isinstance(record.result, UnpicklableValue):
+            raise ReplayMismatchError(f'{record.kind} {record.method} returned {record.result.repr}, which could not be recorded')
+        return record.result
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        kinds = self._kinds.get(name)
+        if kinds is None:
+            raise ReplayMismatchError(f'{name} was never used in the recording')
+        if kinds == {'attr'} or (len(kinds) > 1 and self._records and self._records[0][1:3] == ('attr', name)):
+            return self._respond(self._next_record('attr', name))
+
+        def replayed_call(*args, **kwargs):
+            record = self._next_record('call', name)
+            if self._check_args and pickle.dumps((args, kwargs)) != pickle.dumps((record.args, record.kwargs)):
+                raise ReplayMismatchError(f'{name} called with {args} {kwargs}, recorded {record.args} {record.kwargs}')
+            return self._respond(record)
+
+        return replayed_call
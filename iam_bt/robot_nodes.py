@@ -0,0 +1,122 @@
+import logging
+
+import numpy as np
+from autolab_core import RigidTransform
+from frankapy.utils import convert_rigid_transform_to_array
+
+from .bt import BTNode
+from .bt_status import BTStatus
+
+
+logger = logging.getLogger(__name__)
+
+
+def dmp_params_from_memory(dmp_info):
+    dmp_params = {}
+    quat_dmp_params = {}
+    dmp_params['dmp_type'] = dmp_info.dmp_type
+    dmp_params['tau'] = dmp_info.tau
+    dmp_params['alpha'] = dmp_info.alpha
+    dmp_params['beta'] = dmp_info.beta
+    dmp_params['num_dims'] = dmp_info.num_dims
+    dmp_params['num_basis'] = dmp_info.num_basis
+    dmp_params['num_sensors'] = dmp_info.num_sensors
+    dmp_params['mu'] = dmp_info.mu
+    dmp_params['h'] = dmp_info.h
+    dmp_params['phi_j'] = dmp_info.phi_j
+    dmp_params['weights'] = np.array(dmp_info.weights).reshape((dmp_info.num_dims,dmp_info.num_sensors,dmp_info.num_basis)).tolist()
+    if dmp_info.dmp_type == 0:
+        quat_dmp_params['tau'] = dmp_info.quat_tau
+        quat_dmp_params['alpha'] = dmp_info.quat_alpha
+        quat_dmp_params['beta'] = dmp_info.quat_beta
+        quat_dmp_params['num_dims'] = dmp_info.quat_num_dims
+        quat_dmp_params['num_basis'] = dmp_info.quat_num_basis
+        quat_dmp_params['num_sensors'] = dmp_info.quat_num_sensors
+        quat_dmp_params['mu'] = dmp_info.quat_mu
+        quat_dmp_params['h'] = dmp_info.quat_h
+        quat_dmp_params['phi_j'] = dmp_info.quat_phi_j
+        quat_dmp_params['weights'] = np.array(dmp_info.quat_weights).reshape((dmp_info.quat_num_dims,dmp_info.quat_num_sensors,dmp_info.quat_num_basis)).tolist()
+        dmp_params['quat_dmp_params'] = quat_dmp_params
+    return dmp_params
+
+
+def bokeh_trajectory_from_recording(recorded_trajectory):
+    skill_state_dict = recorded_trajectory['skill_state_dict']
+    bokeh_traj = {}
+    bokeh_traj['time_since_skill_started'] = list(skill_state_dict['time_since_skill_started'])
+    bokeh_traj['num_joints'] = 7
+    bokeh_traj['cart_traj'] = list(np.array(skill_state_dict['O_T_EE']).flatten())
+    bokeh_traj['joint_traj'] = list(skill_state_dict['q'].flatten())
+    return bokeh_traj
+
+
+# Order of the poses generated for every goal point in the blackboard's `goal_pose_array`
+GOAL_POSE_KINDS = ('intermediate', 'grasp')
+
+# Gripper pointing straight down
+_PICK_ROTATION = np.array([
+    [1, 0, 0],
+    [0, -1, 0],
+    [0, 0, -1],
+])
+
+_pose_template = None
+
+
+def _get_pose_template():
+    '''
+    Returns the flattened pose with zero translation and the indices that hold x, y and z,
+    taken from convert_rigid_transform_to_array so the batch poses match its layout.
+    '''
+    global _pose_template
+    if _pose_template is None:
+        base = np.asarray(convert_rigid_transform_to_array(RigidTransform(rotation=_PICK_ROTATION, translation=np.zeros(3))), dtype=np.float64)
+        translation_indices = []
+        for axis in range(3):
+            moved = np.asarray(convert_rigid_transform_to_array(RigidTransform(rotation=_PICK_ROTATION, translation=np.eye(3)[axis])))
+            translation_indices.append(int(np.flatnonzero(moved != base)[0]))
+        _pose_template = (base, translation_indices)
+    return _pose_template
+
+
+def pick_and_place_pose_array(goal_points, y_offset=-0.04, tong_height=0.22, intermediate_height_offset=0.11):
+    '''
+    Returns an (N, len(GOAL_POSE_KINDS), 16) array of flattened poses above and at each goal point.
+    '''
+    goal_xy = np.array([(goal_point.x, goal_point.y) for goal_point in goal_points], dtype=np.float64).reshape(-1, 2)
+    heights = np.array([tong_height + intermediate_height_offset, tong_height])
+
+    base, (x_idx, y_idx, z_idx) = _get_pose_template()
+    poses = np.tile(base, (len(goal_xy), len(GOAL_POSE_KINDS), 1))
+    poses[:, :, x_idx] = goal_xy[:, 0, None]
+    poses[:, :, y_idx] = goal_xy[:, 1, None] + y_offset
+    poses[:, :, z_idx] = heights[None, :]
+    return poses
+
+
+class GeneratePickAndPlacePositionsNode(BTNode):
+    '''
+    Generates the poses for every goal point at once into `goal_pose_array` (see pick_and_place_pose_array)
+    and `n_goal_poses`. `goal_poses` keeps holding the first goal's poses for skills that don't select a goal.
+    '''
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__()
+
+    def run(self, domain):
+        goal_points = self.blackboard['goal_points']
+        if len(goal_points) == 0:
+            logger.debug(f'{self} to yield failure b/c there are no goal points')
+            yield self, BTStatus.FAILURE, BTStatus.FAILURE
+            return
+
+        goal_pose_array = pick_and_place_pose_array(goal_points)
+        self.blackboard['goal_pose_array'] = goal_pose_array
+        self.blackboard['n_goal_poses'] = len(goal_pose_array)
+        self.blackboard['goal_poses'] = {kind: goal_pose_array[0, i].tolist() for i, kind in enumerate(GOAL_POSE_KINDS)}
+
+        logger.debug(f'{self} to yield success')
+        yield self, BTStatus.SUCCESS, BTStatus.SUCCESS
+
+    dot_label = 'Generate Pick and Place Positions'
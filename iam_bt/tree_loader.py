@@ -0,0 +1,249 @@
+import os
+import json
+import pickle
+import inspect
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from contextlib import nullcontext
+
+from . import bt
+
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of the compiled program changes so stale caches are ignored
+COMPILED_FORMAT_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path(os.environ.get('IAM_BT_CACHE_DIR', Path.home() / '.cache' / 'iam_bt' / 'trees'))
+
+
+class _NodeRegistry(dict):
+    '''
+    Node types that live in modules with heavy dependencies are only imported when a tree uses them.
+    '''
+
+    def __missing__(self, type_name):
+        if type_name in bt._LAZY_ATTRS:
+            cls = getattr(bt, type_name)
+            self[type_name] = cls
+            return cls
+        raise KeyError(type_name)
+
+
+NODE_REGISTRY = _NodeRegistry()
+
+_NODE_KEYS = ('children', 'child')
+_RESERVED_KEYS = ('type', 'args') + _NODE_KEYS
+
+
+class TreeDefinitionError(ValueError):
+    pass
+
+
+def register_node(cls=None, name=None):
+    '''
+    Makes a BTNode subclass available to tree definitions under its class name (or `name`).
+    Can be used as a plain call or as a class decorator.
+    '''
+    def register(cls):
+        if not (inspect.isclass(cls) and issubclass(cls, bt.BTNode)):
+            raise TypeError(f'{cls} is not a BTNode subclass')
+        NODE_REGISTRY[name or cls.__name__] = cls
+        return cls
+
+    if cls is None:
+        return register
+    return register(cls)
+
+
+def _register_builtin_nodes():
+    for _, cls in inspect.getmembers(bt, inspect.isclass):
+        if issubclass(cls, bt.BTNode) and cls.__module__ == bt.__name__ and not inspect.isabstract(cls):
+            register_node(cls)
+
+
+_register_builtin_nodes()
+
+
+class _NodeRef:
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __reduce__(self):
+        return (_NodeRef, (self.index,))
+
+
+class _Compiler:
+    '''
+    Validates a tree definition and flattens it into a post-ordered program of
+    (type name, args, kwargs) instructions where child nodes are _NodeRefs into the program.
+    '''
+
+    def __init__(self, definition, node_types):
+        if not isinstance(definition, dict) or 'root' not in definition:
+            raise TreeDefinitionError('Tree definition must be a mapping with a `root` entry')
+
+        self._params = definition.get('params', {}) or {}
+        self._subtrees = definition.get('subtrees', {}) or {}
+        self._root = definition['root']
+        self._node_types = node_types
+
+        self._program = []
+        self._subtree_refs = {}
+        self._subtrees_in_progress = set()
+
+    def compile(self):
+        root_ref = self._compile_node(self._root, 'root')
+        assert root_ref.index == len(self._program) - 1
+        return self._program
+
+    def _resolve_value(self, value, path):
+        if isinstance(value, dict):
+            if set(value.keys()) == {'$param'}:
+                param_name = value['$param']
+                if param_name not in self._params:
+                    raise TreeDefinitionError(f'{path}: unknown param {param_name!r}')
+                return self._params[param_name]
+            return {k: self._resolve_value(v, f'{path}.{k}') for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._resolve_value(v, f'{path}[{i}]') for i, v in enumerate(value)]
+        return value
+
+    def _compile_subtree(self, name, path):
+        if name in self._subtree_refs:
+            return self._subtree_refs[name]
+        if name not in self._subtrees:
+            raise TreeDefinitionError(f'{path}: unknown subtree {name!r}')
+        if name in self._subtrees_in_progress:
+            raise TreeDefinitionError(f'{path}: subtree {name!r} references itself')
+
+        self._subtrees_in_progress.add(name)
+        ref = self._compile_node(self._subtrees[name], f'subtrees.{name}')
+        self._subtrees_in_progress.remove(name)
+
+        self._subtree_refs[name] = ref
+        return ref
+
+    def _compile_node(self, spec, path):
+        if not isinstance(spec, dict):
+            raise TreeDefinitionError(f'{path}: node must be a mapping, got {type(spec).__name__}')
+        if '$ref' in spec:
+            if len(spec) != 1:
+                raise TreeDefinitionError(f'{path}: $ref cannot be combined with other keys')
+            return self._compile_subtree(spec['$ref'], path)
+
+        type_name = spec.get('type')
+        try:
+            node_type = self._node_types[type_name]
+        except (KeyError, TypeError):
+            raise TreeDefinitionError(f'{path}: unknown node type {type_name!r}') from None
+        path = f'{path}<{type_name}>'
+
+        args = self._resolve_value(spec.get('args', []), f'{path}.args')
+        if not isinstance(args, list):
+            raise TreeDefinitionError(f'{path}: args must be a list')
+        kwargs = {k: self._resolve_value(v, f'{path}.{k}') for k, v in spec.items() if k not in _RESERVED_KEYS}
+
+        if 'children' in spec:
+            children = spec['children']
+            if not isinstance(children, list) or len(children) == 0:
+                raise TreeDefinitionError(f'{path}: children must be a non-empty list')
+            kwargs['children'] = [self._compile_node(child, f'{path}.children[{i}]') for i, child in enumerate(children)]
+        if 'child' in spec:
+            kwargs['child'] = self._compile_node(spec['child'], f'{path}.child')
+
+        try:
+            inspect.signature(node_type).bind(*args, **kwargs)
+        except TypeError as e:
+            raise TreeDefinitionError(f'{path}: {e}') from None
+
+        self._program.append((type_name, args, kwargs))
+        return _NodeRef(len(self._program) - 1)
+
+
+def compile_tree_definition(definition, node_types=None):
+    return _Compiler(definition, node_types if node_types is not None else NODE_REGISTRY).compile()
+
+
+def build_tree(program, node_types=None, first_node_id=None):
+    '''
+    Builds the nodes of a compiled program. They take the next free node ids, or consecutive ids
+    from `first_node_id` if given (see bt.node_id_scope).
+    '''
+    node_types = node_types if node_types is not None else NODE_REGISTRY
+
+    def resolve(value):
+        if isinstance(value, _NodeRef):
+            return nodes[value.index]
+        if isinstance(value, list) and value and isinstance(value[0], _NodeRef):
+            return [nodes[v.index] for v in value]
+        return value
+
+    nodes = []
+    with bt.node_id_scope(first_node_id) if first_node_id is not None else nullcontext():
+        for type_name, args, kwargs in program:
+            try:
+                node_type = node_types[type_name]
+            except KeyError:
+                raise TreeDefinitionError(f'Unknown node type {type_name!r}; was it registered before loading?') from None
+            kwargs = {k: resolve(v) for k, v in kwargs.items()}
+            nodes.append(node_type(*args, **kwargs))
+    return nodes[-1]
+
+
+def _parse_definition(path, source):
+    if path.suffix in ('.yaml', '.yml'):
+        import yaml
+        return yaml.safe_load(source)
+    if path.suffix == '.json':
+        return json.loads(source)
+    raise TreeDefinitionError(f'Unsupported tree definition format {path.suffix!r}')
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_tree(path, cache_dir=DEFAULT_CACHE_DIR, node_types=None):
+    '''
+    Loads a tree from a YAML or JSON definition. The validated, compiled program is cached
+    in `cache_dir` keyed by the file's hash, so unchanged definitions skip parsing and validation.
+    Pass cache_dir=None to disable the cache.
+    '''
+    path = Path(path)
+    source = path.read_bytes()
+
+    cache_path = None
+    if cache_dir is not None:
+        digest = hashlib.sha256(source).hexdigest()
+        cache_path = Path(cache_dir) / f'{path.stem}-{digest[:32]}-v{COMPILED_FORMAT_VERSION}.pkl'
+        if cache_path.exists():
+            try:
+                program = pickle.loads(cache_path.read_bytes())
+            except Exception as e:
+                logger.warning(f'Ignoring unreadable compiled tree {cache_path}: {e}')
+            else:
+                logger.debug(f'Loaded compiled tree {cache_path}')
+                return build_tree(program, node_types)
+
+    program = compile_tree_definition(_parse_definition(path, source), node_types)
+
+    if cache_path is not None:
+        try:
+            _write_atomic(cache_path, pickle.dumps(program, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as e:
+            logger.warning(f'Could not cache compiled tree to {cache_path}: {e}')
+
+    return build_tree(program, node_types)
@@ -1,4 +1,5 @@
-from .bt_status import BTStatus
+import time
+
 from shortuuid import uuid
 
 def merge_graphs(base_graph, new_graph):
@@ -10,37 +11,67 @@ def merge_graphs(base_graph, new_graph):
     return base_graph
 
 
-def run_tree(tree, domain, save_dir=None, skip_running_nodes=True):
+def run_tree(tree, domain, save_dir=None, skip_running_nodes=True, context=None, tick_rate=None, same_tick=True, monitor=None,
+             checkpoint_dir=None, checkpoint_interval=5., resume=False):
+    '''
+    Runs `tree` to completion. Pass a fresh RunContext to give this run its own blackboard;
+    by default the process-wide context is used. With `tick_rate` set, ticks are paced to that rate.
+    With `save_dir`, the tree structure and every status transition are logged there (see iam_bt.event_log);
+    render them afterwards with iam_bt.render. Pass a TreeMonitor (iam_bt.monitor) to watch the run live instead.
+
+    With `checkpoint_dir`, the run is checkpointed every `checkpoint_interval` seconds (see iam_bt.checkpoint)
+    and the checkpoint is removed once the tree finishes; with `resume`, a run that was cut short carries on from it,
+    and the event log of the earlier session is kept as a numbered segment of `save_dir`.
+    '''
+    from .context import get_default_context
+    from .executor import TreeSession
+
+    context = context if context is not None else get_default_context()
+    tick_count = 0
+    resumed = False
+    checkpointer = None
+    if checkpoint_dir is not None:
+        from .checkpoint import Checkpointer, has_checkpoint, load_checkpoint
+        if resume and has_checkpoint(checkpoint_dir):
+            context, tick_count = load_checkpoint(checkpoint_dir, tree, context)
+            resumed = True
+        checkpointer = Checkpointer(checkpoint_dir, interval=checkpoint_interval)
+
+    session = TreeSession(tree, domain, context=context, tick_rate=tick_rate, same_tick=same_tick)
+    session.tick_count = tick_count
+    if monitor is not None:
+        session.add_observer(monitor)
+
+    event_log = None
     if save_dir is not None:
-        save_dir.mkdir(parents=True, exist_ok=True)
-        _, graph = tree.get_dot_graph()
-
-    status_gen = tree.run(domain)
-    tick = 0
-    for leaf_bt_nodes, leaf_statuses, _ in status_gen:
-        tick += 1
-
-        if save_dir is not None:
-            if not isinstance(leaf_bt_nodes, list):
-                leaf_bt_nodes = [leaf_bt_nodes]
-                leaf_statuses = [leaf_statuses]
-
-            for leaf_bt_node, leaf_status in zip(leaf_bt_nodes, leaf_statuses):
-                leaf_dot_node = graph.get_node(leaf_bt_node.uuid_str)[0]
-                if leaf_status == BTStatus.RUNNING:
-                    if skip_running_nodes:
-                        continue
-                    else:
-                        leaf_dot_node.set_color('goldenrod4')
-                elif leaf_status == BTStatus.SUCCESS:
-                    leaf_dot_node.set_color('green')
-                elif leaf_status == BTStatus.FAILURE:
-                    leaf_dot_node.set_color('red')
-            
-            img_path = save_dir / f'{tick:010d}.png'
-            graph.write_png(img_path)         
+        from .event_log import EventLogWriter, archive_event_log
+        if resumed:
+            # Keeps the log of the session that was cut short
+            archive_event_log(save_dir)
+        event_log = EventLogWriter(tree, save_dir, skip_running_nodes=skip_running_nodes)
+        session.add_observer(event_log)
+    if checkpointer is not None:
+        session.add_observer(checkpointer)
+
+    next_tick_time = time.monotonic()
+    try:
+        while True:
+            if session.period > 0:
+                delay = next_tick_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_tick_time = max(next_tick_time + session.period, time.monotonic())
 
-            leaf_dot_node.set_color('black')
+            if session.tick() is None:
+                break
+    finally:
+        # Keeps the events leading up to a crash
+        if event_log is not None:
+            event_log.close()
+        if checkpointer is not None:
+            checkpointer.close()
+    if checkpointer is not None:
+        checkpointer.clear()
 
 def assign_unique_name(param_dict):
     '''
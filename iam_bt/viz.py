@@ -0,0 +1,35 @@
+from pydot import Dot, Edge, Node
+
+from .bt import BTNode
+from .utils import merge_graphs
+
+
+def create_dot_graph():
+    return Dot('BT', graph_type='digraph', splines=False)
+
+
+def _add_subtree(graph, bt_node, added):
+    # Shared subtrees are drawn once and get an edge from every parent
+    if bt_node.uuid_str in added:
+        return added[bt_node.uuid_str]
+
+    this_node = Node(bt_node.uuid_str, label=bt_node.dot_label, shape=bt_node.dot_shape)
+    graph.add_node(this_node)
+    added[bt_node.uuid_str] = this_node
+
+    for child in bt_node.children:
+        if type(child).get_dot_graph is BTNode.get_dot_graph:
+            child_root_node = _add_subtree(graph, child, added)
+        else:
+            # Nodes that draw themselves still get merged in
+            child_root_node, child_graph = child.get_dot_graph()
+            merge_graphs(graph, child_graph)
+        graph.add_edge(Edge(this_node, child_root_node))
+
+    return this_node
+
+
+def get_dot_graph(bt_node):
+    graph = create_dot_graph()
+    this_node = _add_subtree(graph, bt_node, {})
+    return this_node, graph
@@ -0,0 +1,79 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    '''
+    Runs slow writes such as image saves off the tick thread. At most `max_pending` writes are queued
+    or running at once; try_submit() refuses more so that nodes wait a tick instead of piling up work.
+    With the default single worker, writes run in the order they were submitted.
+    '''
+
+    def __init__(self, max_pending=4, workers=1):
+        assert max_pending > 0
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bt-write-behind')
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._n_rejected = 0
+
+    @property
+    def n_pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    @property
+    def n_rejected(self):
+        return self._n_rejected
+
+    def try_submit(self, fn, *args, **kwargs):
+        '''
+        Returns a Future for `fn(*args, **kwargs)`, or None if the queue is full.
+        '''
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._n_rejected += 1
+                return None
+            future = self._pool.submit(fn, *args, **kwargs)
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.debug(f'write-behind job failed: {future.exception()}')
+
+    def flush(self, timeout=None):
+        '''
+        Waits for every queued write. Returns True if all of them finished within `timeout`.
+        '''
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        return len(not_done) == 0
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_write_behind_queue(queue=True):
+    '''
+    Returns `queue` if it is a WriteBehindQueue, otherwise the process-wide default queue.
+    '''
+    global _default_queue
+    if isinstance(queue, WriteBehindQueue):
+        return queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = WriteBehindQueue()
+        return _default_queue
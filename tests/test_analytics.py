@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from iam_bt.analytics import analyze, format_report, leaf_spans
+from iam_bt.bt import Sequence, Parallel, SkillNode
+from iam_bt.event_log import EventLog, read_event_log, STRUCTURE_FILE, EVENTS_FILE
+from iam_bt.monitor import tree_structure
+
+RUNNING, SUCCESS = 0, 1
+
+
+def _write_log(save_dir):
+    '''
+    Writes the log of a run of Sequence([Parallel([Sequence([reach, grasp]), look]), lift]) with made-up times.
+    '''
+    reach, grasp, look, lift = (SkillNode(name, {}) for name in ('reach', 'grasp', 'look', 'lift'))
+    parallel = Parallel([Sequence([reach, grasp]), look], 2)
+    tree = Sequence([parallel, lift])
+    (save_dir / STRUCTURE_FILE).write_text(json.dumps(tree_structure(tree)))
+
+    events = [
+        (0., [(reach, RUNNING), (look, RUNNING)]),
+        (1., [(reach, SUCCESS), (look, RUNNING)]),
+        (1., [(grasp, RUNNING), (look, RUNNING)]),
+        (2.5, [(grasp, RUNNING), (look, SUCCESS)]),
+        (3., [(grasp, SUCCESS), (look, SUCCESS)]),
+        (6., [(lift, RUNNING)]),
+        (8., [(lift, SUCCESS)]),
+    ]
+    log = EventLog(save_dir / EVENTS_FILE)
+    for event, (t, leaves) in enumerate(events):
+        for node, leaf_status in leaves:
+            log.append(event, t, event, node.id, leaf_status, RUNNING)
+    log.close()
+    return parallel
+
+
+def test_leaf_spans(tmp_path):
+    _write_log(tmp_path)
+    structure, _, records = read_event_log(tmp_path)
+    spans = {structure['nodes'][span.node]['label']: (span.start, span.end, span.status) for span in leaf_spans(records)}
+    assert spans == {
+        'reach': (0., 1., 'success'),
+        'grasp': (1., 3., 'success'),
+        'look': (0., 2.5, 'success'),
+        'lift': (6., 8., 'success'),
+    }
+
+
+def test_report(tmp_path):
+    parallel = _write_log(tmp_path)
+    report = analyze(tmp_path)
+
+    assert report['duration'] == 8.
+    assert {label: summary['total'] for label, summary in report['skills'].items()} == {'reach': 1., 'grasp': 2., 'look': 2.5, 'lift': 2.}
+    assert report['skill_idle_gaps']['by_transition']['grasp -> lift']['total'] == 3.
+    assert report['skill_idle_gaps']['total']['total'] == 3.
+
+    parallel_report = report['parallels'][parallel.id]
+    assert parallel_report['duration']['total'] == 3.
+    sequence_child, look_child = parallel_report['children']
+    assert (sequence_child['critical'], look_child['critical']) == (1, 0)
+    assert look_child['slack']['total'] == pytest.approx(0.5)
+    assert parallel_report['critical_path'] == {'grasp': 2., 'reach': 1.}
+
+    assert 'grasp -> lift' in format_report(report)
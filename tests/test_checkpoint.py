@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from iam_bt.bt import Sequence, SkillNode
+from iam_bt.checkpoint import Checkpointer, load_checkpoint, tree_fingerprint, ARRAYS_DIR
+from iam_bt.context import RunContext
+from iam_bt.event_log import archived_segments, read_event_log
+from iam_bt.utils import run_tree
+
+
+class FakeSession:
+
+    def __init__(self, tree, context):
+        self.name = 'fake'
+        self.tree = tree
+        self.context = context
+        self.tick_count = 0
+
+
+def test_checkpointer_reuses_unchanged_arrays(tmp_path):
+    tree = Sequence([SkillNode('grasp', {}), SkillNode('release', {})])
+    context = RunContext()
+    image = np.arange(1 << 16, dtype=np.float32)
+    context.blackboard['image'] = image
+    context.blackboard['count'] = 1
+    session = FakeSession(tree, context)
+
+    checkpointer = Checkpointer(tmp_path, interval=0.)
+    checkpointer.save(session)
+    assert checkpointer.flush(timeout=10)
+    (array_file,) = (tmp_path / ARRAYS_DIR).iterdir()
+    written_at = array_file.stat().st_mtime_ns
+
+    context.blackboard['count'] = 2
+    session.tick_count = 1
+    checkpointer.save(session)
+    assert checkpointer.flush(timeout=10)
+    assert [path.name for path in (tmp_path / ARRAYS_DIR).iterdir()] == [array_file.name]
+    assert array_file.stat().st_mtime_ns == written_at
+
+    restored, tick_count = load_checkpoint(tmp_path, tree)
+    assert tick_count == 1 and restored.blackboard['count'] == 2
+    np.testing.assert_array_equal(restored.blackboard['image'], image)
+
+    context.blackboard['image'] = image + 1
+    checkpointer.save(session)
+    checkpointer.close()
+    assert [path.name for path in (tmp_path / ARRAYS_DIR).iterdir()] != [array_file.name]
+    np.testing.assert_array_equal(load_checkpoint(tmp_path, tree)[0].blackboard['image'], image + 1)
+
+    checkpointer.clear()
+    assert not any(tmp_path.iterdir())
+
+
+class CrashingDomain:
+
+    def __init__(self, crash_on=None):
+        self.crash_on = crash_on
+        self.skills = []
+        self._polls = []
+
+    def run_skill(self, skill_name, param):
+        self.skills.append(skill_name)
+        self._polls.append(0)
+        return len(self.skills) - 1
+
+    def get_skill_status(self, skill_id):
+        self._polls[skill_id] += 1
+        if self._polls[skill_id] == 1:
+            return 'running'
+        if self.skills[skill_id] == self.crash_on:
+            raise ConnectionError('domain went away')
+        return 'success'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+
+def _build_tree():
+    return Sequence([SkillNode('reach', {}), SkillNode('grasp', {}), SkillNode('lift', {})], prefetch=False)
+
+
+def test_fingerprint_does_not_depend_on_node_ids():
+    tree = _build_tree()
+    [SkillNode('unrelated', {}) for _ in range(5)]
+    assert tree_fingerprint(_build_tree()) == tree_fingerprint(tree)
+    assert tree_fingerprint(Sequence([SkillNode('reach', {})])) != tree_fingerprint(tree)
+
+
+def test_resume_in_a_new_process_keeps_the_log_of_the_crashed_session(tmp_path):
+    save_dir, checkpoint_dir = tmp_path / 'run', tmp_path / 'checkpoint'
+    domain = CrashingDomain(crash_on='grasp')
+    with pytest.raises(ConnectionError):
+        # Paced so that every tick's checkpoint is written before the next one is due
+        run_tree(_build_tree(), domain, save_dir=save_dir, context=RunContext(), tick_rate=20,
+                 checkpoint_dir=checkpoint_dir, checkpoint_interval=0.)
+    assert domain.skills == ['reach', 'grasp']
+
+    # Built with other node ids, as after a restart
+    [SkillNode('unrelated', {}) for _ in range(5)]
+    domain = CrashingDomain()
+    run_tree(_build_tree(), domain, save_dir=save_dir, context=RunContext(),
+             checkpoint_dir=checkpoint_dir, checkpoint_interval=0., resume=True)
+    assert domain.skills == ['grasp', 'lift']
+
+    assert archived_segments(save_dir) == [1]
+    crashed_structure, _, crashed_records = read_event_log(save_dir, 1)
+    structure, _, records = read_event_log(save_dir)
+    labels = lambda structure, records: [structure['nodes'][node]['label'] for node in records['node'].tolist()]
+    assert labels(crashed_structure, crashed_records) == ['reach', 'reach', 'grasp']
+    assert labels(structure, records)[:3] == ['grasp', 'grasp', 'lift']
@@ -0,0 +1,87 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from iam_bt.coalescing import CoalescingDomain
+
+
+class CountingDomain:
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    @property
+    def state(self):
+        self.calls.append('state')
+        return {'n_calls': len(self.calls)}
+
+    def get_skill_status(self, skill_id):
+        self.calls.append(('get_skill_status', skill_id))
+        self.release.wait()
+        return 'running'
+
+    def get_memory_objects(self, names):
+        self.calls.append('get_memory_objects')
+        if names is None:
+            raise ConnectionError('no memory')
+        return {name: None for name in names}
+
+    def run_skill(self, skill_name, param):
+        self.calls.append('run_skill')
+        return 0
+
+
+def test_reads_are_memoized_until_the_next_tick():
+    domain = CountingDomain()
+    coalescing = CoalescingDomain(domain)
+    assert coalescing.state is coalescing.state
+    assert coalescing.get_skill_status(1) == coalescing.get_skill_status(1) == 'running'
+    coalescing.get_skill_status(2)
+    assert domain.calls == ['state', ('get_skill_status', 1), ('get_skill_status', 2)]
+    assert coalescing.stats()['hits'] == 2 and coalescing.stats()['misses'] == 3
+
+    coalescing.begin_tick()
+    coalescing.get_skill_status(1)
+    assert domain.calls[-1] == ('get_skill_status', 1)
+    assert len(domain.calls) == 4
+
+
+def test_writes_clear_the_cache():
+    domain = CountingDomain()
+    coalescing = CoalescingDomain(domain)
+    before = coalescing.state
+    assert coalescing.run_skill('grasp', '{}') == 0
+    assert coalescing.state != before
+    assert domain.calls == ['state', 'run_skill', 'state']
+
+
+def test_failed_reads_are_not_cached():
+    domain = CountingDomain()
+    coalescing = CoalescingDomain(domain)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            coalescing.get_memory_objects(None)
+    # Unhashable arguments are frozen into the cache key
+    assert coalescing.get_memory_objects(['box']) is coalescing.get_memory_objects(['box'])
+    assert domain.calls == ['get_memory_objects'] * 3
+
+
+def test_concurrent_reads_are_merged():
+    domain = CountingDomain()
+    domain.release.clear()
+    coalescing = CoalescingDomain(domain)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(coalescing.get_skill_status, 1) for _ in range(4)]
+        try:
+            deadline = time.monotonic() + 5.
+            while coalescing.stats()['merged'] < 3:
+                assert time.monotonic() < deadline
+                time.sleep(0.001)
+        finally:
+            domain.release.set()
+        assert [future.result() for future in futures] == ['running'] * 4
+    assert domain.calls == [('get_skill_status', 1)]
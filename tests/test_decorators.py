@@ -0,0 +1,78 @@
+import time
+
+from iam_bt.bt import SkillNode, Timeout, Retry, RetryWithBackoff
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+
+
+class ScriptedDomain:
+    '''
+    Every skill reports the statuses of the next script in turn, then keeps reporting the last one.
+    '''
+
+    def __init__(self, *scripts):
+        self._scripts = list(scripts)
+        self.skills = []
+        self.cancelled = []
+
+    def run_skill(self, skill_name, param):
+        self.skills.append(list(self._scripts.pop(0)))
+        return len(self.skills) - 1
+
+    def get_skill_status(self, skill_id):
+        script = self.skills[skill_id]
+        return script.pop(0) if len(script) > 1 else script[0]
+
+    def cancel_skill(self, skill_id):
+        self.cancelled.append(skill_id)
+
+
+def _run(tree, domain, tick_period=0.005):
+    session = TreeSession(tree, domain, context=RunContext())
+    start = time.monotonic()
+    while session.tick() is not None:
+        time.sleep(tick_period)
+    return session.status, time.monotonic() - start
+
+
+def test_timeout_fails_and_halts_a_skill_that_runs_over():
+    domain = ScriptedDomain(['running'])
+    status, elapsed = _run(Timeout(SkillNode('grasp', {}), 0.05), domain)
+    assert status == BTStatus.FAILURE
+    assert 0.05 <= elapsed < 1.
+    assert domain.cancelled == [0]
+
+
+def test_timeout_passes_on_the_outcome_of_a_skill_that_finishes_in_time():
+    domain = ScriptedDomain(['running', 'success'])
+    assert _run(Timeout(SkillNode('grasp', {}), 10.), domain)[0] == BTStatus.SUCCESS
+    domain = ScriptedDomain(['running', 'failure'])
+    assert _run(Timeout(SkillNode('grasp', {}), 10.), domain)[0] == BTStatus.FAILURE
+    assert domain.cancelled == []
+
+
+def test_retry_runs_the_child_again_until_it_succeeds():
+    domain = ScriptedDomain(['failure'], ['running', 'failure'], ['success'], ['success'])
+    status, _ = _run(Retry(SkillNode('grasp', {}), 3), domain)
+    assert status == BTStatus.SUCCESS
+    assert len(domain.skills) == 3
+
+
+def test_retry_fails_after_max_attempts():
+    domain = ScriptedDomain(['failure'], ['failure'], ['failure'])
+    status, _ = _run(Retry(SkillNode('grasp', {}), 2), domain)
+    assert status == BTStatus.FAILURE
+    assert len(domain.skills) == 2
+
+
+def test_retry_with_backoff_waits_between_attempts():
+    domain = ScriptedDomain(['failure'], ['failure'], ['failure'])
+    status, elapsed = _run(RetryWithBackoff(SkillNode('grasp', {}), 3, initial_delay=0.05, factor=2.), domain)
+    assert status == BTStatus.FAILURE
+    assert len(domain.skills) == 3
+    # 0.05s after the first failure and 0.1s after the second
+    assert 0.15 <= elapsed < 1.
+
+    retry = RetryWithBackoff(SkillNode('grasp', {}), 5, initial_delay=1., factor=3., max_delay=5.)
+    assert [retry._delay(n_failures) for n_failures in range(1, 5)] == [1., 3., 5., 5.]
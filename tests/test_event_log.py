@@ -0,0 +1,94 @@
+import numpy as np
+
+from iam_bt.bt import Sequence, Parallel, SkillNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.event_log import (EventLogWriter, read_event_log, archive_event_log, archived_segments, _flatten,
+                              EVENTS_FILE, NO_NODE, NO_STATUS)
+from iam_bt.executor import TreeSession
+
+
+class FakeDomain:
+
+    def __init__(self, skill_polls):
+        self._skill_polls = skill_polls
+        self._skills = []
+        self._polls = []
+
+    def run_skill(self, skill_name, param):
+        self._skills.append(skill_name)
+        self._polls.append(0)
+        return len(self._polls) - 1
+
+    def get_skill_status(self, skill_id):
+        self._polls[skill_id] += 1
+        return 'success' if self._polls[skill_id] >= self._skill_polls[self._skills[skill_id]] else 'running'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+
+def _tree():
+    return Parallel([
+        Parallel([SkillNode('reach', {}), Sequence([SkillNode('grasp', {}), SkillNode('lift', {})])], 2),
+        SkillNode('look', {}),
+    ], 2)
+
+
+def _record(tree, save_dir, skill_polls):
+    # Expected records: (tick, event, node id, leaf status, status) per leaf of every event
+    expected = []
+
+    def collect(session):
+        for leaf_nodes, leaf_statuses, status in session.tick_events:
+            event = len(set(record[1] for record in expected))
+            for leaf_node, leaf_status in _flatten(leaf_nodes, leaf_statuses):
+                expected.append((session.tick_count, event, NO_NODE if leaf_node is None else leaf_node.id,
+                                 NO_STATUS if leaf_node is None else leaf_status.value, status.value))
+
+    writer = EventLogWriter(tree, save_dir, chunk_records=4)
+    session = TreeSession(tree, FakeDomain(skill_polls), context=RunContext())
+    session.add_observer(collect)
+    session.add_observer(writer)
+    while session.tick() is not None:
+        pass
+    writer.close()
+    return session, expected
+
+
+def test_round_trip_of_nested_parallels(tmp_path):
+    tree = _tree()
+    session, expected = _record(tree, tmp_path, {'reach': 2, 'grasp': 2, 'lift': 3, 'look': 4})
+    assert session.status == BTStatus.SUCCESS
+
+    structure, header, records = read_event_log(tmp_path)
+    assert structure['root'] == tree.id
+    assert structure['nodes'][tree.id]['children'] == [child.id for child in tree.children]
+    assert records.dtype.names == ('tick', 'time', 'event', 'node', 'leaf_status', 'status')
+    assert list(zip(records['tick'].tolist(), records['event'].tolist(), records['node'].tolist(),
+                    records['leaf_status'].tolist(), records['status'].tolist())) == expected
+    # Every event of the nested Parallels reports one leaf per skill branch
+    assert set(np.bincount(records['event']).tolist()) == {3}
+    assert np.all(np.diff(records['time']) >= 0)
+    assert records['time'][0] >= header['start_time']
+
+
+def test_record_cut_short_is_dropped(tmp_path):
+    _record(_tree(), tmp_path, {'reach': 1, 'grasp': 1, 'lift': 1, 'look': 1})
+    n_records = len(read_event_log(tmp_path)[2])
+
+    events_path = tmp_path / EVENTS_FILE
+    events_path.write_bytes(events_path.read_bytes()[:-3])
+    assert len(read_event_log(tmp_path)[2]) == n_records - 1
+
+
+def test_archived_segments_are_kept(tmp_path):
+    assert archive_event_log(tmp_path) is None
+    first, _ = _record(_tree(), tmp_path, {'reach': 1, 'grasp': 1, 'lift': 1, 'look': 1})
+    assert archive_event_log(tmp_path) == 1
+    second, _ = _record(_tree(), tmp_path, {'reach': 3, 'grasp': 1, 'lift': 1, 'look': 1})
+    assert archive_event_log(tmp_path) == 2
+    assert archived_segments(tmp_path) == [1, 2]
+    assert read_event_log(tmp_path, 1)[2]['tick'][-1] == first.tick_count
+    assert read_event_log(tmp_path, 2)[2]['tick'][-1] == second.tick_count
+    assert first.tick_count != second.tick_count
@@ -0,0 +1,54 @@
+from iam_bt.bt import Sequence, Parallel, SkillNode, ConstantConditionNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+
+
+class FakeDomain:
+
+    def __init__(self, skill_polls=2):
+        self._skill_polls = skill_polls
+        self._polls = []
+        self.state = {}
+
+    def run_skill(self, skill_name, param):
+        self._polls.append(0)
+        return len(self._polls) - 1
+
+    def get_skill_status(self, skill_id):
+        self._polls[skill_id] += 1
+        return 'success' if self._polls[skill_id] >= self._skill_polls else 'running'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+
+def test_same_tick_events_of_parallel_are_snapshots():
+    branches = [Sequence([ConstantConditionNode(True), ConstantConditionNode(True), SkillNode('grasp', {})]) for _ in range(2)]
+    conditions = [[c.id for c in branch.children[:2]] for branch in branches]
+    skills = [branch.children[2].id for branch in branches]
+    session = TreeSession(Parallel(branches, 2), FakeDomain(), context=RunContext())
+
+    session.tick()
+    events = [([node.id for node in leaf_nodes], list(leaf_statuses), status) for leaf_nodes, leaf_statuses, status in session.tick_events]
+    assert events == [
+        ([conditions[0][0], conditions[1][0]], [BTStatus.SUCCESS, BTStatus.SUCCESS], BTStatus.RUNNING),
+        ([conditions[0][1], conditions[1][1]], [BTStatus.SUCCESS, BTStatus.SUCCESS], BTStatus.RUNNING),
+        (skills, [BTStatus.RUNNING, BTStatus.RUNNING], BTStatus.RUNNING),
+    ]
+
+
+def test_same_tick_stops_at_running_leaves_of_nested_parallels():
+    domain = FakeDomain(skill_polls=3)
+    tree = Parallel([Parallel([SkillNode('grasp', {}), SkillNode('release', {})], 2) for _ in range(2)], 2)
+    session = TreeSession(tree, domain, context=RunContext())
+
+    session.tick()
+    assert len(session.tick_events) == 1
+    leaf_nodes, leaf_statuses, status = session.tick_events[0]
+    assert leaf_statuses == [[BTStatus.RUNNING, BTStatus.RUNNING], [BTStatus.RUNNING, BTStatus.RUNNING]]
+    assert domain._polls == [1, 1, 1, 1]
+
+    while session.tick() is not None:
+        pass
+    assert session.status == BTStatus.SUCCESS
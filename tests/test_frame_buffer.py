@@ -0,0 +1,33 @@
+import sys
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from iam_bt.frame_buffer import FrameRingBuffer
+
+
+_READER = '''
+import sys
+from iam_bt.frame_buffer import FrameRingBuffer
+buffer = FrameRingBuffer.attach(sys.argv[1])
+print(int(buffer.latest(copy=True).rgb.sum()))
+buffer.close()
+'''
+
+
+def test_segment_outlives_a_reader_process():
+    buffer = FrameRingBuffer.create((4, 4, 3), n_slots=2)
+    try:
+        buffer.write(np.ones((4, 4, 3), dtype=np.uint8))
+        for _ in range(2):
+            result = subprocess.run([sys.executable, '-c', _READER, buffer.name], capture_output=True, text=True,
+                                    cwd=Path(__file__).parent.parent, check=True)
+            assert result.stdout.strip() == '48'
+            assert 'leaked' not in result.stderr
+
+        reader = FrameRingBuffer.attach(buffer.name)
+        assert reader.latest(copy=True).index == 0
+        reader.close()
+    finally:
+        buffer.close()
@@ -0,0 +1,47 @@
+import threading
+
+import numpy as np
+
+from iam_bt.image_pipeline import ImagePipeline, EncodedImage
+
+
+class CountingPipeline(ImagePipeline):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.encoded = []
+        self._encoded_lock = threading.Lock()
+
+    def _encode(self, image):
+        with self._encoded_lock:
+            # Only a summary, so the arrays can be freed
+            self.encoded.append(int(image.max()))
+        return EncodedImage(b'', self.image_format, image.shape[1], image.shape[0], 1.)
+
+
+def test_frames_are_encoded_once_per_array():
+    pipeline = CountingPipeline()
+    try:
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        first = pipeline.submit(image)
+        assert pipeline.submit(image) is first
+        first.result()
+
+        # Equal content in another array is another frame; nothing is hashed to find out
+        pipeline.submit(image.copy()).result()
+        assert len(pipeline.encoded) == 2
+
+        assert pipeline.submit(np.ones((4, 4, 3), dtype=np.uint8), key=('frame', 7)) is pipeline.submit(image, key=('frame', 7))
+    finally:
+        pipeline.shutdown()
+
+
+def test_reused_array_id_is_not_mistaken_for_a_cached_frame():
+    pipeline = CountingPipeline()
+    try:
+        pipeline.submit(np.zeros((8, 8, 3), dtype=np.uint8)).result()
+        # The first array is freed, so this one may well get its id
+        pipeline.submit(np.ones((8, 8, 3), dtype=np.uint8)).result()
+        assert pipeline.encoded == [0, 1]
+    finally:
+        pipeline.shutdown()
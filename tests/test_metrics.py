@@ -0,0 +1,70 @@
+from iam_bt.bt import Sequence, ConditionNode, SkillNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.coalescing import CoalescingDomain
+from iam_bt.context import RunContext, activate_context
+from iam_bt.executor import TreeSession
+from iam_bt.metrics import MetricsRegistry, enable_metrics, disable_metrics
+
+
+class StateDomain:
+
+    def __init__(self):
+        self.n_state_reads = 0
+
+    @property
+    def state(self):
+        self.n_state_reads += 1
+        return {'ready': True}
+
+
+class ReadyConditionNode(ConditionNode):
+
+    def _eval(self, state):
+        return state['ready']
+
+
+def test_cache_hits_are_not_counted_as_domain_calls():
+    metrics = enable_metrics(MetricsRegistry())
+    try:
+        inner = StateDomain()
+        domain = CoalescingDomain(inner)
+        session = TreeSession(Sequence([ReadyConditionNode() for _ in range(4)]), domain, context=RunContext())
+        assert session.domain is domain
+        session.tick()
+    finally:
+        disable_metrics()
+
+    assert domain.stats()['misses'] == 1 and domain.stats()['hits'] == 3
+    assert inner.n_state_reads == 1
+    assert dict(metrics.domain_calls.samples()) == {('state',): 1}
+
+
+class InstantSkillDomain:
+
+    def run_skill(self, skill_name, param):
+        return 0
+
+    def get_skill_status(self, skill_id):
+        return 'success'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+
+def test_skills_in_flight_is_balanced_when_metrics_are_enabled_after_dispatch():
+    skill = SkillNode('grasp', {})
+    context = RunContext()
+    domain = InstantSkillDomain()
+    with activate_context(context):
+        skill.begin_handoff(domain, dispatch=True)
+
+    metrics = enable_metrics(MetricsRegistry())
+    try:
+        session = TreeSession(skill, domain, context=context)
+        while session.tick() is not None:
+            pass
+    finally:
+        disable_metrics()
+
+    assert session.status == BTStatus.SUCCESS
+    assert metrics.skills_in_flight.samples() == [((), 0)]
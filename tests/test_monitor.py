@@ -0,0 +1,41 @@
+from iam_bt.bt import Parallel, SkillNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+from iam_bt.monitor import TreeMonitor
+
+
+class FakeDomain:
+
+    def __init__(self):
+        self._polls = []
+
+    def run_skill(self, skill_name, param):
+        self._polls.append(0)
+        return len(self._polls) - 1
+
+    def get_skill_status(self, skill_id):
+        self._polls[skill_id] += 1
+        return 'success' if self._polls[skill_id] >= 2 else 'running'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+
+def test_monitor_publishes_leaves_of_nested_parallels():
+    inner = [Parallel([SkillNode('grasp', {}), SkillNode('release', {})], 2) for _ in range(2)]
+    tree = Parallel(inner, 2)
+    monitor = TreeMonitor(tree, port=0)
+    try:
+        session = TreeSession(tree, FakeDomain(), context=RunContext())
+        session.add_observer(monitor)
+        session.tick()
+        skills = [skill for parallel in inner for skill in parallel.children]
+        assert {skill.id: monitor._statuses[skill.id] for skill in skills} == {skill.id: BTStatus.RUNNING.value for skill in skills}
+
+        while session.tick() is not None:
+            pass
+        assert all(monitor._statuses[skill.id] == BTStatus.SUCCESS.value for skill in skills)
+        assert monitor._statuses[tree.id] == BTStatus.SUCCESS.value
+    finally:
+        monitor.close()
@@ -0,0 +1,128 @@
+import random
+
+from iam_bt.bt import Sequence, FallBack, Parallel, NegationDecorator, ConstantConditionNode, SkillNode, Retry, Timeout
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+from iam_bt.optimizer import optimize_tree, count_nodes
+from iam_bt.predicates import PredicateConditionNode, field
+
+
+class OutcomeDomain:
+    '''
+    Skills named `ok_*` succeed and the others fail, each after one poll reporting running.
+    '''
+
+    def __init__(self):
+        self.state = {'ready': [True]}
+        self.skills = []
+        self._polls = []
+
+    def run_skill(self, skill_name, param):
+        self.skills.append(skill_name)
+        self._polls.append(0)
+        return len(self.skills) - 1
+
+    def get_skill_status(self, skill_id):
+        self._polls[skill_id] += 1
+        if self._polls[skill_id] < 2:
+            return 'running'
+        return 'success' if self.skills[skill_id].startswith('ok_') else 'failure'
+
+    def cancel_skill(self, skill_id):
+        pass
+
+
+def _random_spec(rng, composites, depth=0):
+    kind = rng.choice(['constant', 'skill'] + (composites if depth < 4 else []))
+    if kind == 'constant':
+        return ('constant', rng.random() < 0.5)
+    if kind == 'skill':
+        return ('skill', f'{rng.choice(["ok", "bad"])}_{rng.randrange(3)}')
+    if kind == 'not':
+        return ('not', _random_spec(rng, composites, depth + 1))
+    return (kind, [_random_spec(rng, composites, depth + 1) for _ in range(rng.randint(1, 3))])
+
+
+def _build(spec):
+    kind, arg = spec
+    if kind == 'constant':
+        return ConstantConditionNode(arg)
+    if kind == 'skill':
+        return SkillNode(arg, {})
+    if kind == 'not':
+        return NegationDecorator(_build(arg))
+    children = [_build(child) for child in arg]
+    if kind == 'sequence':
+        return Sequence(children)
+    if kind == 'fallback':
+        return FallBack(children)
+    # Skills all take the same number of ticks, so one branch finishing never halts another part way through
+    return Parallel(children, len(children))
+
+
+def _run(tree):
+    domain = OutcomeDomain()
+    session = TreeSession(tree, domain, context=RunContext())
+    while session.tick() is not None:
+        pass
+    return session.status, domain.skills
+
+
+def test_optimized_trees_run_the_same_skills():
+    rng = random.Random(0)
+    n_smaller = 0
+    for _ in range(200):
+        spec = _random_spec(rng, ['not', 'sequence', 'fallback'])
+        optimized, report = optimize_tree(_build(spec))
+        assert _run(optimized) == _run(_build(spec)), spec
+        n_smaller += report.nodes_after < report.nodes_before
+    assert n_smaller > 0
+
+
+def test_optimized_trees_with_parallels_end_the_same():
+    # Branches can finish a tick earlier once optimized, so a Parallel may halt its other branches sooner
+    # and start fewer skills, but it reaches the same outcome
+    rng = random.Random(1)
+    for _ in range(200):
+        spec = _random_spec(rng, ['not', 'sequence', 'fallback', 'parallel'])
+        optimized, _ = optimize_tree(_build(spec))
+        assert _run(optimized)[0] == _run(_build(spec))[0], spec
+
+
+def test_rewrites():
+    tree = Sequence([Sequence([SkillNode('ok_reach', {}), SkillNode('ok_grasp', {})]),
+                     FallBack([NegationDecorator(ConstantConditionNode(True)), SkillNode('ok_lift', {})])])
+    optimized, report = optimize_tree(tree)
+    assert report.rewrites == {'flatten': 1, 'constant_fold': 2, 'single_child': 1}
+    assert [child.dot_label for child in optimized.children] == ['ok_reach', 'ok_grasp', 'ok_lift']
+    assert _run(optimized) == (BTStatus.SUCCESS, ['ok_reach', 'ok_grasp', 'ok_lift'])
+
+
+def test_rewrites_keep_stateful_nodes_apart():
+    tree = Sequence([
+        Sequence([ConstantConditionNode(True), NegationDecorator(NegationDecorator(SkillNode('ok_reach', {})))]),
+        Retry(SkillNode('ok_grasp', {}), 2),
+        Retry(SkillNode('ok_grasp', {}), 2),
+        FallBack([SkillNode('ok_lift', {})]),
+    ])
+    optimized, report = optimize_tree(tree)
+    assert report.rewrites == {'constant_fold': 1, 'double_negation': 1, 'single_child': 2}
+    assert [type(child) for child in optimized.children] == [SkillNode, Retry, Retry, SkillNode]
+    # Skills keep state between runs, so equal ones are not shared
+    assert optimized.children[1] is not optimized.children[2]
+    assert count_nodes(optimized) == 7
+    assert _run(optimized) == (BTStatus.SUCCESS, ['ok_reach', 'ok_grasp', 'ok_grasp', 'ok_lift'])
+
+
+def test_identical_subtrees_are_shared():
+    tree = Sequence([
+        Timeout(PredicateConditionNode(field('ready', 0) == True), 1.),
+        SkillNode('ok_grasp', {}),
+        Timeout(PredicateConditionNode(field('ready', 0) == True), 1.),
+    ])
+    optimized, report = optimize_tree(tree)
+    assert report.rewrites == {'dedupe': 2}
+    assert optimized.children[0] is optimized.children[2]
+    assert report.nodes_before == 6 and report.nodes_after == 4
+    assert _run(optimized) == (BTStatus.SUCCESS, ['ok_grasp'])
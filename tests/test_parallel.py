@@ -0,0 +1,78 @@
+import pytest
+
+from iam_bt.bt import Parallel, SkillNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+
+
+class ScriptedDomain:
+    '''
+    Every skill reports the statuses of the next script in turn, then keeps reporting the last one.
+    '''
+
+    def __init__(self, *scripts):
+        self._scripts = list(scripts)
+        self.skills = []
+        self.polls = []
+        self.cancelled = []
+
+    def run_skill(self, skill_name, param):
+        self.skills.append(list(self._scripts.pop(0)))
+        self.polls.append(0)
+        return len(self.skills) - 1
+
+    def get_skill_status(self, skill_id):
+        self.polls[skill_id] += 1
+        script = self.skills[skill_id]
+        return script.pop(0) if len(script) > 1 else script[0]
+
+    def cancel_skill(self, skill_id):
+        self.cancelled.append(skill_id)
+
+
+def _run(tree, domain):
+    session = TreeSession(tree, domain, context=RunContext())
+    while session.tick() is not None:
+        pass
+    return session.status
+
+
+def _skills(n):
+    return [SkillNode(f'skill_{idx}', {}) for idx in range(n)]
+
+
+def test_succeeds_at_the_success_threshold_and_halts_the_rest():
+    domain = ScriptedDomain(['success'], ['running', 'success'], ['running'])
+    assert _run(Parallel(_skills(3), 2), domain) == BTStatus.SUCCESS
+    assert domain.cancelled == [2]
+    # A child that finished is not ticked again
+    assert domain.polls[:2] == [1, 2]
+
+
+def test_fails_as_soon_as_the_success_threshold_is_out_of_reach():
+    domain = ScriptedDomain(['running'], ['failure'], ['running'])
+    assert _run(Parallel(_skills(3), 3), domain) == BTStatus.FAILURE
+    # Decided within the first round, so the last skill is never sent
+    assert len(domain.skills) == 2
+    assert domain.cancelled == [0]
+
+
+def test_explicit_failure_threshold():
+    domain = ScriptedDomain(['failure'], ['running', 'success'], ['running', 'running', 'failure'])
+    assert _run(Parallel(_skills(3), 1, 2), domain) == BTStatus.SUCCESS
+    assert domain.cancelled == [2]
+
+    domain = ScriptedDomain(['failure'], ['running', 'running', 'success'], ['running', 'failure'])
+    assert _run(Parallel(_skills(3), 2, 2), domain) == BTStatus.FAILURE
+    assert domain.cancelled == [1]
+
+
+def test_thresholds_are_checked():
+    with pytest.raises(AssertionError):
+        Parallel(_skills(2), 3)
+    with pytest.raises(AssertionError):
+        Parallel(_skills(2), 0)
+    with pytest.raises(AssertionError):
+        # Both children could finish without either threshold being reached
+        Parallel(_skills(2), 2, 2)
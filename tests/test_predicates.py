@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from iam_bt.predicates import Compare, Predicate, PredicateConditionNode, field, stack_states
+
+
+def _states():
+    return [
+        {'frame:box:pose/position': [0., 0., 0.05], 'frame:cabinet:open': [True]},
+        {'frame:box:pose/position': [0., 0., 0.20], 'frame:cabinet:open': [True]},
+        {'frame:box:pose/position': [0., 0., 0.05], 'frame:cabinet:open': [False]},
+    ]
+
+
+def test_batch_matches_single_state_evaluation():
+    predicate = (field('frame:box:pose/position', 2) < 0.1) & ~(field('frame:cabinet:open', 0) == False)
+    states = _states()
+    batch = stack_states(states, predicate.keys())
+
+    result = predicate.evaluate_batch(batch)
+    assert result.shape == (3,)
+    assert result.tolist() == [predicate.evaluate(state) for state in states] == [True, False, False]
+
+
+def test_batch_without_index_returns_one_entry_per_state():
+    predicate = field('frame:box:pose/position') == [0., 0., 0.05]
+    states = _states()
+    batch = stack_states(states, predicate.keys())
+
+    result = predicate.evaluate_batch(batch)
+    assert result.shape == (3,)
+    assert result.tolist() == [predicate.evaluate(state) for state in states] == [True, False, True]
+    assert (field('frame:box:pose/position') < 0.1).evaluate_batch(batch).tolist() == [True, False, True]
+
+
+def test_specs_round_trip_and_combinations_flatten():
+    predicate = (field('a', 0) < 1) & (field('b') >= 2) & ~(field('c', 1) != 3)
+    assert Predicate.from_spec(predicate.to_spec()) == predicate
+    assert len(predicate.to_spec()['all']) == 3
+    assert ~~predicate == predicate
+    assert predicate.keys() == {'a', 'b', 'c'}
+
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError):
+        Compare('a', None, '=~', 1)
+    with pytest.raises(ValueError):
+        Predicate.from_spec({'key': 'a', 'op': '<'})
+
+
+def test_condition_node_evaluates_batches():
+    node = PredicateConditionNode({'any': [{'key': 'x', 'index': 0, 'op': '>', 'value': 1.},
+                                           {'not': {'key': 'y', 'index': None, 'op': '==', 'value': 0}}]})
+    batch = {'x': np.array([[0.], [2.], [0.]]), 'y': np.array([0, 0, 1])}
+    assert node.eval_batch(batch).tolist() == [False, True, True]
+    assert node._eval({'x': [2.], 'y': 0})
@@ -0,0 +1,75 @@
+import time
+import threading
+
+from iam_bt.bt import PrefetchingGetImageNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+
+
+class ImageDomain:
+
+    def __init__(self):
+        self.n_fetches = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_rgb_image(self):
+        self.release.wait(10)
+        self.n_fetches += 1
+        return True, f'image-{self.n_fetches}.png', self.n_fetches
+
+
+def _run(node, domain, context):
+    session = TreeSession(node, domain, context=context)
+    while session.tick() is not None:
+        if session.status != BTStatus.RUNNING:
+            return session
+        time.sleep(0.001)
+    return session
+
+
+def test_slow_consumer_gets_the_prefetched_image():
+    node = PrefetchingGetImageNode()
+    domain = ImageDomain()
+    context = RunContext()
+
+    _run(node, domain, context)
+    assert context.blackboard['image'] == 1
+
+    # The next round starts long after the prefetch, e.g. while a human labels the image
+    started, future = context.node_state(node)['prefetch']
+    future.result()
+    context.node_state(node)['prefetch'] = (started - 600., future)
+    session = _run(node, domain, context)
+    assert session.tick_count == 1
+    assert context.blackboard['image'] == 2
+
+
+def test_prefetch_older_than_max_age_is_fetched_again():
+    node = PrefetchingGetImageNode(max_age=10.)
+    domain = ImageDomain()
+    context = RunContext()
+
+    _run(node, domain, context)
+    assert context.blackboard['image'] == 1
+
+    # Requested long before the next round
+    started, future = context.node_state(node)['prefetch']
+    future.result()
+    context.node_state(node)['prefetch'] = (started - 60., future)
+    _run(node, domain, context)
+    assert context.blackboard['image'] == 3
+
+
+def test_fetch_in_flight_when_halted_is_dropped():
+    node = PrefetchingGetImageNode()
+    domain = ImageDomain()
+    domain.release.clear()
+    context = RunContext()
+
+    session = TreeSession(node, domain, context=context)
+    assert session.tick()[2] == BTStatus.RUNNING
+    session.halt()
+    assert 'prefetch' not in context.node_state(node)
+    domain.release.set()
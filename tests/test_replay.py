@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from iam_bt.replay import RecordingDomain, ReplayDomain, ReplayMismatchError, UnpicklableError, read_recording
+
+
+class FakeDomain:
+
+    def __init__(self):
+        self.state = {'ready': True}
+
+    def run_skill(self, skill_name, param):
+        return 7
+
+    def get_skill_status(self, skill_id):
+        return 'success'
+
+    def get_lock(self):
+        return threading.Lock()
+
+    def fail(self):
+        raise ConnectionError(threading.Lock())
+
+
+def _record(path):
+    domain = RecordingDomain(FakeDomain(), path)
+    domain.state
+    domain.run_skill('grasp', '{}')
+    domain.get_skill_status(7)
+    domain.close()
+
+
+def test_replay_matches_recorded_kinds(tmp_path):
+    path = tmp_path / 'run.rec'
+    _record(path)
+
+    replay = ReplayDomain(path, check_args=True)
+    assert replay.state == {'ready': True}
+    assert replay.run_skill('grasp', '{}') == 7
+    assert replay.get_skill_status(7) == 'success'
+    assert replay.n_remaining == 0
+
+
+def test_replay_raises_when_the_tree_reads_instead_of_calls(tmp_path):
+    path = tmp_path / 'run.rec'
+    _record(path)
+
+    replay = ReplayDomain(path)
+    # The recording starts with a read of `state`, but the tree calls run_skill first
+    with pytest.raises(ReplayMismatchError):
+        replay.run_skill('grasp', '{}')
+
+    replay = ReplayDomain(path)
+    replay.state
+    with pytest.raises(ReplayMismatchError):
+        replay.state
+    with pytest.raises(ReplayMismatchError):
+        replay.get_memory_objects
+
+
+def test_unpicklable_values_are_recorded_as_placeholders(tmp_path):
+    path = tmp_path / 'run.rec'
+    domain = RecordingDomain(FakeDomain(), path)
+    domain.get_lock()
+    with pytest.raises(ConnectionError):
+        domain.fail()
+    domain.get_skill_status(7)
+    domain.close()
+
+    assert [record.method for record in read_recording(path)] == ['get_lock', 'fail', 'get_skill_status']
+    replay = ReplayDomain(path)
+    with pytest.raises(ReplayMismatchError):
+        replay.get_lock()
+    with pytest.raises(UnpicklableError):
+        replay.fail()
+    assert replay.get_skill_status(7) == 'success'
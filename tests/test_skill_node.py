@@ -0,0 +1,45 @@
+import pytest
+
+from iam_bt.bt import Parallel, SkillNode, CancelSkillNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+
+
+class SkillDomain:
+
+    def __init__(self):
+        self.statuses = []
+
+    def run_skill(self, skill_name, param):
+        self.statuses.append('running')
+        return len(self.statuses) - 1
+
+    def get_skill_status(self, skill_id):
+        return self.statuses[skill_id]
+
+    def cancel_skill(self, skill_id):
+        if self.statuses[skill_id] == 'running':
+            self.statuses[skill_id] = 'cancelled'
+
+
+def _run(tree, domain):
+    session = TreeSession(tree, domain, context=RunContext())
+    while session.tick() is not None:
+        pass
+    return session.status
+
+
+def test_skill_polled_after_cancel_fails():
+    # The sibling cancels the skill, which is then polled again on the next tick
+    domain = SkillDomain()
+    assert _run(Parallel([SkillNode('grasp', {}), CancelSkillNode()], 2, 1), domain) == BTStatus.FAILURE
+    assert domain.statuses == ['cancelled']
+
+
+def test_mock_domain_skill_polled_after_cancel_fails():
+    pytest.importorskip('pillar_state')
+    from iam_bt.mock_domain import MockBoxInCabinetDomainClient
+
+    domain = MockBoxInCabinetDomainClient()
+    assert _run(Parallel([SkillNode('reset', {}), CancelSkillNode()], 2, 1), domain) == BTStatus.FAILURE
@@ -0,0 +1,49 @@
+import json
+
+from iam_bt import bt
+from iam_bt.bt import Sequence, SkillNode
+from iam_bt.optimizer import optimize_tree
+from iam_bt.tree_loader import load_tree, compile_tree_definition, build_tree
+
+
+def _ids(tree):
+    ids = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        ids.append(node.id)
+        stack.extend(node.children)
+    return ids
+
+
+def test_nodes_built_after_load_tree_get_unique_ids(tmp_path):
+    with bt.node_id_scope(0):
+        before = SkillNode('a', {})
+    path = tmp_path / 'tree.json'
+    path.write_text(json.dumps({'root': {'type': 'Sequence', 'children': [
+        {'type': 'SkillNode', 'args': ['b', {}]},
+        {'type': 'NegationDecorator', 'child': {'type': 'NegationDecorator', 'child': {'type': 'SkillNode', 'args': ['c', {}]}}},
+    ]}}))
+    loaded = load_tree(path, cache_dir=None)
+
+    tree = Sequence([before, loaded, SkillNode('d', {})])
+    ids = _ids(tree)
+    assert len(ids) == len(set(ids))
+
+    # Constant folding creates new nodes
+    optimized, report = optimize_tree(Sequence([tree, bt.NegationDecorator(bt.ConstantConditionNode(False))]))
+    assert report.rewrites.get('constant_fold')
+    ids = _ids(optimized)
+    assert len(ids) == len(set(ids))
+
+def test_node_id_scope_moves_global_ids_past_its_own():
+    program = compile_tree_definition({'root': {'type': 'Sequence', 'children': [{'type': 'SkillNode', 'args': ['a', {}]}]}})
+    first = build_tree(program, first_node_id=10 ** 6)
+    second = build_tree(program, first_node_id=10 ** 6)
+    assert _ids(first) == _ids(second)
+
+    after = SkillNode('b', {})
+    assert after.id > max(_ids(first))
+    with bt.node_id_scope():
+        pass
+    assert SkillNode('c', {}).id > after.id
@@ -0,0 +1,26 @@
+from pydot import Node
+
+from iam_bt.bt import Sequence, ConditionNode, SkillNode
+
+
+class SelfDrawingConditionNode(ConditionNode):
+    # Draws itself the way nodes did before iam_bt.viz existed
+
+    def _eval(self, state):
+        return True
+
+    def get_dot_graph(self):
+        graph = self._create_dot_graph()
+        this_node = Node(self._uuid_str, label='custom', shape='ellipse')
+        graph.add_node(this_node)
+        return this_node, graph
+
+
+def test_nodes_that_draw_themselves_are_merged_in():
+    custom = SelfDrawingConditionNode()
+    tree = Sequence([custom, SkillNode('grasp', {})])
+    root, graph = tree.get_dot_graph()
+
+    names = {node.get_name() for node in graph.get_nodes()}
+    assert custom.uuid_str in names
+    assert (root.get_name(), custom.uuid_str) in {(edge.get_source(), edge.get_destination()) for edge in graph.get_edges()}
@@ -0,0 +1,93 @@
+import threading
+
+from iam_bt.bt import Sequence, SaveImageNode
+from iam_bt.bt_status import BTStatus
+from iam_bt.context import RunContext
+from iam_bt.executor import TreeSession
+from iam_bt.write_behind import WriteBehindQueue
+
+
+def test_writes_run_in_order_and_flush_waits_for_them():
+    queue = WriteBehindQueue(max_pending=8)
+    release = threading.Event()
+    written = []
+
+    def write(value):
+        release.wait()
+        written.append(value)
+        return value
+
+    try:
+        futures = [queue.try_submit(write, value) for value in range(5)]
+        assert queue.n_pending == 5
+        assert not queue.flush(timeout=0.01)
+        release.set()
+        assert queue.flush(timeout=5.)
+        assert written == list(range(5))
+        assert [future.result() for future in futures] == list(range(5))
+        assert queue.n_pending == 0
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_full_queue_refuses_writes():
+    queue = WriteBehindQueue(max_pending=2)
+    release = threading.Event()
+    try:
+        assert queue.try_submit(release.wait) is not None
+        assert queue.try_submit(release.wait) is not None
+        assert queue.try_submit(release.wait) is None
+        assert queue.n_rejected == 1
+        release.set()
+        assert queue.flush(timeout=5.)
+        assert queue.try_submit(release.wait) is not None
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_failed_writes_leave_the_queue():
+    queue = WriteBehindQueue(max_pending=1)
+    try:
+        future = queue.try_submit(lambda: 1 / 0)
+        assert queue.flush(timeout=5.)
+        assert isinstance(future.exception(), ZeroDivisionError)
+        assert queue.n_pending == 0
+    finally:
+        queue.shutdown()
+
+
+class CameraDomain:
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.saved = []
+
+    def save_rgb_camera_image(self, camera_topic_name):
+        self.release.wait()
+        self.saved.append(camera_topic_name)
+        return True, f'{camera_topic_name}.png'
+
+
+def test_nodes_wait_for_their_writes_in_order():
+    queue = WriteBehindQueue(max_pending=1)
+    domain = CameraDomain()
+    tree = Sequence([SaveImageNode(topic, 'rgb', True, False, write_behind=queue) for topic in ('left', 'right')])
+    context = RunContext()
+    session = TreeSession(tree, domain, context=context)
+    try:
+        for _ in range(3):
+            session.tick()
+            assert session.status == BTStatus.RUNNING
+        assert domain.saved == []
+
+        domain.release.set()
+        while session.tick() is not None:
+            pass
+        assert session.status == BTStatus.SUCCESS
+        assert domain.saved == ['left', 'right']
+        assert context.blackboard['image_path'] == 'right.png'
+    finally:
+        domain.release.set()
+        queue.shutdown()